@@ -0,0 +1,124 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+SERVICES_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "services")
+)
+LAYER_DIR = os.path.join(SERVICES_DIR, "layers", "common")
+HANDLER_DIR = os.path.join(SERVICES_DIR, "learning", "getListOfTasks")
+
+TIERS = {"free": 0, "premium": 1}
+
+
+def build_bundles(tasks_dynamodb, language_id, sections, bundles_per_key):
+    """
+    Generate randomized lessons for every section and subscription tier of a
+    language with the same rules getListOfTasks uses.
+
+    :param tasks_dynamodb: LambdaDynamoDBClass for the tasks table.
+    :param language_id: Language to build the bundles for.
+    :param sections: Section numbers to build the bundles for.
+    :param bundles_per_key: Bundles per (section, language, tier).
+    :return: List of bundle items.
+    """
+    import app
+
+    built_at = datetime.now(timezone.utc).isoformat()
+    bundles = []
+
+    for section in sections:
+        for tier, subscription in TIERS.items():
+            bundle_key = app.lesson_bundle_key(section, language_id, subscription)
+
+            for bundle_index in range(bundles_per_key):
+                tasks = app.select_tasks(
+                    tasks_dynamodb, section, language_id, subscription
+                )
+                if not tasks:
+                    print(f"No tasks for {bundle_key}, skipping.")
+                    break
+
+                bundles.append(
+                    {
+                        "bundle_key": bundle_key,
+                        "bundle_index": bundle_index,
+                        "section": section,
+                        "language_id": language_id,
+                        "tier": tier,
+                        "tasks": tasks,
+                        "built_at": built_at,
+                    }
+                )
+
+    return bundles
+
+
+def write_bundles(table, bundles):
+    """
+    Store the bundles, replacing earlier bundles with the same key and index.
+
+    :param table: boto3 Table for the lesson bundles table.
+    :param bundles: List of bundle items.
+    """
+    with table.batch_writer() as batch:
+        for bundle in bundles:
+            batch.put_item(Item=bundle)
+
+    print(f"Stored {len(bundles)} bundles in '{table.name}' table.")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Precompute randomized lessons for getListOfTasks."
+    )
+    parser.add_argument("--tasks-table", required=True, help="Tasks table name")
+    parser.add_argument(
+        "--bundles-table", required=True, help="Lesson bundles table name"
+    )
+    parser.add_argument(
+        "--language",
+        action="append",
+        required=True,
+        help="Language to build bundles for (can be given multiple times)",
+    )
+    parser.add_argument(
+        "--max-section",
+        type=int,
+        required=True,
+        help="Highest section with tasks, same as CURRENT_MAX_SECTION",
+    )
+    parser.add_argument(
+        "--bundles",
+        type=int,
+        default=50,
+        help="Bundles per section, language and tier, same as "
+        "LESSON_BUNDLES_PER_KEY (default: 50)",
+    )
+    parser.add_argument(
+        "--region", default="eu-central-1", help="AWS region (default: eu-central-1)"
+    )
+    args = parser.parse_args()
+
+    # The handler reads its configuration from the environment at import time
+    os.environ["CURRENT_MAX_SECTION"] = str(args.max_section)
+    os.environ.setdefault("AWS_DEFAULT_REGION", args.region)
+    sys.path[:0] = [HANDLER_DIR, LAYER_DIR]
+
+    import boto3
+    from boto import LambdaDynamoDBClass
+
+    dynamodb = boto3.resource("dynamodb", region_name=args.region)
+    tasks_dynamodb = LambdaDynamoDBClass(
+        {"resource": dynamodb, "table_name": args.tasks_table}
+    )
+
+    # The section after the maximum is mixed from the latest sections, lessons
+    # further out are still built from the task pools by the handler
+    sections = range(10, args.max_section + 20, 10)
+
+    for language_id in args.language:
+        bundles = build_bundles(tasks_dynamodb, language_id, sections, args.bundles)
+        write_bundles(dynamodb.Table(args.bundles_table), bundles)
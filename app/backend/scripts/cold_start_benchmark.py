@@ -0,0 +1,173 @@
+import os
+import statistics
+import subprocess
+import sys
+
+SERVICES_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "services")
+)
+LAYER_DIR = os.path.join(SERVICES_DIR, "layers", "common")
+
+# Runs in a fresh interpreter, so every measurement is a real cold import
+IMPORT_SNIPPET = """
+import sys, time
+sys.path[:0] = [{handler_dir!r}, {layer_dir!r}]
+start = time.perf_counter()
+import app
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def find_handlers(services=None):
+    """
+    Find every lambda handler module (services/<service>/<function>/app.py).
+
+    :param services: Optional list of service names to limit the search to.
+    :return: Sorted list of (service, function, handler_dir) tuples.
+    """
+    handlers = []
+
+    for service in sorted(os.listdir(SERVICES_DIR)):
+        service_dir = os.path.join(SERVICES_DIR, service)
+        if service == "layers" or not os.path.isdir(service_dir):
+            continue
+        if services and service not in services:
+            continue
+
+        for function in sorted(os.listdir(service_dir)):
+            handler_dir = os.path.join(service_dir, function)
+            if os.path.isfile(os.path.join(handler_dir, "app.py")):
+                handlers.append((service, function, handler_dir))
+
+    return handlers
+
+
+def measure_import(handler_dir, env, importtime=False):
+    """
+    Import a handler module in a new interpreter.
+
+    :return: Tuple (import time in ms, -X importtime output or None).
+    """
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += [
+        "-c",
+        IMPORT_SNIPPET.format(handler_dir=handler_dir, layer_dir=LAYER_DIR),
+    ]
+
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    return float(result.stdout.strip().splitlines()[-1]), (
+        result.stderr if importtime else None
+    )
+
+
+def heaviest_imports(importtime_output, top):
+    """
+    Return the modules imported by the handler that took the longest to load.
+
+    :param importtime_output: stderr of a `python -X importtime` run.
+    :param top: Number of modules to return.
+    :return: List of (module, cumulative ms) sorted by time.
+    """
+    modules = []
+
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+
+        _, cumulative, name = line.split("|", 2)
+        # Nesting is shown as two spaces per level and children are printed
+        # before their parent. Level 1 lines collected since the previous
+        # level 0 line are the direct imports of that level 0 module, deeper
+        # imports are already part of their parent's cumulative time.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == "app":
+                break
+            modules = []
+        elif depth == 1:
+            modules.append((name.strip(), int(cumulative) / 1000))
+
+    return sorted(modules, key=lambda m: m[1], reverse=True)[:top]
+
+
+def run_benchmark(handlers, runs, top, env):
+    results = []
+
+    for service, function, handler_dir in handlers:
+        name = f"{service}/{function}"
+        try:
+            timings = [measure_import(handler_dir, env)[0] for _ in range(runs)]
+            _, importtime_output = measure_import(handler_dir, env, importtime=True)
+        except RuntimeError as e:
+            print(f"{name:<40} failed to import: {e}")
+            continue
+
+        results.append(
+            {
+                "handler": name,
+                "median_ms": statistics.median(timings),
+                "max_ms": max(timings),
+                "heaviest": heaviest_imports(importtime_output, top),
+            }
+        )
+
+    return results
+
+
+def print_results(results):
+    print(f"{'handler':<40} {'median ms':>10} {'max ms':>10}  heaviest imports")
+
+    for result in sorted(results, key=lambda r: r["median_ms"], reverse=True):
+        heaviest = ", ".join(f"{name} {ms:.1f}" for name, ms in result["heaviest"])
+        print(
+            f"{result['handler']:<40} {result['median_ms']:>10.1f} "
+            f"{result['max_ms']:>10.1f}  {heaviest}"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(
+        description="Measure the cold import time of every lambda handler module."
+    )
+    parser.add_argument(
+        "--service",
+        action="append",
+        help="Only benchmark this service (can be given multiple times)",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="Imports per handler (default: 5)"
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        default=3,
+        help="Heaviest imports to show per handler (default: 3)",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON"
+    )
+    args = parser.parse_args()
+
+    # Handlers read their configuration from the environment at import time
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "eu-central-1")
+
+    handlers = find_handlers(args.service)
+    if not handlers:
+        print("No handlers found.")
+        exit(1)
+
+    results = run_benchmark(handlers, args.runs, args.top, env)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
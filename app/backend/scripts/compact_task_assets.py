@@ -0,0 +1,70 @@
+import os
+import sys
+
+SERVICES_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "services")
+)
+LAYER_DIR = os.path.join(SERVICES_DIR, "layers", "common")
+
+
+def compact_table(table, dry_run=False):
+    """
+    Rewrite the tasks in a table with asset references instead of full URLs.
+    Tasks that are already compact are left alone.
+
+    :param table: boto3 Table for the tasks table.
+    :param dry_run: Only count the tasks that would change.
+    :return: Number of tasks that were (or would be) rewritten.
+    """
+    from task_assets import compact_task
+
+    changed = 0
+    scan_params = {}
+
+    with table.batch_writer() as batch:
+        while True:
+            response = table.scan(**scan_params)
+
+            for task in response.get("Items", []):
+                compacted = compact_task(task)
+                if compacted == task:
+                    continue
+
+                changed += 1
+                if not dry_run:
+                    batch.put_item(Item=compacted)
+
+            if "LastEvaluatedKey" not in response:
+                break
+
+            scan_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    return changed
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Replace asset URLs in stored tasks with asset references."
+    )
+    parser.add_argument("--table", required=True, help="Tasks table name")
+    parser.add_argument(
+        "--region", default="eu-central-1", help="AWS region (default: eu-central-1)"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report how many tasks would be rewritten",
+    )
+    args = parser.parse_args()
+
+    sys.path.insert(0, LAYER_DIR)
+
+    import boto3
+
+    table = boto3.resource("dynamodb", region_name=args.region).Table(args.table)
+    changed = compact_table(table, args.dry_run)
+
+    action = "Would rewrite" if args.dry_run else "Rewrote"
+    print(f"{action} {changed} tasks in '{args.table}' table.")
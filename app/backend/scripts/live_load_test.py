@@ -0,0 +1,416 @@
+import importlib.util
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+SERVICES_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "services")
+)
+LAYER_DIR = os.path.join(SERVICES_DIR, "layers", "common")
+LIVE_DIR = os.path.join(SERVICES_DIR, "live")
+
+# Route keys of the WebSocket API (live/template.yaml) and their handlers
+ROUTES = {
+    "$connect": "onConnectWss",
+    "$disconnect": "onDisconnectWss",
+    "create-room": "createRoomWss",
+    "join-room": "joinRoomWss",
+    "start-sharing": "startSharingWss",
+    "stop-sharing": "stopSharingWss",
+}
+
+REGION = "eu-central-1"
+
+# The handlers read their table names from the environment at import time
+TABLE_NAMES = {
+    "CONNECTIONS_TABLE_NAME": "connections-load-test",
+    "CHAT_ROOM_TABLE_NAME": "chatRooms-load-test",
+    "CONNECTION_ROOMS_TABLE_NAME": "connectionRooms-load-test",
+}
+JWT_SECRET_NAME = "live-load-test"
+
+
+class LocalWebSocketGateway:
+    """
+    In-process stand-in for the API Gateway WebSocket API of the live service.
+
+    Client side, it turns connects, messages and disconnects into the events
+    API Gateway sends to the route handlers. Server side, it is the
+    apigatewaymanagementapi client the handlers post to: messages land in the
+    socket's inbox and posting to a socket that is gone raises GoneException.
+
+    Handlers are invoked one at a time, like in a single Lambda container, so
+    the DynamoDB calls seen during an invocation belong to that handler.
+    """
+
+    def __init__(self, handlers):
+        self.handlers = handlers
+        self.inboxes = {}
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.dynamodb_calls = defaultdict(Counter)
+        self.posts = Counter()
+        self._route = None
+        self._lock = threading.Lock()
+
+        for module in handlers.values():
+            if hasattr(module, "get_websocket_client"):
+                module.get_websocket_client = lambda: self
+
+    def connect(self, token):
+        """
+        Open a socket, returns its connection ID or None if $connect refused it.
+        """
+        connection_id = uuid.uuid4().hex
+        self.inboxes[connection_id] = []
+
+        response = self._invoke(
+            "$connect", connection_id, queryStringParameters={"x-access-token": token}
+        )
+        if response.get("statusCode") != 200:
+            del self.inboxes[connection_id]
+            return None
+
+        return connection_id
+
+    def send(self, connection_id, route, **body):
+        return self._invoke(
+            route, connection_id, body=json.dumps({"action": route, **body})
+        )
+
+    def drop(self, connection_id):
+        """
+        Lose a socket without running $disconnect yet, like a client that went
+        away before API Gateway noticed. Posts to it fail with GoneException.
+        """
+        self.inboxes.pop(connection_id, None)
+
+    def disconnect(self, connection_id):
+        self.inboxes.pop(connection_id, None)
+        return self._invoke("$disconnect", connection_id)
+
+    def messages(self, connection_id, action):
+        return [
+            message
+            for message in self.inboxes.get(connection_id, [])
+            if message.get("action") == action
+        ]
+
+    def post_to_connection(self, ConnectionId, Data):
+        from botocore.exceptions import ClientError
+
+        with self._lock:
+            inbox = self.inboxes.get(ConnectionId)
+            if inbox is None:
+                self.posts["gone"] += 1
+                raise ClientError(
+                    {"Error": {"Code": "GoneException", "Message": "Gone"}},
+                    "PostToConnection",
+                )
+
+            self.posts["delivered"] += 1
+            inbox.append(json.loads(Data))
+
+    def count_dynamodb_call(self, model, **kwargs):
+        self.dynamodb_calls[self._route][model.name] += 1
+
+    def _invoke(self, route, connection_id, **event):
+        event["requestContext"] = {"routeKey": route, "connectionId": connection_id}
+
+        self._route = route
+        start = time.perf_counter()
+        try:
+            response = self.handlers[route].lambda_handler(event, None)
+        except Exception as e:
+            # API Gateway answers with an internal server error
+            print(f"{route} failed for {connection_id}: {e!r}", file=sys.stderr)
+            response = {"statusCode": 500}
+        finally:
+            self.latencies[route].append((time.perf_counter() - start) * 1000)
+            self._route = None
+
+        if response.get("statusCode") != 200:
+            self.errors[route] += 1
+
+        return response
+
+
+def load_handlers():
+    """
+    Import the live handler modules. They all live in app.py, so each is
+    loaded under its own module name.
+
+    :return: Dict {route key: handler module}.
+    """
+    handlers = {}
+
+    for route, function in ROUTES.items():
+        spec = importlib.util.spec_from_file_location(
+            f"live_{function}", os.path.join(LIVE_DIR, function, "app.py")
+        )
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        handlers[route] = module
+
+    return handlers
+
+
+def create_tables(dynamodb):
+    """
+    Create the live service tables with the keys from layers/template.yaml.
+    """
+    dynamodb.create_table(
+        TableName=TABLE_NAMES["CONNECTIONS_TABLE_NAME"],
+        AttributeDefinitions=[
+            {"AttributeName": "email", "AttributeType": "S"},
+            {"AttributeName": "connection_id", "AttributeType": "S"},
+        ],
+        KeySchema=[{"AttributeName": "email", "KeyType": "HASH"}],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": "ConnectionIdIndex",
+                "KeySchema": [{"AttributeName": "connection_id", "KeyType": "HASH"}],
+                "Projection": {"ProjectionType": "ALL"},
+            }
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    dynamodb.create_table(
+        TableName=TABLE_NAMES["CHAT_ROOM_TABLE_NAME"],
+        AttributeDefinitions=[{"AttributeName": "chat_id", "AttributeType": "S"}],
+        KeySchema=[{"AttributeName": "chat_id", "KeyType": "HASH"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    dynamodb.create_table(
+        TableName=TABLE_NAMES["CONNECTION_ROOMS_TABLE_NAME"],
+        AttributeDefinitions=[
+            {"AttributeName": "connection_id", "AttributeType": "S"},
+            {"AttributeName": "chat_id", "AttributeType": "S"},
+        ],
+        KeySchema=[
+            {"AttributeName": "connection_id", "KeyType": "HASH"},
+            {"AttributeName": "chat_id", "KeyType": "RANGE"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
+def run_scenario(gateway, sockets, room_size, shares, drop_ratio, rng):
+    """
+    Connect the sockets, fill rooms of room_size, toggle sharing, drop a share
+    of the sockets without disconnecting them, toggle sharing again so the
+    broadcasts run into the gone sockets, then disconnect everyone.
+    """
+    from auth import generate_jwt_token
+
+    connection_ids = []
+    for index in range(sockets):
+        connection_id = gateway.connect(
+            generate_jwt_token(f"load-test-{index}@example.com")
+        )
+        if connection_id:
+            connection_ids.append(connection_id)
+
+    rooms = {}
+    for start in range(0, len(connection_ids), room_size):
+        owner, *members = connection_ids[start : start + room_size]
+        gateway.send(owner, "create-room", peerId=f"peer-{owner}")
+
+        created = gateway.messages(owner, "room-created")
+        if not created:
+            continue
+
+        room_id = created[-1]["roomId"]
+        rooms[room_id] = [owner]
+        for connection_id in members:
+            gateway.send(
+                connection_id, "join-room", roomId=room_id, peerId=f"peer-{connection_id}"
+            )
+            rooms[room_id].append(connection_id)
+
+    def toggle_sharing(members):
+        toggles = [
+            (room_id, connection_id)
+            for room_id, connection_ids in members.items()
+            for connection_id in connection_ids
+            for _ in range(shares)
+        ]
+        rng.shuffle(toggles)
+
+        for room_id, connection_id in toggles:
+            gateway.send(connection_id, "start-sharing", roomId=room_id)
+            gateway.send(connection_id, "stop-sharing", roomId=room_id)
+
+    toggle_sharing(rooms)
+
+    dropped = set(rng.sample(connection_ids, int(len(connection_ids) * drop_ratio)))
+    for connection_id in dropped:
+        gateway.drop(connection_id)
+
+    toggle_sharing(
+        {
+            room_id: [c for c in connection_ids if c not in dropped]
+            for room_id, connection_ids in rooms.items()
+        }
+    )
+
+    # Disconnect storm, the dropped sockets finally get their $disconnect too
+    rng.shuffle(connection_ids)
+    for connection_id in connection_ids:
+        gateway.disconnect(connection_id)
+
+    return {"sockets": len(connection_ids), "rooms": len(rooms), "dropped": len(dropped)}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(gateway):
+    results = []
+
+    for route, latencies in gateway.latencies.items():
+        calls = gateway.dynamodb_calls[route]
+        results.append(
+            {
+                "route": route,
+                "invocations": len(latencies),
+                "errors": gateway.errors[route],
+                "p50_ms": percentile(latencies, 0.50),
+                "p95_ms": percentile(latencies, 0.95),
+                "p99_ms": percentile(latencies, 0.99),
+                "max_ms": max(latencies),
+                "dynamodb_calls": sum(calls.values()),
+                "dynamodb_calls_per_invocation": sum(calls.values()) / len(latencies),
+                "dynamodb_operations": dict(calls),
+            }
+        )
+
+    return results
+
+
+def print_results(scenario, results, posts, elapsed):
+    print(
+        f"{scenario['sockets']} sockets in {scenario['rooms']} rooms, "
+        f"{scenario['dropped']} dropped, {elapsed:.1f}s"
+    )
+    print(
+        f"posts: {posts['delivered']} delivered, {posts['gone']} to gone connections"
+    )
+    print()
+    print(
+        f"{'route':<15} {'calls':>7} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'max ms':>8} {'ddb/call':>8}  dynamodb operations"
+    )
+
+    for result in results:
+        operations = ", ".join(
+            f"{name} {count}"
+            for name, count in sorted(result["dynamodb_operations"].items())
+        )
+        print(
+            f"{result['route']:<15} {result['invocations']:>7} {result['errors']:>6} "
+            f"{result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+            f"{result['p99_ms']:>8.2f} {result['max_ms']:>8.2f} "
+            f"{result['dynamodb_calls_per_invocation']:>8.2f}  {operations}"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Drive the live WebSocket handlers through a local gateway "
+        "stand-in against in-memory DynamoDB (moto) and report per-route "
+        "latency and DynamoDB calls."
+    )
+    parser.add_argument(
+        "--sockets", type=int, default=2000, help="Sockets to connect (default: 2000)"
+    )
+    parser.add_argument(
+        "--room-size", type=int, default=8, help="Sockets per room (default: 8)"
+    )
+    parser.add_argument(
+        "--shares",
+        type=int,
+        default=1,
+        help="Start/stop sharing toggles per socket and round (default: 1)",
+    )
+    parser.add_argument(
+        "--drop-ratio",
+        type=float,
+        default=0.1,
+        help="Share of sockets that go away before their $disconnect (default: 0.1)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument(
+        "--json", action="store_true", help="Print the results as JSON"
+    )
+    args = parser.parse_args()
+
+    os.environ.update(TABLE_NAMES)
+    os.environ.update(
+        {
+            "JWT_SECRET_NAME": JWT_SECRET_NAME,
+            "SECRETS_REGION_NAME": REGION,
+            "AWS_DEFAULT_REGION": REGION,
+            "AWS_ACCESS_KEY_ID": "testing",
+            "AWS_SECRET_ACCESS_KEY": "testing",
+        }
+    )
+    # Handler logs would dominate the measured latency
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, LAYER_DIR)
+
+    from moto import mock_aws
+
+    with mock_aws():
+        import boto3
+        from boto import get_resource
+
+        boto3.client("secretsmanager", region_name=REGION).create_secret(
+            Name=JWT_SECRET_NAME,
+            SecretString=json.dumps(
+                {"jwt_secret": uuid.uuid4().hex, "refresh_secret": uuid.uuid4().hex}
+            ),
+        )
+        create_tables(boto3.resource("dynamodb", region_name=REGION))
+
+        gateway = LocalWebSocketGateway(load_handlers())
+        get_resource("dynamodb").meta.client.meta.events.register(
+            "before-call.dynamodb", gateway.count_dynamodb_call
+        )
+
+        started = time.perf_counter()
+        scenario = run_scenario(
+            gateway,
+            args.sockets,
+            args.room_size,
+            args.shares,
+            args.drop_ratio,
+            random.Random(args.seed),
+        )
+        elapsed = time.perf_counter() - started
+
+    results = summarize(gateway)
+
+    if args.json:
+        print(
+            json.dumps(
+                {
+                    "scenario": scenario,
+                    "posts": dict(gateway.posts),
+                    "elapsed_s": elapsed,
+                    "routes": results,
+                },
+                indent=2,
+            )
+        )
+    else:
+        print_results(scenario, results, gateway.posts, elapsed)
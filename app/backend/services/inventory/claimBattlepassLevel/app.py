@@ -1,22 +1,28 @@
-import logging
+from log import get_logger, log_event
+
+from botocore.exceptions import ClientError
+from os import environ
 
 from validation_schema import schema
 from dataclasses import dataclass
-from aws_lambda_powertools.utilities.validation import SchemaValidationError, validate
-from common import build_response, convert_decimal_to_float
+from validation import SchemaValidationError, validate
+from common import build_response
 from boto import (
     LambdaDynamoDBClass,
     _LAMBDA_USERS_TABLE_RESOURCE,
     _LAMBDA_BATTLEPASS_TABLE_RESOURCE,
 )
 from middleware import middleware
-from auth import get_email_from_jwt_token
-from boto3.dynamodb.conditions import Attr
-from datetime import datetime, timezone
+from auth import get_email_from_event
+from battlepass import get_active_battlepass_season
+from user_version import user_version_guard
 from decimal import Decimal
 
-logger = logging.getLogger("ClaimBattlepassLevel")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("ClaimBattlepassLevel")
+
+# How many times the user is re-read and the claim retried after losing a
+# race with another request updating the same user
+CLAIM_MAX_ATTEMPTS = int(environ.get("CLAIM_MAX_ATTEMPTS", 3))
 
 
 @dataclass
@@ -26,25 +32,24 @@ class Request:
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    log_event(logger, event)
 
-    # Extract and validate JWT token to get user email
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     if not email:
-        logger.error(f"Invalid email in jwt token {email}")
+        logger.error("Invalid email in jwt token %s", email)
         return build_response(400, {"message": "Invalid email in jwt token"})
 
     # Validate query parameters against schema
     query_params = event.get("queryStringParameters", {})
     try:
-        logger.debug(f"Validating query params: {query_params}")
+        logger.debug("Validating query params: %s", query_params)
 
         validate(event=query_params, schema=schema)
     except SchemaValidationError as e:
-        logger.error(f"Validation failed: {e}")
-        return build_response(400, {"message": str(e)})
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
 
     # Initialize DynamoDB clients for users and battlepass tables
     global _LAMBDA_USERS_TABLE_RESOURCE, _LAMBDA_BATTLEPASS_TABLE_RESOURCE
@@ -54,9 +59,27 @@ def lambda_handler(event, context):
     # Convert the requested level to Decimal for DynamoDB compatibility
     claim_level = Decimal(query_params.get("battlepass_level"))
 
-    # Process the claim request
-    return claim_battlepass_level(
-        user_dynamodb, battlepass_dynamodb, email, claim_level
+    # The claim is written with a version check, if another request updated
+    # the user in the meantime it is read again and the claim checked again
+    for attempt in range(1, CLAIM_MAX_ATTEMPTS + 1):
+        try:
+            return claim_battlepass_level(
+                user_dynamodb, battlepass_dynamodb, email, claim_level
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+            logger.warning(
+                "User %s was updated concurrently, attempt %s of %s",
+                email,
+                attempt,
+                CLAIM_MAX_ATTEMPTS,
+            )
+
+    logger.error("Giving up on claiming battlepass level for user %s", email)
+    return build_response(
+        409, {"message": "User was updated concurrently, please try again"}
     )
 
 
@@ -72,45 +95,39 @@ def claim_battlepass_level(user_dynamodb, battlepass_dynamodb, email, claim_leve
 
     Returns:
         dict: HTTP response with result of the claim operation
+
+    Raises:
+        ClientError: ConditionalCheckFailedException if the user was updated
+                     after it was read
     """
-    logger.debug(f"Claiming battlepass level {claim_level} for user {email}")
+    logger.debug("Claiming battlepass level %s for user %s", claim_level, email)
 
     # Fetch user data
     user = get_user_by_email(user_dynamodb, email)
     if not user:
-        logger.error(f"User not found: {email}")
+        logger.error("User not found: %s", email)
         return build_response(404, {"message": "User not found"})
 
     # Fetch active battlepass season
-    active_battlepass = get_active_battlepass_seasons(battlepass_dynamodb)
+    active_battlepass = get_active_battlepass_season(battlepass_dynamodb)
     if not active_battlepass:
-        logger.debug(f"No active battlepasses found.")
+        logger.debug("No active battlepasses found.")
         return build_response(404, {"message": "No active battlepasses found."})
 
     # Find the specific battlepass level requested by the user
-    battlepass_levels = active_battlepass.get("levels", [])
-    battlepass_level = next(
-        (level for level in battlepass_levels if level.get("level") == claim_level),
-        None,
-    )
+    battlepass_level = active_battlepass.get_level(claim_level)
     if not battlepass_level:
-        logger.error(f"Battlepass level not found: {claim_level}")
+        logger.error("Battlepass level not found: %s", claim_level)
         return build_response(404, {"message": "Battlepass level not found"})
 
     # Get the battlepass season ID for the active battlepass
-    battlepass_season_id = active_battlepass.get("season", None)
+    battlepass_season_id = active_battlepass.season_id
     if not battlepass_season_id:
-        logger.error(f"Battlepass season ID not found: {battlepass_season_id}")
+        logger.error("Battlepass season ID not found: %s", battlepass_season_id)
         return build_response(404, {"message": "Battlepass season ID not found"})
 
     # Calculate required XP required to claim the requested level
-    required_xp = 0
-    for level in battlepass_levels:
-        level_number = level.get("level")
-        if level_number <= claim_level:
-            required_xp += level.get("required_xp", 0)
-        else:
-            break
+    required_xp = active_battlepass.required_xp(claim_level)
 
     # Get or create user battlepass data for current season
     user_battlepasses = user.get("battlepass", [])
@@ -119,36 +136,26 @@ def claim_battlepass_level(user_dynamodb, battlepass_dynamodb, email, claim_leve
         None,
     )
 
-    # If user doesn't have data for current battlepass season, create it
+    # If user doesn't have data for current battlepass season, create it, it
+    # is saved together with the claim
     if not user_battlepass:
         logger.info(
-            f"User battlepass not found for season ID: {battlepass_season_id}."
-            f" Adding new battlepass season to user."
+            "User battlepass not found for season ID: %s. Adding new battlepass season to user.",
+            battlepass_season_id,
         )
 
         # Create new battlepass profile for the user
-        new_battlepass = {
+        user_battlepass = {
             "season_id": battlepass_season_id,
             "xp": 0,
             "claimed_levels": [],
         }
-
-        user_battlepasses.append(new_battlepass)
-
-        # Update user battlepass data in DynamoDB
-        user_dynamodb.table.update_item(
-            Key={"email": email},
-            UpdateExpression="SET battlepass = :battlepass",
-            ExpressionAttributeValues={":battlepass": user_battlepasses},
-        )
-
-        user_battlepass = new_battlepass
-        logger.info(f"New battlepass season added to user: {user_battlepass}")
+        user_battlepasses.append(user_battlepass)
 
     # Check if user has enough XP to claim the requested level
     user_xp = user_battlepass.get("xp", 0)
     if user_xp < required_xp:
-        logger.error(f"User does not have enough XP to claim level {claim_level}")
+        logger.error("User does not have enough XP to claim level %s", claim_level)
         return build_response(400, {"message": "Not enough XP to claim this level"})
 
     # Get users claimed, unlocked, and locked levels
@@ -156,17 +163,15 @@ def claim_battlepass_level(user_dynamodb, battlepass_dynamodb, email, claim_leve
 
     # Verify that the requested level has not already been claimed
     if claim_level in claimed_levels:
-        logger.error(f"Battlepass level {claim_level} has already been claimed.")
+        logger.error("Battlepass level %s has already been claimed.", claim_level)
         return build_response(
             400,
             {"message": f"Battlepass level {claim_level} has already been claimed."},
         )
 
     # Process rewards from the claimed level and update user data
-    user_coins = user.get("coins", 0)
     level_coins = battlepass_level.get("coins", 0)
 
-    user_coins += level_coins
     claimed_levels.append(int(claim_level))
     user_battlepass["claimed_levels"] = claimed_levels
 
@@ -177,18 +182,29 @@ def claim_battlepass_level(user_dynamodb, battlepass_dynamodb, email, claim_leve
             user_battlepasses[idx] = user_battlepass
             break
 
-    # Save updated user data to DynamoDB
+    # Save the claim only if the user is unchanged since it was read, so a
+    # level can't be claimed twice. The coins are added to the stored balance.
+    expression_attribute_values = {
+        ":level_coins": level_coins,
+        ":battlepass": user_battlepasses,
+    }
+    version_update, condition_expression = user_version_guard(
+        user.get("version"), expression_attribute_values
+    )
     user_dynamodb.table.update_item(
         Key={"email": email},
-        UpdateExpression="SET coins = :coins, battlepass = :battlepass",
-        ExpressionAttributeValues={
-            ":coins": user_coins,
-            ":battlepass": user_battlepasses,
-        },
+        UpdateExpression=(
+            f"SET battlepass = :battlepass, {version_update} ADD coins :level_coins"
+        ),
+        ConditionExpression=condition_expression,
+        ExpressionAttributeValues=expression_attribute_values,
     )
 
     logger.info(
-        f"User {email} claimed battlepass level {claim_level} and received {level_coins} coins"
+        "User %s claimed battlepass level %s and received %s coins",
+        email,
+        claim_level,
+        level_coins,
     )
     return build_response(
         200,
@@ -209,38 +225,8 @@ def get_user_by_email(dynamodb, email):
     Returns:
         dict: User data or None if user not found
     """
-    logger.info(f"Getting user by email: {email}")
-    user = dynamodb.table.get_item(Key={"email": email})
+    logger.info("Getting user by email: %s", email)
+    # Read consistently, a retry has to see the version that made it fail
+    user = dynamodb.table.get_item(Key={"email": email}, ConsistentRead=True)
 
     return user.get("Item")
-
-
-def get_active_battlepass_seasons(dynamodb):
-    """
-    Retrieve currently active battlepass season.
-    Finds battlepass with start_date before current time and end_date after current time.
-
-    Parameters:
-        dynamodb (LambdaDynamoDBClass): DynamoDB client for battlepass table
-
-    Returns:
-        dict: Active battlepass data or None if no active battlepass found
-    """
-    logger.info(f"Fetching active battlepass seasons")
-
-    # Get current date/time in UTC to compare with battlepass start/end dates
-    current_date = datetime.now(timezone.utc)
-    logger.debug(f"Current date: {current_date}")
-    current_date_str = current_date.isoformat()
-
-    # Query DynamoDB for active battlepass seasons
-    # (where current date is between start_date and end_date)
-    response = dynamodb.table.scan(
-        FilterExpression=Attr("start_date").lte(current_date_str)
-        & Attr("end_date").gte(current_date_str)
-    )
-
-    active_battlepasses = response.get("Items", [])
-    logger.debug(f"Found {len(active_battlepasses)} active battlepasses")
-
-    return active_battlepasses[0] if active_battlepasses else None
@@ -1,18 +1,26 @@
-import logging
+from log import get_logger, log_event
 import random
 
+from botocore.exceptions import ClientError
+
 from validation_schema import schema
 from dataclasses import dataclass
-from aws_lambda_powertools.utilities.validation import SchemaValidationError, validate
-from common import build_response, convert_decimal_to_float
+from validation import SchemaValidationError, validate
+from common import build_response
 from boto import LambdaDynamoDBClass, _LAMBDA_USERS_TABLE_RESOURCE, _LAMBDA_ITEMS_TABLE_RESOURCE
 from middleware import middleware
-from auth import get_email_from_jwt_token
+from auth import get_email_from_event
+from catalog import get_catalog_item
+from chests import get_chest_sampler
+from inventory import inventory_counts, update_user_inventory
+from user_version import USER_VERSION_UPDATE, USER_VERSION_VALUES
 from datetime import datetime, timezone, timedelta
 from decimal import Decimal
 
-logger = logging.getLogger("consumeItem")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("consumeItem")
+
+# Most chests a single request may open
+MAX_CHESTS_PER_REQUEST = 100
 
 
 @dataclass
@@ -22,28 +30,35 @@ class Request:
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    log_event(logger, event)
 
-    # Extract and validate JWT token to get user email
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     if not email:
-        logger.error(f"Invalid email in jwt token {email}")
+        logger.error("Invalid email in jwt token %s", email)
         return build_response(400, {"message": "Invalid email in jwt token"})
 
     # Validate query parameters against schema
     query_params = event.get("queryStringParameters", {})
     try:
-        logger.debug(f"Validating query params: {query_params}")
+        logger.debug("Validating query params: %s", query_params)
 
         validate(event=query_params, schema=schema)
     except SchemaValidationError as e:
-        logger.error(f"Validation failed: {e}")
-        return build_response(400, {"message": str(e)})
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
 
-    # Get the item ID to consume from query parameters
+    # Get the item ID to consume from query parameters, chests can be opened
+    # several at a time
     use_item_id = query_params.get("item_id")
+    count = int(query_params.get("count", 1))
+
+    if count > MAX_CHESTS_PER_REQUEST:
+        logger.error("Requested to consume %s items, more than %s", count, MAX_CHESTS_PER_REQUEST)
+        return build_response(
+            400, {"message": f"At most {MAX_CHESTS_PER_REQUEST} items can be consumed at once."}
+        )
 
     # Initialize DynamoDB clients for users and items table
     global _LAMBDA_USERS_TABLE_RESOURCE, _LAMBDA_ITEMS_TABLE_RESOURCE
@@ -51,10 +66,10 @@ def lambda_handler(event, context):
     items_dynamodb = LambdaDynamoDBClass(_LAMBDA_ITEMS_TABLE_RESOURCE)
 
     # Process the item consumption request
-    return consume_item(users_dynamodb, items_dynamodb, email, use_item_id)
+    return consume_item(users_dynamodb, items_dynamodb, email, use_item_id, count)
 
 
-def consume_item(users_dynamodb, items_dynamodb, email, item_id):
+def consume_item(users_dynamodb, items_dynamodb, email, item_id, count=1):
     """
     Process an item consumption request and apply its effects to the user.
 
@@ -63,63 +78,76 @@ def consume_item(users_dynamodb, items_dynamodb, email, item_id):
         items_dynamodb (LambdaDynamoDBClass): DynamoDB client for items table
         email (str): User's email
         item_id (str): ID of the item to consume
+        count (int): Number of units to consume, only chests can be
+                     consumed more than once per request
 
     Returns:
         dict: HTTP response with result of the consumption operation
     """
-    logger.debug(f"Consuming item {item_id} for user {email}")
+    logger.debug("Consuming item %s for user %s", item_id, email)
 
     # Fetch user data from DynamoDB
     user = get_user_by_email(users_dynamodb, email)
     if not user:
-        logger.error(f"User not found: {email}")
+        logger.error("User not found: %s", email)
         return build_response(404, {"message": "User not found"})
 
-    # Check if user has the item in their inventory
-    user_items_inventory = user.get("items_inventory", [])
-    item_to_consume = item_id if item_id in user_items_inventory else None
+    # Check if user has the item in their inventory, a legacy list inventory
+    # is migrated by the update below
+    item_counts = inventory_counts(user.get("items_inventory"))
 
-    if not item_to_consume:
-        logger.error(f"Item with ID {item_id} not found in user's inventory.")
+    if item_counts.get(item_id, 0) <= 0:
+        logger.error("Item with ID %s not found in user's inventory.", item_id)
         return build_response(404, {"message": "Item not found in user's inventory."})
 
-    # Fetch item details from items table
-    item_info = items_dynamodb.table.get_item(Key={"id": item_id})
-    item_info = item_info.get("Item")
+    if item_counts[item_id] < count:
+        logger.error("User %s has %s of item %s, not %s", email, item_counts[item_id], item_id, count)
+        return build_response(400, {"message": "Not enough items in user's inventory."})
+
+    # Fetch item details from the items catalog
+    item_info = get_catalog_item(items_dynamodb, item_id)
 
     if not item_info:
-        logger.error(f"Item with ID {item_id} not found in items table.")
+        logger.error("Item with ID %s not found in items table.", item_id)
         return build_response(404, {"message": "Item not found in items table."})
 
     # Get users currently active items and their effects
     activated_items = user.get("activated_items", [])
     item_category = item_info.get("category", "").lower()
-    item_effects = item_info.get("effect", {})
+    # Copy the effects, the catalog item is shared with later requests
+    item_effects = dict(item_info.get("effect", {}))
+
+    if count > 1 and item_category != "chest":
+        logger.error("Item %s of category %s can only be consumed one at a time", item_id, item_category)
+        return build_response(400, {"message": "Only chests can be consumed several at a time."})
 
     # Prepare for DynamoDB update and response
     update_parts = []
     expression_attribute_values = {}
+    # Quantity changes of inventory items, the consumed item is taken out last
+    inventory_changes = {}
     response_data = {"message": "Item consumed successfully."}
 
     # Process item based on its category
     if item_category == "coins":
         # Apply coin effects - add coins to user's balance
-        logger.info(f"Item {item_id} is a coin item. Updating user's coins.")
-        user_coins = user.get("coins", 0)
+        logger.info("Item %s is a coin item. Updating user's coins.", item_id)
         item_coins = item_effects.get("coins", 0)
 
-        update_parts = ["coins = :coins"]
-        expression_attribute_values[":coins"] = user_coins + item_coins
+        # Add to the stored balance, other requests may change it meanwhile
+        update_parts = ["coins = if_not_exists(coins, :zero) + :item_coins"]
+        expression_attribute_values[":zero"] = 0
+        expression_attribute_values[":item_coins"] = item_coins
 
     elif item_category == "hearts":
         # Apply heart effects - add hearts to user's heart balance (max 5)
-        logger.info(f"Item {item_id} is a heart item. Updating user's hearts.")
+        logger.info("Item %s is a heart item. Updating user's hearts.", item_id)
         user_hearts = user.get("hearts", 0)
 
         # If hearts are already at max, return an error
         # Else update hearts based on item effects
         if user_hearts >= 5:
-            logger.warning(f"User {email} already has maximum hearts.")
+            logger.warning("User %s already has maximum hearts.", email)
             return build_response(400, {"message": "User already has maximum hearts."})
 
         item_hearts = item_effects.get("multiplier", 0)
@@ -131,48 +159,47 @@ def consume_item(users_dynamodb, items_dynamodb, email, item_id):
             expression_attribute_values[":hearts"] = user_hearts + item_hearts
 
     elif item_category == "chest":
-        # Open chest to get a random item based on win percentages
-        logger.info(f"Item {item_id} is a chest item. Opening chest.")
-        possible_items = item_effects.get("items", [])
-        if not possible_items:
-            logger.error(f"Item {item_id} has no possible items.")
+        # Open chests to get random items based on win percentages
+        logger.info("Item %s is a chest item. Opening %s chests.", item_id, count)
+        sampler = get_chest_sampler(items_dynamodb, item_id)
+        if sampler is None:
+            logger.error("Item %s has no possible items.", item_id)
             return build_response(400, {"message": "Item has no possible items."})
 
-        # Select a random item from the chest based on win percentages
-        won_item = select_random_item_from_chest(possible_items)
-        won_item = convert_decimal_to_float(won_item)
-        logger.info(f"User {email} won {won_item} from chest {item_id}")
-
-        response_data["won_item"] = won_item
-
-        if "coins" in won_item:
-            logger.info(f"User {email} won coins: {won_item['coins']}")
-            won_coins = won_item.get("coins", 0)
-            user_coins = user.get("coins", 0)
-
-            new_user_coins = user_coins + Decimal(str(won_coins))
+        # Draw every reward up front, they are written in a single update
+        won_items = sampler.sample_many(count)
+        logger.info("User %s won %s from %s chests %s", email, won_items, count, item_id)
 
-            update_parts.append("coins = :coins")
-            expression_attribute_values[":coins"] = new_user_coins
+        if count == 1:
+            response_data["won_item"] = won_items[0]
         else:
-            # If the won item is not coins, add it to user's inventory
-            logger.info(f"Adding item {won_item} to user's inventory")
-            # Create a new inventory item with a unique ID if not provided
-            new_inventory_item = {
-                "item_id": won_item.get("item_id", f"chest-reward-{random.randint(1000, 9999)}"),
-                "quantity": Decimal('1'),
-                "acquired_date": datetime.now(timezone.utc).isoformat()
-            }
-
-            user_items_inventory.append(new_inventory_item)
+            response_data["won_items"] = won_items
+
+        won_coins = Decimal(0)
+        for won_item in won_items:
+            if "coins" in won_item:
+                won_coins += Decimal(str(won_item.get("coins", 0)))
+            else:
+                # If the won item is not coins, add it to user's inventory
+                # Use a unique ID if the reward doesn't name an item
+                won_item_id = won_item.get("item_id", f"chest-reward-{random.randint(1000, 9999)}")
+                inventory_changes[won_item_id] = inventory_changes.get(won_item_id, 0) + 1
+
+        if won_coins:
+            logger.info("User %s won coins: %s", email, won_coins)
+            update_parts.append("coins = if_not_exists(coins, :zero) + :won_coins")
+            expression_attribute_values[":zero"] = 0
+            expression_attribute_values[":won_coins"] = won_coins
 
     else:
         # Handle other item types (buffs, powerups, etc.)
-        logger.info(f"Consuming item {item_id} of category {item_category}.")
+        logger.info("Consuming item %s of category %s.", item_id, item_category)
 
         if not activated_items:
             # User has no activated items - create new activated items list
-            logger.debug(f"User {email} has no activated items. Adding item {item_id}.")
+            logger.debug(
+                "User %s has no activated items. Adding item %s.", email, item_id
+            )
 
             # Calculate item expiration time based on seconds_in_use value
             seconds_in_use = item_effects.get("seconds_in_use", 0)
@@ -190,11 +217,19 @@ def consume_item(users_dynamodb, items_dynamodb, email, item_id):
             }
 
             update_parts.append("activated_items = :activated_items")
+            # completeLevel rewrites activated_items too, bumping the version
+            # makes it re-read the user instead of dropping the new item
+            update_parts.append(USER_VERSION_UPDATE)
+            expression_attribute_values.update(USER_VERSION_VALUES)
             expression_attribute_values[":activated_items"] = [new_activated_item]
 
         else:
             # User already has activated items - add new item to list
-            logger.debug(f"User {email} has activated items. Adding new activated item {item_id}.")
+            logger.debug(
+                "User %s has activated items. Adding new activated item %s.",
+                email,
+                item_id,
+            )
 
             current_time = datetime.now(timezone.utc)
 
@@ -207,7 +242,10 @@ def consume_item(users_dynamodb, items_dynamodb, email, item_id):
             # Check if there was any cleanup needed
             if len(valid_activated_items) < len(activated_items):
                 logger.info(
-                    f"Removed {len(activated_items) - len(valid_activated_items)} expired items for user {email}")
+                    "Removed %s expired items for user %s",
+                    len(activated_items) - len(valid_activated_items),
+                    email,
+                )
                 activated_items = valid_activated_items
 
             # Check if trying to activate an XP boost when one is already active
@@ -219,7 +257,7 @@ def consume_item(users_dynamodb, items_dynamodb, email, item_id):
                 ]
 
                 if active_xp_boost:
-                    logger.warning(f"User {email} already has an active XP boost.")
+                    logger.warning("User %s already has an active XP boost.", email)
                     return build_response(400, {"message": "User already has an active XP boost."})
 
             # Calculate item expiration time based on seconds_in_use value
@@ -239,26 +277,111 @@ def consume_item(users_dynamodb, items_dynamodb, email, item_id):
             activated_items.append(new_activated_item)
 
             update_parts.append("activated_items = :activated_items")
+            # completeLevel rewrites activated_items too, bumping the version
+            # makes it re-read the user instead of dropping the new item
+            update_parts.append(USER_VERSION_UPDATE)
+            expression_attribute_values.update(USER_VERSION_VALUES)
             expression_attribute_values[":activated_items"] = activated_items
 
-    # Remove the consumed item from inventory
-    if item_id in user_items_inventory:
-        user_items_inventory.remove(item_id)
-    update_parts.append("items_inventory = :inventory")
-    expression_attribute_values[":inventory"] = user_items_inventory
+    # Take the consumed item out of the inventory together with the other
+    # changes, conditioned on the user still having it
+    inventory_changes[item_id] = inventory_changes.get(item_id, 0) - count
+    last_unit = item_counts[item_id] == count and inventory_changes[item_id] == -count
+
+    try:
+        write_consumed_item(
+            users_dynamodb,
+            email,
+            item_id,
+            count,
+            inventory_changes,
+            last_unit,
+            update_parts,
+            expression_attribute_values,
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+        if not last_unit:
+            logger.error("Item %s was consumed concurrently by user %s", item_id, email)
+            return build_response(404, {"message": "Item not found in user's inventory."})
+
+        # More units were added since the user was read, take count away instead
+        try:
+            write_consumed_item(
+                users_dynamodb,
+                email,
+                item_id,
+                count,
+                inventory_changes,
+                False,
+                update_parts,
+                expression_attribute_values,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+            logger.error("Item %s was consumed concurrently by user %s", item_id, email)
+            return build_response(404, {"message": "Item not found in user's inventory."})
+
+    logger.info("Item %s consumed successfully for user %s.", item_id, email)
+    return build_response(200, response_data)
 
-    # Construct and execute DynamoDB update expression
-    update_expression = "SET " + ", ".join(update_parts)
-    logger.debug(f"Update expression: {update_expression}")
 
-    users_dynamodb.table.update_item(
-        Key={"email": email},
-        UpdateExpression=update_expression,
-        ExpressionAttributeValues=expression_attribute_values,
-    )
+def write_consumed_item(
+    users_dynamodb,
+    email,
+    item_id,
+    count,
+    inventory_changes,
+    last_unit,
+    update_parts,
+    expression_attribute_values,
+):
+    """
+    Write the consumed item and its effects to the user in one update.
 
-    logger.info(f"Item {item_id} consumed successfully for user {email}.")
-    return build_response(200, response_data)
+    Parameters:
+        users_dynamodb (LambdaDynamoDBClass): DynamoDB client for users table
+        email (str): User's email
+        item_id (str): ID of the consumed item
+        count (int): Units of the item consumed
+        inventory_changes (dict): Quantity changes per item, consumed item included
+        last_unit (bool): Remove the consumed item from the inventory map,
+                          only if exactly count units are left
+        update_parts (list): SET actions for the item's effects
+        expression_attribute_values (dict): Values used by update_parts
+
+    Raises:
+        ClientError: ConditionalCheckFailedException if the user no longer
+                     has count units of the item (exactly count for last_unit)
+    """
+    quantities = dict(inventory_changes)
+    remove_items = []
+    if last_unit:
+        quantities.pop(item_id)
+        remove_items.append(item_id)
+
+    logger.debug("Update parts: %s, inventory changes: %s", update_parts, inventory_changes)
+
+    update_user_inventory(
+        users_dynamodb,
+        email,
+        quantities=quantities,
+        remove_items=remove_items,
+        set_expression=", ".join(update_parts) or None,
+        condition_expression=(
+            "items_inventory.#consumed = :consumed_count"
+            if last_unit
+            else "items_inventory.#consumed >= :consumed_count"
+        ),
+        expression_attribute_names={"#consumed": item_id},
+        expression_attribute_values=dict(
+            expression_attribute_values, **{":consumed_count": count}
+        ),
+    )
 
 
 def get_user_by_email(dynamodb, email):
@@ -272,38 +395,8 @@ def get_user_by_email(dynamodb, email):
     Returns:
         dict: User data or None if user not found
     """
-    logger.info(f"Getting user by email: {email}")
+    logger.info("Getting user by email: %s", email)
     user = dynamodb.table.get_item(Key={"email": email})
 
     return user.get("Item")
 
-
-def select_random_item_from_chest(chest_items):
-    """
-    Randomly select an item from a chest based on win percentages.
-
-    Parameters:
-        chest_items (list): List of possible items with their win percentages
-
-    Returns:
-        dict: The randomly selected item based on weighted probabilities
-    """
-    items = []
-    weights = []
-
-    # Extract items and their win percentages
-    for item in chest_items:
-        items.append(item)
-        weights.append(float(item.get("win_percentage", 0)))
-
-    # Validate that probabilities roughly sum to 100%
-    total_weight = sum(weights)
-    if abs(total_weight - 100) > 0.01:
-        logger.warning(f"Warning: Win percentages sum to {total_weight}, not 100")
-
-    # Select a random item based on weights (win percentages)
-    chosen_item = random.choices(items, weights=weights, k=1)[0]
-    # win_percentage = convert_decimal_to_float(chosen_item.get("win_percentage", 0))
-    logger.info(f"Chosen item: {chosen_item}")
-
-    return chosen_item
\ No newline at end of file
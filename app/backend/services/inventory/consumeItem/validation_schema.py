@@ -3,6 +3,10 @@ schema = {
     "properties": {
         "item_id":{
             "type": "string",
+        },
+        "count": {
+            "type": "string",
+            "pattern": "^[1-9][0-9]*$"
         }
     },
     "required": ["item_id"],
@@ -1,17 +1,15 @@
 import json
-import logging
-from decimal import Decimal
+from log import get_logger, log_event
 
 from validation_schema import schema
 from dataclasses import dataclass
-from aws_lambda_powertools.utilities.validation import SchemaValidationError, validate
-from common import build_response, convert_decimal_to_float
+from validation import SchemaValidationError, validate
+from common import build_response, encode_decimal
 from boto import LambdaDynamoDBClass, _LAMBDA_ACHIEVEMENTS_TABLE_RESOURCE, _LAMBDA_USERS_TABLE_RESOURCE
 from middleware import middleware
-from auth import get_email_from_jwt_token
+from auth import get_email_from_event
 
-logger = logging.getLogger("GetAchievements")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("GetAchievements")
 
 
 @dataclass
@@ -22,25 +20,24 @@ class Request:
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    log_event(logger, event)
 
-    # Extract and validate JWT token to get user email
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     if not email:
-        logger.error(f"Invalid email in jwt token {email}")
+        logger.error("Invalid email in jwt token %s", email)
         return build_response(400, {"message": "Invalid email in jwt token"})
 
     # Validate query parameters against schema
     query_params = event.get("queryStringParameters", {})
     try:
-        logger.debug(f"Validating query params: {query_params}")
+        logger.debug("Validating query params: %s", query_params)
 
         validate(event=query_params, schema=schema)
     except SchemaValidationError as e:
-        logger.error(f"Validation failed: {e}")
-        return build_response(400, {"message": str(e)})
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
 
     # Initialize DynamoDB clients
     global _LAMBDA_ACHIEVEMENTS_TABLE_RESOURCE, _LAMBDA_USERS_TABLE_RESOURCE
@@ -49,7 +46,7 @@ def lambda_handler(event, context):
 
     user = get_user_by_email(users_dynamodb, email)
     if not user:
-        logger.error(f"User with email {email} does not exist")
+        logger.error("User with email %s does not exist", email)
         return build_response(404, {"message": "User does not exist"})
     user_achievements = user.get("achievements", [])
 
@@ -73,7 +70,11 @@ def get_achievements(dynamodb, page_size, next_token, user_achievements):
     Returns:
         dict: HTTP response with achievements data and next page token
     """
-    logger.info(f"Fetching achievements with page size: {page_size} and next token: {next_token}")
+    logger.info(
+        "Fetching achievements with page size: %s and next token: %s",
+        page_size,
+        next_token,
+    )
 
     scan_params = {
         "Limit": page_size,
@@ -84,21 +85,18 @@ def get_achievements(dynamodb, page_size, next_token, user_achievements):
         try:
             exclusive_start_key = json.loads(next_token)
             scan_params["ExclusiveStartKey"] = exclusive_start_key
-            logger.debug(f"Using ExclusiveStartKey: {exclusive_start_key}")
+            logger.debug("Using ExclusiveStartKey: %s", exclusive_start_key)
         except json.JSONDecodeError as e:
-            logger.error(f"Error decoding next token: {e}")
+            logger.error("Error decoding next token: %s", e)
             return build_response(400, {"message": "Invalid pagination token"})
 
     response = dynamodb.table.scan(**scan_params)
 
     achievements = response.get("Items", [])
-    logger.debug(f"Fetched achievements: {achievements}")
-
-    # Convert Decimal values to float for JSON serialization
-    converted_achievements = [convert_decimal_to_float(item) for item in achievements]
+    logger.debug("Fetched achievements: %s", achievements)
 
-    # Add info to converted_achievements if user has each achievement or not
-    for achievement in converted_achievements:
+    # Add info to achievements if user has each achievement or not
+    for achievement in achievements:
         achievement_id = achievement.get("id")
         if achievement_id in user_achievements:
             achievement["acquired"] = True
@@ -106,15 +104,15 @@ def get_achievements(dynamodb, page_size, next_token, user_achievements):
             achievement["acquired"] = False
 
     result = {
-        "achievements": converted_achievements,
+        "achievements": achievements,
         "next_token": None
     }
 
     # Add next_token if there are more items to fetch
     if "LastEvaluatedKey" in response:
-        next_token = json.dumps(response["LastEvaluatedKey"], cls=DecimalEncoder)
+        next_token = json.dumps(response["LastEvaluatedKey"], default=encode_decimal)
         result["next_token"] = next_token
-        logger.debug(f"Next token generated: {next_token}")
+        logger.debug("Next token generated: %s", next_token)
 
     return build_response(
         200,
@@ -126,14 +124,7 @@ def get_achievements(dynamodb, page_size, next_token, user_achievements):
 
 
 def get_user_by_email(dynamodb, email):
-    logger.info(f"Getting user by email {email}")
+    logger.info("Getting user by email %s", email)
     user = dynamodb.table.get_item(Key={"email": email})
 
     return user.get("Item")
-
-
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
@@ -1,7 +1,9 @@
-import logging
+from log import get_logger, log_event
 import json
 
-from common import build_response, convert_decimal_to_float
+from botocore.exceptions import ClientError
+
+from common import build_response
 from middleware import middleware
 from boto import (
     LambdaDynamoDBClass,
@@ -9,25 +11,25 @@ from boto import (
     _LAMBDA_ITEMS_TABLE_RESOURCE,
     _LAMBDA_BATTLEPASS_TABLE_RESOURCE,
 )
-from auth import get_email_from_jwt_token
-from datetime import datetime, timezone
-from boto3.dynamodb.conditions import Attr
+from auth import get_email_from_event
+from battlepass import get_active_battlepass_season
+from catalog import get_catalog_items
+from inventory import inventory_counts, is_counted_inventory, migrate_inventory
+from user_version import user_version_guard
 
 
-logger = logging.getLogger("GetInventory")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("GetInventory")
 
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    log_event(logger, event)
 
-    # Extract and validate JWT token from headers
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     if not email:
-        logger.error(f"Invalid email in jwt token {email}")
+        logger.error("Invalid email in jwt token %s", email)
         return build_response(400, {"message": "Invalid email in jwt token"})
 
     # Initialize DynamoDB resources for required tables
@@ -37,40 +39,37 @@ def lambda_handler(event, context):
     battlepass_dynamodb = LambdaDynamoDBClass(_LAMBDA_BATTLEPASS_TABLE_RESOURCE)
 
     # Retrieve user's inventory and battlepass data from users table
-    user_items_inventory, user_battlepass = get_user_by_email(users_dynamodb, email)
+    user_items_inventory, user_battlepass, user_version = get_user_by_email(
+        users_dynamodb, email
+    )
 
     response_body = {
         "message": "User inventory fetched successfully",
     }
 
     if user_items_inventory is False or user_battlepass is False:
-        logger.debug(f"User with email {email} not found.")
+        logger.debug("User with email %s not found.", email)
         return build_response(404, {"message": "User not found."})
 
-    # Fetch detailed information for each item in the user's inventory
-    full_items_info = []
-    for item_id in user_items_inventory:
-        item_info = items_dynamodb.table.get_item(Key={"id": item_id})
-        item_info = item_info.get("Item", {})
-        if not item_info:
-            logger.error(f"Item with ID {item_id} not found.")
-            continue
-
-        full_items_info.append(item_info)
+    # Legacy list inventories are stored as item counts from now on
+    if not is_counted_inventory(user_items_inventory):
+        migrate_inventory(users_dynamodb, email, user_items_inventory)
 
     # Add item details to response
-    response_body["items"] = full_items_info
+    response_body["items"] = get_inventory_items(
+        items_dynamodb, inventory_counts(user_items_inventory)
+    )
     new_battlepass = None
 
     # Get current active battlepass season
-    active_battlepass = get_active_battlepass_seasons(battlepass_dynamodb)
+    active_battlepass = get_active_battlepass_season(battlepass_dynamodb)
     if not active_battlepass:
-        logger.info(f"No active battlepass seasons found {active_battlepass}")
+        logger.info("No active battlepass seasons found")
         response_body["active_battlepass"] = []
-        return build_response(200, convert_decimal_to_float(response_body))
+        return build_response(200, response_body)
 
     # Get current season ID
-    season_id = active_battlepass.get("season")
+    season_id = active_battlepass.season_id
 
     # Find user's data for the current battlepass season
     current_bp = next(
@@ -81,8 +80,8 @@ def lambda_handler(event, context):
     # Create new battlepass entry if user doesn't have one for the current season
     if not current_bp:
         logger.info(
-            f"User battlepass not found for season ID: {season_id}."
-            f" Adding new battlepass season to user."
+            "User battlepass not found for season ID: %s. Adding new battlepass season to user.",
+            season_id,
         )
 
         new_battlepass = {
@@ -95,31 +94,25 @@ def lambda_handler(event, context):
         # And update the user's battlepass in the database
         user_battlepass = user_battlepass or []
         user_battlepass.append(new_battlepass)
-        users_dynamodb.table.update_item(
-            Key={"email": email},
-            UpdateExpression="SET battlepass = :battlepass",
-            ExpressionAttributeValues={":battlepass": user_battlepass},
-        )
-
-        logger.info(f"New battlepass season added to user: {new_battlepass}")
+        add_battlepass_season(users_dynamodb, email, user_battlepass, user_version)
 
         # Update current battlepass reference for response
         current_bp = new_battlepass
         response_body["user_battlepass"] = new_battlepass
     else:
-        logger.info(f"User already has battlepass for season ID: {season_id}")
+        logger.info("User already has battlepass for season ID: %s", season_id)
         response_body["user_battlepass"] = current_bp
 
     # Calculate unlocked levels based on user's XP and already claimed levels
-    response_body["user_battlepass"]["unlocked_levels"] = get_unlocked_levels(
-        active_battlepass.get("levels", []),
+    unlocked_levels = active_battlepass.unlocked_levels(
         current_bp.get("xp", 0),
         current_bp.get("claimed_levels", []),
     )
-    response_body["active_battlepass"] = active_battlepass or []
+    response_body["user_battlepass"]["unlocked_levels"] = unlocked_levels
+    response_body["active_battlepass"] = active_battlepass.season
 
     # Return successful response with all inventory data
-    return build_response(200, convert_decimal_to_float(response_body))
+    return build_response(200, response_body)
 
 
 def get_user_by_email(dynamodb, email):
@@ -131,102 +124,83 @@ def get_user_by_email(dynamodb, email):
         email (str): User's email to look up
 
     Returns:
-        tuple: (items_inventory, battlepass) or (False, False) if user not found
+        tuple: (items_inventory, battlepass, version) or (False, False, None)
+               if user not found
     """
-    logger.info(f"Getting user by email {email}")
+    logger.info("Getting user by email %s", email)
     user = dynamodb.table.get_item(Key={"email": email})
 
     # Check if user exists
     user_item = user.get("Item", {})
     if not user_item:
-        logger.error(f"User with email {email} not found.")
-        return False, False
+        logger.error("User with email %s not found.", email)
+        return False, False, None
 
     # Extract inventory and battlepass data
-    items_inventory = user_item.get("items_inventory", [])
+    items_inventory = user_item.get("items_inventory")
     user_battlepass = user_item.get("battlepass", None)
 
-    return items_inventory, user_battlepass
+    return items_inventory, user_battlepass, user_item.get("version")
 
 
-def get_active_battlepass_seasons(dynamodb):
+def add_battlepass_season(dynamodb, email, user_battlepass, version):
     """
-    Retrieve currently active battlepass season.
-    Finds battlepass with start_date before current time and end_date after current time.
+    Save the user's battlepass list with a new season, unless the user was
+    updated since it was read. A concurrent writer (completeLevel, a claim)
+    creates the season itself, so the write is skipped rather than retried.
 
     Parameters:
-        dynamodb (LambdaDynamoDBClass): DynamoDB client for battlepass table
-
-    Returns:
-        dict: Active battlepass data or None if no active battlepass found
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for users table
+        email (str): User's email
+        user_battlepass (list): Battlepass list including the new season
+        version: User's version when it was read
     """
-    logger.info(f"Fetching active battlepass seasons")
-
-    # Get current date/time in UTC to compare with battlepass start/end dates
-    current_date = datetime.now(timezone.utc)
-    logger.debug(f"Current date: {current_date}")
-    current_date_str = current_date.isoformat()
-
-    # Query DynamoDB for active battlepass seasons
-    # (where current date is between start_date and end_date)
-    response = dynamodb.table.scan(
-        FilterExpression=Attr("start_date").lte(current_date_str)
-        & Attr("end_date").gte(current_date_str)
+    expression_attribute_values = {":battlepass": user_battlepass}
+    version_update, condition_expression = user_version_guard(
+        version, expression_attribute_values
     )
 
-    active_battlepasses = response.get("Items", [])
-
-    # Handle result based on whether active battlepasses were found
-    if not active_battlepasses:
-        logger.info(f"No active battlepasses found.")
-        return None
-    else:
-        logger.info(f"Active battlepasses found: {len(active_battlepasses)}")
-        logger.debug(
-            f"Active battlepass season found: {active_battlepasses[0].get('season_id')}"
+    try:
+        dynamodb.table.update_item(
+            Key={"email": email},
+            UpdateExpression=f"SET battlepass = :battlepass, {version_update}",
+            ConditionExpression=condition_expression,
+            ExpressionAttributeValues=expression_attribute_values,
         )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+        logger.info("User %s was updated concurrently, battlepass season not saved", email)
+        return
 
-        return active_battlepasses[0]
+    logger.info("New battlepass season added to user: %s", user_battlepass[-1])
 
 
-def get_unlocked_levels(
-    active_battlepass_levels, user_battlepass_xp, already_claimed_levels=[]
-):
+def get_inventory_items(dynamodb, item_counts):
     """
-    Calculate which battlepass levels a user has unlocked but not yet claimed.
+    Fetch item details for every item in the user's inventory.
+    Items are looked up in the items catalog, items missing from it are read
+    once with BatchGetItem and ids that don't exist are only read once per
+    catalog load. The result lists an item as many times as the user owns it.
 
     Parameters:
-        active_battlepass_levels: sorted or unsorted list of dicts with keys
-            { "required_xp": X, "level": N, ... }
-        user_battlepass_xp: the user's total XP
-        already_claimed_levels: list of level numbers the user has claimed
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for items table
+        item_counts (dict): {item_id: quantity}
 
     Returns:
-        list: Level numbers that are unlocked but not yet claimed
+        list: Item details, items that don't exist are left out
     """
-    # Convert XP to float for numeric calculations
-    user_battlepass_xp_float = convert_decimal_to_float(user_battlepass_xp)
-
-    # Sort levels by their numeric level value
-    sorted_levels = sorted(active_battlepass_levels, key=lambda lvl: lvl["level"])
+    item_ids = list(item_counts)
+    items_by_id = get_catalog_items(dynamodb, item_ids)
 
-    unlocked = []
-    running_xp = 0.0
-
-    # Iterate through each level to check if it's unlocked
-    for lvl in sorted_levels:
-        # Get XP required for this level and add to running total
-        xp_needed = convert_decimal_to_float(lvl.get("required_xp", 0))
-        running_xp += xp_needed
-
-        # Stop once user doesn't have enough XP for this level
-        if running_xp > user_battlepass_xp_float:
-            break
-
-        level_num = convert_decimal_to_float(lvl.get("level", 0))
+    full_items_info = []
+    for item_id in item_ids:
+        item_info = items_by_id.get(item_id)
+        if not item_info:
+            logger.error("Item with ID %s not found.", item_id)
+            continue
 
-        # Add level to unlocked list if not already claimed
-        if level_num not in already_claimed_levels:
-            unlocked.append(level_num)
+        full_items_info.extend([item_info] * int(item_counts[item_id]))
 
-    return unlocked
+    return full_items_info
@@ -4,6 +4,7 @@ import os
 import unittest
 from unittest.mock import patch
 from base_test_setup import BaseTestSetup
+from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
 original_path = sys.path.copy()
@@ -11,8 +12,11 @@ BaseTestSetup.setup_paths('claimBattlepassLevel')
 BaseTestSetup.clear_module_cache(['validation_schema', 'common', 'claimBattlepassLevel.app'])
 
 from moto import mock_aws
-from claimBattlepassLevel.app import lambda_handler
+from claimBattlepassLevel.app import lambda_handler, get_user_by_email
 from auth import generate_jwt_token
+from boto import LambdaDynamoDBClass
+import battlepass
+from battlepass import BattlepassSeason, get_active_battlepass_season
 
 
 @mock_aws
@@ -33,6 +37,7 @@ class TestClaimBattlepassLevel(BaseTestSetup):
         self.users_resource_patcher.start()
         self.battlepass_resource_patcher.start()
 
+        now = datetime.now(timezone.utc)
         self.active_battlepass ={
             "season": "3",
             "name": "Season 3",
@@ -68,8 +73,9 @@ class TestClaimBattlepassLevel(BaseTestSetup):
                     "required_xp": 650,
                 }
             ],
-            "start_date": "2025-05-01T00:00:00Z",
-            "end_date": "2025-12-31T23:59:59Z",
+            # Keep the season active whenever the tests run
+            "start_date": (now - timedelta(days=30)).isoformat(),
+            "end_date": (now + timedelta(days=60)).isoformat(),
         }
         self.battlepass_table.put_item(Item=self.active_battlepass)
 
@@ -287,6 +293,89 @@ class TestClaimBattlepassLevel(BaseTestSetup):
         self.assertCountEqual(updated_claimed_levels, expected_claimed_levels)
 
 
+    def test_concurrent_claims_pay_out_once(self):
+        """
+        Test that the same level claimed by two requests at once is paid once.
+        """
+        email = "test@mail.com"
+        jwt_token = generate_jwt_token(email)
+
+        def claim_event():
+            return {
+                'headers': {'Authorization': jwt_token},
+                "queryStringParameters": {"battlepass_level": "2"}
+            }
+
+        responses = []
+
+        def read_then_claim_concurrently(*args, **kwargs):
+            result = get_user_by_email(*args, **kwargs)
+
+            # The other request claims the level right after the first read
+            if not responses:
+                responses.append(None)
+                responses.append(lambda_handler(claim_event(), {}))
+
+            return result
+
+        with patch('claimBattlepassLevel.app.get_user_by_email', side_effect=read_then_claim_concurrently):
+            response = lambda_handler(claim_event(), {})
+
+        self.assertEqual(responses[1]['statusCode'], 200)
+        self.assertEqual(response['statusCode'], 400)
+
+        updated_user = self.users_table.get_item(Key={'email': email})['Item']
+        self.assertEqual(updated_user['coins'], 100 + 60)
+
+        season = next(bp for bp in updated_user['battlepass'] if bp.get('season_id') == '3')
+        self.assertEqual(season['claimed_levels'], [1, 2])
+
+
+    def test_claim_keeps_concurrent_level_completion(self):
+        """
+        Test that a level completed between the claim's read and write keeps
+        its coins and battlepass XP, and the claim is applied on top of it.
+        """
+        email = "test@mail.com"
+        jwt_token = generate_jwt_token(email)
+        reads = []
+
+        def read_then_complete_level(*args, **kwargs):
+            result = get_user_by_email(*args, **kwargs)
+            reads.append(result)
+
+            # completeLevel writes the battlepass it read and bumps the version
+            if len(reads) == 1:
+                battlepass = [dict(bp) for bp in result['battlepass']]
+                for bp in battlepass:
+                    if bp.get('season_id') == '3':
+                        bp['xp'] += 10
+                self.users_table.update_item(
+                    Key={'email': email},
+                    UpdateExpression="SET battlepass = :battlepass, version = :version ADD coins :coins",
+                    ExpressionAttributeValues={":battlepass": battlepass, ":version": 1, ":coins": 15},
+                )
+
+            return result
+
+        with patch('claimBattlepassLevel.app.get_user_by_email', side_effect=read_then_complete_level):
+            response = lambda_handler({
+                'headers': {'Authorization': jwt_token},
+                "queryStringParameters": {"battlepass_level": "2"}
+            }, {})
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(len(reads), 2)
+
+        updated_user = self.users_table.get_item(Key={'email': email})['Item']
+        self.assertEqual(updated_user['coins'], 100 + 15 + 60)
+        self.assertEqual(updated_user['version'], 2)
+
+        season = next(bp for bp in updated_user['battlepass'] if bp.get('season_id') == '3')
+        self.assertEqual(season['xp'], 1510)
+        self.assertEqual(season['claimed_levels'], [1, 2])
+
+
     def test_not_enough_xp(self):
         """
         Test response when the user does not have enough XP to claim a level.
@@ -344,6 +433,102 @@ class TestClaimBattlepassLevel(BaseTestSetup):
         super().tearDown()
 
 
+    def test_active_season_is_cached_until_it_ends(self):
+        """
+        Test that the active season is served from the cache until its
+        end_date and the table is scanned again afterwards.
+        """
+        battlepass_db = LambdaDynamoDBClass({
+            "resource": self.dynamodb,
+            "table_name": os.environ["BATTLEPASS_TABLE_NAME"]
+        })
+
+        season = get_active_battlepass_season(battlepass_db)
+        self.assertEqual(season.season_id, "3")
+
+        # Season 4 replaces season 3 in the table
+        now = datetime.now(timezone.utc)
+        self.battlepass_table.delete_item(Key={"season": "3"})
+        self.battlepass_table.put_item(Item={
+            "season": "4",
+            "levels": [],
+            "start_date": (now - timedelta(days=1)).isoformat(),
+            "end_date": (now + timedelta(days=90)).isoformat(),
+        })
+
+        self.assertIs(get_active_battlepass_season(battlepass_db), season)
+
+        # Once season 3 has ended it drops out of the cache
+        after_end = season.end_date.timestamp() + 1
+        with patch.object(battlepass._ACTIVE_SEASON, 'clock', return_value=after_end):
+            self.assertEqual(get_active_battlepass_season(battlepass_db).season_id, "4")
+
+
+    def test_missing_season_is_checked_again_after_ttl(self):
+        """
+        Test that no active season is cached for BATTLEPASS_MISS_TTL_SECONDS.
+        """
+        battlepass_db = LambdaDynamoDBClass({
+            "resource": self.dynamodb,
+            "table_name": os.environ["BATTLEPASS_TABLE_NAME"]
+        })
+        self.battlepass_table.delete_item(Key={"season": "3"})
+
+        self.assertIsNone(get_active_battlepass_season(battlepass_db))
+
+        self.battlepass_table.put_item(Item=self.active_battlepass)
+        self.assertIsNone(get_active_battlepass_season(battlepass_db))
+
+        after_ttl = battlepass.time.time() + battlepass.BATTLEPASS_MISS_TTL_SECONDS + 1
+        with patch.object(battlepass._ACTIVE_SEASON, 'clock', return_value=after_ttl):
+            self.assertEqual(get_active_battlepass_season(battlepass_db).season_id, "3")
+
+
+class TestBattlepassSeason(unittest.TestCase):
+    def setUp(self):
+        # Levels are stored out of order, required_xp is per level
+        self.season = BattlepassSeason({
+            "season": "3",
+            "levels": [
+                {"level": 3, "coins": 90, "required_xp": 350},
+                {"level": 1, "coins": 30, "required_xp": 150},
+                {"level": 2, "coins": 60, "required_xp": 250},
+            ],
+            "start_date": "2025-05-01T00:00:00Z",
+            "end_date": "2025-12-31T23:59:59Z",
+        })
+
+
+    def test_get_level(self):
+        self.assertEqual(self.season.get_level(2)["coins"], 60)
+        self.assertIsNone(self.season.get_level(0))
+        self.assertIsNone(self.season.get_level(4))
+
+
+    def test_required_xp_is_cumulative(self):
+        self.assertEqual(self.season.required_xp(1), 150)
+        self.assertEqual(self.season.required_xp(2), 400)
+        self.assertEqual(self.season.required_xp(3), 750)
+        self.assertEqual(self.season.required_xp(0), 0)
+
+
+    def test_unlocked_levels(self):
+        self.assertEqual(self.season.unlocked_levels(0), [])
+        self.assertEqual(self.season.unlocked_levels(149), [])
+
+        # Reaching a threshold exactly unlocks the level
+        self.assertEqual(self.season.unlocked_levels(150), [1])
+        self.assertEqual(self.season.unlocked_levels(400), [1, 2])
+        self.assertEqual(self.season.unlocked_levels(749), [1, 2])
+
+        # XP beyond the last level unlocks every level and nothing more
+        self.assertEqual(self.season.unlocked_levels(10000), [1, 2, 3])
+
+
+    def test_unlocked_levels_leaves_out_claimed(self):
+        self.assertEqual(self.season.unlocked_levels(10000, claimed_levels=[1, 3]), [2])
+
+
 if __name__ == "__main__":
     try:
         unittest.main()
@@ -16,6 +16,7 @@ BaseTestSetup.clear_module_cache(['common', 'consumeItem.app'])
 from base_test_setup import BaseTestSetup
 from moto import mock_aws
 from consumeItem.app import lambda_handler
+from chests import ChestSampler
 from auth import generate_jwt_token
 
 
@@ -228,6 +229,52 @@ class TestConsumeItem(BaseTestSetup):
 
         self.assertEqual(fetched_user["hearts"], 5)
 
+    def test_consume_item_from_counted_inventory(self):
+        """
+        Test that consuming one of several units only decrements its count and
+        that the last unit is removed from the inventory map.
+        """
+        self.users_table.put_item(Item={
+            "email": "counted@mail.com",
+            "hearts": 0,
+            "items_inventory": {"item-1": 2, "item-3": 1}
+        })
+
+        jwt_token = generate_jwt_token("counted@mail.com")
+
+        for expected_inventory in [{"item-1": 1, "item-3": 1}, {"item-3": 1}]:
+            self.users_table.update_item(
+                Key={'email': "counted@mail.com"},
+                UpdateExpression="SET hearts = :zero",
+                ExpressionAttributeValues={":zero": 0}
+            )
+
+            event = {
+                'headers': {'Authorization': jwt_token},
+                'queryStringParameters': {
+                    'item_id': 'item-1'
+                }
+            }
+
+            response = lambda_handler(event, {})
+
+            self.assertEqual(response['statusCode'], 200)
+
+            fetched_user = self.users_table.get_item(Key={'email': "counted@mail.com"})['Item']
+            self.assertEqual(fetched_user["items_inventory"], expected_inventory)
+
+        event = {
+            'headers': {'Authorization': jwt_token},
+            'queryStringParameters': {
+                'item_id': 'item-1'
+            }
+        }
+
+        response = lambda_handler(event, {})
+
+        self.assertEqual(response['statusCode'], 404)
+
+
     def test_consume_xp_boost_item(self):
         """
         Test consuming an item that gives XP boost to the user.
@@ -348,9 +395,9 @@ class TestConsumeItem(BaseTestSetup):
             }
         }
 
-        # Mock random.choices to always return the 50-coin reward
-        with patch('random.choices') as mock_choices:
-            mock_choices.return_value = [self.coins_chest["effect"]["items"][2]]
+        # Mock the chest sampler to always return the 50-coin reward
+        with patch('chests.ChestSampler.sample_many') as mock_sample:
+            mock_sample.return_value = [self.coins_chest["effect"]["items"][2]]
 
             response = lambda_handler(event, {})
             body = json.loads(response['body'])
@@ -426,9 +473,9 @@ class TestConsumeItem(BaseTestSetup):
             }
         }
 
-        # Mock random.choices to always return the non-coin item
-        with patch('random.choices') as mock_choices:
-            mock_choices.return_value = [self.items_chest["effect"]["items"][1]]
+        # Mock the chest sampler to always return the non-coin item
+        with patch('chests.ChestSampler.sample_many') as mock_sample:
+            mock_sample.return_value = [self.items_chest["effect"]["items"][1]]
 
             response = lambda_handler(event, {})
             body = json.loads(response['body'])
@@ -442,21 +489,109 @@ class TestConsumeItem(BaseTestSetup):
             fetched_user = self.users_table.get_item(Key={'email': "itemchestuser@mail.com"})['Item']
 
             # Verify the chest was removed from inventory
-            # Find the chest in the inventory
-            chest_in_inventory = next((item for item in fetched_user["items_inventory"]
-                                       if item["item_id"] == "items-chest-1"), None)
-            self.assertIsNone(chest_in_inventory)
+            self.assertNotIn("items-chest-1", fetched_user["items_inventory"])
 
             # Verify the new item was added to inventory
-            xp_boost_in_inventory = next((item for item in fetched_user["items_inventory"]
-                                          if item["item_id"] == "xp-boost-1"), None)
-            self.assertIsNotNone(xp_boost_in_inventory)
-            self.assertEqual(xp_boost_in_inventory["quantity"], Decimal('1'))
+            self.assertEqual(fetched_user["items_inventory"].get("xp-boost-1"), Decimal('1'))
 
             # Check that the user now has two items in inventory (the new one)
             self.assertEqual(len(fetched_user["items_inventory"]), 1)
 
 
+    def test_open_several_chests(self):
+        """
+        Test opening several chests at once, the rewards are written together.
+        """
+        self.users_table.put_item(Item={
+            "email": "bulkchestuser@mail.com",
+            "coins": Decimal('100'),
+            "items_inventory": {"items-chest-1": 5},
+            "activated_items": []
+        })
+
+        self.items_chest = {
+            "id": "items-chest-1",
+            "name": "Items Chest",
+            "image_url": "https://example.com/images/items_chest.png",
+            "price": Decimal('200.00'),
+            "category": "chest",
+            "effect": {
+                "items": [
+                    {
+                        "coins": 10,
+                        "win_percentage": Decimal('40')
+                    },
+                    {
+                        "item_id": "xp-boost-1",
+                        "win_percentage": Decimal('60')
+                    }
+                ]
+            }
+        }
+        self.items_table.put_item(Item=self.items_chest)
+
+        jwt_token = generate_jwt_token("bulkchestuser@mail.com")
+        coins_reward, item_reward = self.items_chest["effect"]["items"]
+
+        with patch('chests.ChestSampler.sample_many') as mock_sample:
+            mock_sample.return_value = [coins_reward, item_reward, coins_reward, item_reward]
+
+            response = lambda_handler({
+                'headers': {'Authorization': jwt_token},
+                'queryStringParameters': {'item_id': 'items-chest-1', 'count': '4'}
+            }, {})
+            body = json.loads(response['body'])
+
+            self.assertEqual(response['statusCode'], 200)
+            self.assertEqual(len(body["won_items"]), 4)
+            mock_sample.assert_called_once_with(4)
+
+        fetched_user = self.users_table.get_item(Key={'email': "bulkchestuser@mail.com"})['Item']
+        self.assertEqual(fetched_user["coins"], Decimal('120'))
+        self.assertEqual(
+            fetched_user["items_inventory"],
+            {"items-chest-1": Decimal('1'), "xp-boost-1": Decimal('2')}
+        )
+
+        # Opening more chests than are left changes nothing
+        response = lambda_handler({
+            'headers': {'Authorization': jwt_token},
+            'queryStringParameters': {'item_id': 'items-chest-1', 'count': '2'}
+        }, {})
+        self.assertEqual(response['statusCode'], 400)
+
+        fetched_user = self.users_table.get_item(Key={'email': "bulkchestuser@mail.com"})['Item']
+        self.assertEqual(fetched_user["items_inventory"]["items-chest-1"], Decimal('1'))
+
+
+    def test_chest_sampler_follows_win_percentages(self):
+        """
+        Test that evenly spread random numbers are split by win percentage.
+        """
+        rewards = [
+            {"coins": 10, "win_percentage": Decimal('50')},
+            {"coins": 20, "win_percentage": Decimal('30')},
+            {"coins": 50, "win_percentage": Decimal('20')},
+            {"coins": 99, "win_percentage": Decimal('0')},
+        ]
+        sampler = ChestSampler(rewards)
+
+        draws = 1000
+        values = iter([(i + 0.5) / draws for i in range(draws)])
+
+        class SpreadRandom:
+            def random(self):
+                return next(values)
+
+        won = sampler.sample_many(draws, rng=SpreadRandom())
+        counts = {coins: sum(1 for reward in won if reward["coins"] == coins) for coins in (10, 20, 50, 99)}
+
+        self.assertAlmostEqual(counts[10], 500, delta=3)
+        self.assertAlmostEqual(counts[20], 300, delta=3)
+        self.assertAlmostEqual(counts[50], 200, delta=3)
+        self.assertEqual(counts[99], 0)
+
+
     def test_cannot_activate_multiple_xp_boost_items(self):
         """
         Test response when trying to activate multiple XP boost items.
@@ -131,6 +131,117 @@ class TestGetInventory(BaseTestSetup):
         self.assertEqual(body['message'], "User inventory fetched successfully")
 
 
+    def test_get_inventory_keeps_order_and_duplicates(self):
+        """
+        Test that a legacy list inventory is migrated to item counts on read,
+        every unit is returned and items missing from the items table are skipped.
+        """
+        self.users_table.update_item(
+            Key={"email": "test@mail.com"},
+            UpdateExpression="SET items_inventory = :items",
+            ExpressionAttributeValues={
+                ":items": ["chest-1", "item-1", "missing-item", "chest-1", {"item_id": "item-3"}]
+            }
+        )
+
+        jwt_token = generate_jwt_token("test@mail.com")
+        event = {
+            'headers': {'Authorization': jwt_token}
+        }
+
+        response = lambda_handler(event, {})
+        body = json.loads(response['body'])
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual([item["id"] for item in body['items']], ["chest-1", "chest-1", "item-1", "item-3"])
+
+        updated_user = self.users_table.get_item(Key={'email': "test@mail.com"})['Item']
+        self.assertEqual(
+            updated_user['items_inventory'],
+            {"chest-1": 2, "item-1": 1, "missing-item": 1, "item-3": 1}
+        )
+
+
+    def test_get_inventory_retries_unprocessed_keys(self):
+        """
+        Test that items missing from the catalog are read with BatchGetItem and
+        that keys returned as UnprocessedKeys are requested again.
+        """
+        jwt_token = generate_jwt_token("test@mail.com")
+
+        # Load the catalog, then add an item it doesn't know about yet
+        lambda_handler({'headers': {'Authorization': jwt_token}}, {})
+        self.items_table.put_item(Item={"id": "item-new", "name": "New Item", "category": "item"})
+        self.users_table.update_item(
+            Key={"email": "test@mail.com"},
+            UpdateExpression="SET items_inventory = :items",
+            ExpressionAttributeValues={":items": ["item-1", "item-new", "item-new"]}
+        )
+
+        original_batch_get_item = self.dynamodb.batch_get_item
+        calls = []
+
+        def throttled_batch_get_item(RequestItems):
+            calls.append(RequestItems)
+            if len(calls) == 1:
+                return {"Responses": {}, "UnprocessedKeys": RequestItems}
+            return original_batch_get_item(RequestItems=RequestItems)
+
+        event = {
+            'headers': {'Authorization': jwt_token}
+        }
+
+        with patch.object(self.dynamodb, 'batch_get_item', side_effect=throttled_batch_get_item):
+            response = lambda_handler(event, {})
+        body = json.loads(response['body'])
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[0][os.environ["ITEMS_TABLE_NAME"]]["Keys"], [{"id": "item-new"}])
+        self.assertEqual([item["id"] for item in body['items']], ["item-1", "item-new", "item-new"])
+
+
+    def test_missing_items_are_read_once_per_catalog_load(self):
+        """
+        Test that item ids missing from the items table are remembered by the
+        catalog and only read again after it is reloaded.
+        """
+        jwt_token = generate_jwt_token("test@mail.com")
+        self.users_table.update_item(
+            Key={"email": "test@mail.com"},
+            UpdateExpression="SET items_inventory = :items",
+            ExpressionAttributeValues={":items": ["item-1", "missing-item"]}
+        )
+
+        calls = []
+        original_batch_get_item = self.dynamodb.batch_get_item
+
+        def counted_batch_get_item(RequestItems):
+            calls.append(RequestItems)
+            return original_batch_get_item(RequestItems=RequestItems)
+
+        with patch.object(self.dynamodb, 'batch_get_item', side_effect=counted_batch_get_item):
+            for _ in range(3):
+                response = lambda_handler({'headers': {'Authorization': jwt_token}}, {})
+                body = json.loads(response['body'])
+
+                self.assertEqual(response['statusCode'], 200)
+                self.assertEqual([item["id"] for item in body['items']], ["item-1"])
+
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(calls[0][os.environ["ITEMS_TABLE_NAME"]]["Keys"], [{"id": "missing-item"}])
+
+            # Once the catalog is reloaded the id is read again
+            self.items_table.put_item(Item={"id": "missing-item", "name": "Late Item", "category": "item"})
+            from catalog import clear_items_catalog
+            clear_items_catalog()
+
+            response = lambda_handler({'headers': {'Authorization': jwt_token}}, {})
+            body = json.loads(response['body'])
+
+        self.assertEqual([item["id"] for item in body['items']], ["item-1", "missing-item"])
+
+
     def test_empty_inventory(self):
         """
         Test getting inventory when user has no items.
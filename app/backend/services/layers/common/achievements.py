@@ -0,0 +1,104 @@
+from bisect import bisect_right
+from os import environ
+from log import get_logger
+from snapshot import TtlSnapshot, scan_all
+
+logger = get_logger("achievements")
+
+# Achievements only change when new ones are published, so the whole table is
+# kept per warm container and reloaded after ACHIEVEMENTS_CATALOG_TTL_SECONDS
+ACHIEVEMENTS_CATALOG_TTL_SECONDS = int(
+    environ.get("ACHIEVEMENTS_CATALOG_TTL_SECONDS", 300)
+)
+
+
+class AchievementsCatalog:
+    """
+    Snapshot of the achievements table grouped by type, each group sorted by
+    the stat value it requires.
+    """
+
+    def __init__(self, achievements):
+        self.by_id = {}
+        self.by_type = {}
+        # requires[type][i] is the threshold of by_type[type][i]
+        self.requires = {}
+
+        for achievement in achievements:
+            self.by_id[achievement["id"]] = achievement
+            self.by_type.setdefault(achievement.get("type"), []).append(achievement)
+
+        for achievement_type, group in self.by_type.items():
+            group.sort(key=lambda a: a.get("requires", 0))
+            self.requires[achievement_type] = [a.get("requires", 0) for a in group]
+
+    def newly_earned(self, achievement_type, old_value, new_value, earned_ids):
+        """
+        Achievements of a type unlocked by a stat going from old_value to
+        new_value that are not in earned_ids.
+
+        Every threshold crossed by the change is awarded. Below old_value the
+        thresholds are walked down until the first one already earned, so
+        achievements published after a user passed them are still handed out.
+
+        Parameters:
+            achievement_type (str): Stat the achievements require, e.g. "xp"
+            old_value: Value of the stat before the update
+            new_value: Value of the stat after the update
+            earned_ids (set): IDs of achievements the user already has
+
+        Returns:
+            list: Newly earned achievements, highest threshold first
+        """
+        group = self.by_type.get(achievement_type)
+        if not group:
+            return []
+
+        thresholds = self.requires[achievement_type]
+        crossed_from = bisect_right(thresholds, old_value)
+        crossed_to = bisect_right(thresholds, new_value)
+
+        earned = [
+            group[index]
+            for index in range(crossed_to - 1, crossed_from - 1, -1)
+            if group[index]["id"] not in earned_ids
+        ]
+
+        for index in range(min(crossed_from, crossed_to) - 1, -1, -1):
+            if group[index]["id"] in earned_ids:
+                break
+            earned.append(group[index])
+
+        return earned
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+def _load_achievements_catalog(dynamodb):
+    catalog = AchievementsCatalog(scan_all(dynamodb))
+    logger.info("Loaded %s achievements into the catalog", len(catalog))
+
+    return catalog
+
+
+_ACHIEVEMENTS_CATALOG = TtlSnapshot(
+    _load_achievements_catalog, ACHIEVEMENTS_CATALOG_TTL_SECONDS
+)
+
+
+def get_achievements_catalog(dynamodb):
+    """
+    Return the cached achievements catalog, loading it when missing or expired.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for achievements table
+
+    Returns:
+        AchievementsCatalog
+    """
+    return _ACHIEVEMENTS_CATALOG.get(dynamodb)
+
+
+def clear_achievements_catalog():
+    _ACHIEVEMENTS_CATALOG.clear()
@@ -1,22 +1,39 @@
-import logging
-import jwt
+from log import get_logger
 from os import environ
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from boto import get_secrets_from_aws_secrets_manager
+from typing import Optional
+from boto import (
+    get_secrets_from_aws_secrets_manager,
+    refresh_secrets_from_aws_secrets_manager,
+)
 from common import parse_utc_isoformat
 
-logger = logging.getLogger("auth")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("auth")
+
+# Key under which the middleware attaches the decoded token to the event
+AUTH_CONTEXT_EVENT_KEY = "auth_context"
+
+
+@dataclass(frozen=True)
+class AuthContext:
+    email: str
+    exp: int
+    claims: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_claims(cls, claims: dict) -> "AuthContext":
+        return cls(email=claims.get("email"), exp=claims.get("exp"), claims=claims)
 
 
 def generate_jwt_token(email):
-    secrets = get_secrets_from_aws_secrets_manager(
-        environ.get("JWT_SECRET_NAME"), environ.get("SECRETS_REGION_NAME")
-    )
+    import jwt
+
+    secrets = get_jwt_secrets()
 
     expiration_time = get_expiration_time(timedelta(hours=1))
 
-    logger.debug(f"Generating JWT token for email: {email}")
+    logger.debug("Generating JWT token for email: %s", email)
 
     return jwt.encode(
         {"email": email, "exp": expiration_time},
@@ -26,11 +43,11 @@ def generate_jwt_token(email):
 
 
 def generate_refresh_token(email):
-    secrets = get_secrets_from_aws_secrets_manager(
-        environ.get("JWT_SECRET_NAME"), environ.get("SECRETS_REGION_NAME")
-    )
+    import jwt
+
+    secrets = get_jwt_secrets()
 
-    logger.debug(f"Generating refresh token for email: {email}")
+    logger.debug("Generating refresh token for email: %s", email)
 
     expiration_time = get_expiration_time(timedelta(days=1))
 
@@ -46,45 +63,112 @@ def get_email_from_jwt_token(token):
         logger.warning("No token provided")
         return None
 
-    secrets = get_secrets_from_aws_secrets_manager(
-        environ.get("JWT_SECRET_NAME"), environ.get("SECRETS_REGION_NAME")
-    )
-
     try:
         logger.debug("Decoding JWT token")
-        decoded_jwt = jwt.decode(
-            token.encode("utf-8"), secrets["jwt_secret"], algorithms=["HS256"]
-        )
+        decoded_jwt = decode_token(token, "jwt_secret")
     except Exception as e:
-        logger.error(f"Error decoding JWT token {e}")
+        logger.error("Error decoding JWT token %s", e)
         return None
 
     logger.debug("Returning email from the JWT token")
     return decoded_jwt.get("email")
 
 
+def get_auth_context(event) -> Optional[AuthContext]:
+    """
+    Return the auth context the middleware attached to the event, if any.
+    """
+    auth_context = event.get(AUTH_CONTEXT_EVENT_KEY)
+    if isinstance(auth_context, AuthContext):
+        return auth_context
+
+    return None
+
+
+def get_email_from_event(event):
+    """
+    Get the authenticated user's email for a request.
+    Uses the auth context set by the middleware, so the token is not decoded
+    a second time. Falls back to decoding the x-access-token header for events
+    that did not go through the middleware.
+    """
+    auth_context = get_auth_context(event)
+    if auth_context:
+        return auth_context.email
+
+    logger.debug("No auth context on the event, decoding the access token")
+    return get_email_from_jwt_token((event.get("headers") or {}).get("x-access-token"))
+
+
 def get_email_from_refresh_token(token):
     if not token:
         logger.warning("No token provided")
         return None
 
-    secrets = get_secrets_from_aws_secrets_manager(
-        environ.get("JWT_SECRET_NAME"), environ.get("SECRETS_REGION_NAME")
-    )
-
     try:
         logger.debug("Decoding JWT token")
-        decoded_jwt = jwt.decode(
-            token.encode("utf-8"), secrets["refresh_secret"], algorithms=["HS256"]
-        )
+        decoded_jwt = decode_token(token, "refresh_secret")
     except Exception as e:
-        logger.error(f"Error decoding JWT token {e}")
+        logger.error("Error decoding JWT token %s", e)
         return None
 
     logger.debug("Returning email from the JWT token")
     return decoded_jwt.get("email")
 
 
+def get_jwt_secrets(version_stage="AWSCURRENT"):
+    return get_secrets_from_aws_secrets_manager(
+        environ.get("JWT_SECRET_NAME"),
+        environ.get("SECRETS_REGION_NAME"),
+        version_stage,
+    )
+
+
+def decode_token(token, secret_key):
+    """
+    Decode and verify a HS256 token signed with one of the JWT secrets.
+    If the signature doesn't match the cached secret, the secret may have been
+    rotated, so the freshly fetched current version and then the previous
+    version are tried before giving up.
+    :param token: Encoded token (str or bytes).
+    :param secret_key: Key of the secret to verify with ("jwt_secret" or "refresh_secret").
+    :return: Decoded token claims.
+    :raises jwt.PyJWTError: When the token is invalid or expired.
+    """
+    import jwt
+
+    if isinstance(token, str):
+        token = token.encode("utf-8")
+
+    secrets = get_jwt_secrets()
+
+    try:
+        return jwt.decode(token, secrets[secret_key], algorithms=["HS256"])
+    except jwt.InvalidSignatureError:
+        logger.info("Token signature mismatch, checking for a rotated secret")
+
+    tried_secrets = [secrets[secret_key]]
+    rotated_candidates = (
+        lambda: refresh_secrets_from_aws_secrets_manager(
+            environ.get("JWT_SECRET_NAME"), environ.get("SECRETS_REGION_NAME")
+        ),
+        lambda: get_jwt_secrets("AWSPREVIOUS"),
+    )
+
+    for load_candidate in rotated_candidates:
+        candidate = load_candidate()
+        if not candidate or candidate.get(secret_key) in tried_secrets:
+            continue
+
+        tried_secrets.append(candidate[secret_key])
+        try:
+            return jwt.decode(token, candidate[secret_key], algorithms=["HS256"])
+        except jwt.InvalidSignatureError:
+            continue
+
+    raise jwt.InvalidSignatureError("Signature verification failed")
+
+
 def get_expiration_time(time: timedelta) -> int:
     return int((datetime.now(timezone.utc) + time).timestamp())
 
@@ -114,20 +198,22 @@ def check_users_subscription(user, wanted_status: int) -> bool:
     try:
         exp_dt = parse_utc_isoformat(exp_str)
     except Exception as e:
-        logger.error(f"Failed to parse subscription_expiration_date '{exp_str}': {e}")
+        logger.error(
+            "Failed to parse subscription_expiration_date '%s': %s", exp_str, e
+        )
         return False
 
     now = datetime.now(timezone.utc)
 
     if subscription < wanted_status:
         logger.info(
-            f"User subscription ({subscription}) is below required ({wanted_status})"
+            "User subscription (%s) is below required (%s)", subscription, wanted_status
         )
         return False
 
     if exp_dt < now:
         logger.info(
-            f"Subscription expired at {exp_dt.isoformat()}, now is {now.isoformat()}"
+            "Subscription expired at %s, now is %s", exp_dt.isoformat(), now.isoformat()
         )
         return False
 
@@ -0,0 +1,125 @@
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from itertools import accumulate
+from os import environ
+from common import parse_utc_isoformat
+from log import get_logger
+from snapshot import TtlSnapshot, scan_all
+
+logger = get_logger("battlepass")
+
+# The active season is cached until its end_date. When there is no active
+# season the table is checked again after BATTLEPASS_MISS_TTL_SECONDS, so a
+# newly started season is picked up without waiting for a cold start.
+BATTLEPASS_MISS_TTL_SECONDS = int(environ.get("BATTLEPASS_MISS_TTL_SECONDS", 300))
+
+
+class BattlepassSeason:
+    """
+    Active battlepass season with its levels sorted by level number and the
+    cumulative XP needed to unlock each of them.
+
+    Parameters:
+        season: Battlepass document from DynamoDB, shared between requests
+    """
+
+    def __init__(self, season):
+        self.season = season
+        self.season_id = season.get("season")
+        self.end_date = parse_utc_isoformat(season["end_date"])
+
+        self.levels = sorted(season.get("levels", []), key=lambda lvl: lvl["level"])
+        self.level_numbers = [lvl["level"] for lvl in self.levels]
+        # cumulative_xp[i] is the total XP needed to unlock self.levels[i]
+        self.cumulative_xp = list(
+            accumulate(lvl.get("required_xp", 0) for lvl in self.levels)
+        )
+
+    def get_level(self, level_number):
+        """
+        Return the level dict for a level number, or None if it doesn't exist.
+        """
+        index = bisect_left(self.level_numbers, level_number)
+        if index < len(self.levels) and self.level_numbers[index] == level_number:
+            return self.levels[index]
+
+        return None
+
+    def required_xp(self, level_number):
+        """
+        Total XP needed to unlock a level, including all levels before it.
+        """
+        index = bisect_right(self.level_numbers, level_number)
+
+        return self.cumulative_xp[index - 1] if index else 0
+
+    def unlocked_levels(self, xp, claimed_levels=()):
+        """
+        Level numbers unlocked with the given XP that haven't been claimed yet.
+        """
+        claimed = set(claimed_levels)
+        unlocked_count = bisect_right(self.cumulative_xp, xp)
+
+        return [
+            level_number
+            for level_number in self.level_numbers[:unlocked_count]
+            if level_number not in claimed
+        ]
+
+
+def _scan_active_season(dynamodb):
+    from boto3.dynamodb.conditions import Attr
+
+    logger.info("Fetching active battlepass season")
+
+    # Current date between start_date and end_date
+    current_date_str = datetime.now(timezone.utc).isoformat()
+    active_battlepasses = scan_all(
+        dynamodb,
+        FilterExpression=Attr("start_date").lte(current_date_str)
+        & Attr("end_date").gte(current_date_str),
+    )
+
+    if not active_battlepasses:
+        logger.info("No active battlepass season found")
+        return None
+
+    logger.debug(
+        "Active battlepass season found: %s", active_battlepasses[0].get("season")
+    )
+    return BattlepassSeason(active_battlepasses[0])
+
+
+def _season_expires_at(season):
+    if season:
+        return season.end_date.timestamp()
+
+    return time.time() + BATTLEPASS_MISS_TTL_SECONDS
+
+
+# Seasons expire at their end_date, so the cache runs on the wall clock
+_ACTIVE_SEASON = TtlSnapshot(
+    _scan_active_season,
+    BATTLEPASS_MISS_TTL_SECONDS,
+    expires_at=_season_expires_at,
+    clock=time.time,
+)
+
+
+def get_active_battlepass_season(dynamodb):
+    """
+    Return the currently active battlepass season, scanning the battlepass
+    table only when the cached season has ended.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for battlepass table
+
+    Returns:
+        BattlepassSeason or None if no season is active
+    """
+    return _ACTIVE_SEASON.get(dynamodb)
+
+
+def clear_battlepass_cache():
+    _ACTIVE_SEASON.clear()
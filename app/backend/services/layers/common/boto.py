@@ -1,48 +1,193 @@
-import boto3
 import json
-import logging
+from log import get_logger
+import threading
+import time
 from os import environ
 
-logger = logging.getLogger("boto3")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("boto3")
+
+# Secrets are cached per warm container, so token checks don't need a
+# Secrets Manager round trip on every request
+SECRETS_CACHE_TTL_SECONDS = int(environ.get("SECRETS_CACHE_TTL_SECONDS", 300))
+SECRETS_CACHE_REFRESH_AHEAD_SECONDS = int(
+    environ.get("SECRETS_CACHE_REFRESH_AHEAD_SECONDS", 30)
+)
+SECRETS_CACHE_MIN_REFRESH_SECONDS = int(
+    environ.get("SECRETS_CACHE_MIN_REFRESH_SECONDS", 30)
+)
+
+_SECRETS_CACHE = {}
+_SECRETS_CACHE_LOCK = threading.Lock()
+_SECRETS_CACHE_STATS = {"hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+
+# One session, resource and client per service for the whole container.
+# Everything is created on first use, so a cold start only pays for the
+# services the handler actually touches. boto3 and botocore themselves are
+# imported there too, they are the most expensive imports in the layer.
+_BOTO_CONFIG = None
+_SESSION = None
+_RESOURCES = {}
+_CLIENTS = {}
+_TABLES = {}
+_POOL_LOCK = threading.Lock()
+
+
+def get_boto_config():
+    global _BOTO_CONFIG
+
+    if _BOTO_CONFIG is None:
+        from botocore.config import Config
+
+        _BOTO_CONFIG = Config(
+            max_pool_connections=int(environ.get("BOTO_MAX_POOL_CONNECTIONS", 50)),
+            tcp_keepalive=True,
+            connect_timeout=float(environ.get("BOTO_CONNECT_TIMEOUT_SECONDS", 2)),
+            read_timeout=float(environ.get("BOTO_READ_TIMEOUT_SECONDS", 10)),
+            retries={
+                "max_attempts": int(environ.get("BOTO_MAX_ATTEMPTS", 3)),
+                "mode": "standard",
+            },
+        )
+
+    return _BOTO_CONFIG
+
+
+def get_session():
+    global _SESSION
+
+    if _SESSION is None:
+        with _POOL_LOCK:
+            if _SESSION is None:
+                import boto3.session
+
+                _SESSION = boto3.session.Session()
+
+    return _SESSION
+
+
+def get_resource(service_name, region_name=None):
+    cache_key = (service_name, region_name)
+
+    resource = _RESOURCES.get(cache_key)
+    if resource is None:
+        session = get_session()
+        with _POOL_LOCK:
+            resource = _RESOURCES.get(cache_key)
+            if resource is None:
+                logger.debug("Creating shared %s resource", service_name)
+                resource = session.resource(
+                    service_name, region_name=region_name, config=get_boto_config()
+                )
+                _RESOURCES[cache_key] = resource
+
+    return resource
+
+
+def get_client(service_name, region_name=None, endpoint_url=None):
+    cache_key = (service_name, region_name, endpoint_url)
+
+    service_client = _CLIENTS.get(cache_key)
+    if service_client is None:
+        session = get_session()
+        with _POOL_LOCK:
+            service_client = _CLIENTS.get(cache_key)
+            if service_client is None:
+                logger.debug("Creating shared %s client", service_name)
+                service_client = session.client(
+                    service_name,
+                    region_name=region_name,
+                    endpoint_url=endpoint_url,
+                    config=get_boto_config(),
+                )
+                _CLIENTS[cache_key] = service_client
+
+    return service_client
+
+
+def get_table(table_name):
+    table = _TABLES.get(table_name)
+    if table is None:
+        table = get_resource("dynamodb").Table(table_name)
+        _TABLES[table_name] = table
+
+    return table
+
+
+def get_websocket_client():
+    """
+    Shared API Gateway management client for the WEBSOCKET_ENDPOINT stage.
+    """
+    raw = environ["WEBSOCKET_ENDPOINT"]
+    https_url = raw.replace("wss://", "https://", 1)
+
+    return get_client("apigatewaymanagementapi", endpoint_url=https_url)
+
+
+class LazyResource:
+    """
+    Stand-in for a boto3 service resource that resolves to the shared
+    pooled resource the first time it is used.
+    """
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+
+    def Table(self, table_name):
+        return get_table(table_name)
+
+    def __getattr__(self, name):
+        return getattr(get_resource(self.service_name), name)
+
 
 _LAMBDA_USERS_TABLE_RESOURCE = {
-    "resource": boto3.resource("dynamodb"),
+    "resource": LazyResource("dynamodb"),
     "table_name": environ.get("USERS_TABLE_NAME", "test_table"),
 }
 
 _LAMBDA_TASKS_TABLE_RESOURCE = {
-    "resource": boto3.resource("dynamodb"),
+    "resource": LazyResource("dynamodb"),
     "table_name": environ.get("TASKS_TABLE_NAME", "task_test_table"),
 }
 
+_LAMBDA_LESSON_BUNDLES_TABLE_RESOURCE = {
+    "resource": LazyResource("dynamodb"),
+    "table_name": environ.get("LESSON_BUNDLES_TABLE_NAME", "lesson_bundles_test_table"),
+}
+
 _LAMBDA_LANGUAGES_TABLE_RESOURCE = {
-    "resource": boto3.resource("dynamodb"),
+    "resource": LazyResource("dynamodb"),
     "table_name": environ.get("LANGUAGES_TABLE_NAME", "languages_test_table"),
 }
 
 _LAMBDA_CONNECTIONS_TABLE_RESOURCE = {
-    "resource": boto3.resource("dynamodb"),
+    "resource": LazyResource("dynamodb"),
     "table_name": environ.get("CONNECTIONS_TABLE_NAME", "connections_test_table"),
 }
 
 _LAMBDA_CHAT_ROOM_TABLE_RESOURCE = {
-    "resource": boto3.resource("dynamodb"),
+    "resource": LazyResource("dynamodb"),
     "table_name": environ.get("CHAT_ROOM_TABLE_NAME", "chat_room_test_table"),
 }
 
+_LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE = {
+    "resource": LazyResource("dynamodb"),
+    "table_name": environ.get(
+        "CONNECTION_ROOMS_TABLE_NAME", "connection_rooms_test_table"
+    ),
+}
+
 _LAMBDA_ITEMS_TABLE_RESOURCE = {
-    "resource": boto3.resource("dynamodb"),
+    "resource": LazyResource("dynamodb"),
     "table_name": environ.get("ITEMS_TABLE_NAME", "items_test_table"),
 }
 
 _LAMBDA_BATTLEPASS_TABLE_RESOURCE = {
-    "resource": boto3.resource("dynamodb"),
+    "resource": LazyResource("dynamodb"),
     "table_name": environ.get("BATTLEPASS_TABLE_NAME", "battlepass_test_table"),
 }
 
 _LAMBDA_ACHIEVEMENTS_TABLE_RESOURCE = {
-    "resource": boto3.resource("dynamodb"),
+    "resource": LazyResource("dynamodb"),
     "table_name": environ.get("ACHIEVEMENTS_TABLE_NAME", "achievements_test_table"),
 }
 
@@ -61,15 +206,195 @@ class LambdaDynamoDBClass:
         self.table = self.resource.Table(self.table_name)
 
 
-def get_secrets_from_aws_secrets_manager(secret_id, region_name):
+# BatchGetItem accepts at most 100 keys per request and may return part of
+# them as UnprocessedKeys when throttled, those are retried with backoff
+BATCH_GET_MAX_KEYS = 100
+BATCH_GET_MAX_ATTEMPTS = int(environ.get("BATCH_GET_MAX_ATTEMPTS", 5))
+BATCH_GET_BACKOFF_SECONDS = 0.05
+
+
+def batch_get_items(resource, request_items, projections=None):
+    """
+    Fetch items from one or more tables with BatchGetItem.
+
+    Keys are sent in chunks of BATCH_GET_MAX_KEYS and unprocessed keys are
+    retried with exponential backoff. Keys that are still unprocessed after
+    BATCH_GET_MAX_ATTEMPTS are logged and left out of the result, the same as
+    keys without an item.
+
+    Parameters:
+        resource: DynamoDB service resource
+        request_items: dict {table_name: list of key dicts}, keys must be unique
+        projections: optional dict {table_name: ProjectionExpression}, to only
+                     read some attributes of that table's items
+
+    Returns:
+        dict {table_name: list of found items}, in no particular order
+    """
+    results = {table_name: [] for table_name in request_items}
+    pending = [
+        (table_name, key)
+        for table_name, keys in request_items.items()
+        for key in keys
+    ]
+
+    for start in range(0, len(pending), BATCH_GET_MAX_KEYS):
+        chunk = {}
+        for table_name, key in pending[start : start + BATCH_GET_MAX_KEYS]:
+            if table_name not in chunk:
+                chunk[table_name] = {"Keys": []}
+                if projections and table_name in projections:
+                    chunk[table_name]["ProjectionExpression"] = projections[table_name]
+
+            chunk[table_name]["Keys"].append(key)
+
+        for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+            if attempt:
+                time.sleep(BATCH_GET_BACKOFF_SECONDS * 2 ** (attempt - 1))
+
+            response = resource.batch_get_item(RequestItems=chunk)
+            for table_name, items in response.get("Responses", {}).items():
+                results[table_name].extend(items)
+
+            chunk = response.get("UnprocessedKeys") or {}
+            if not chunk:
+                break
+        else:
+            logger.error(
+                "Giving up on %s unprocessed keys after %s attempts",
+                sum(len(request["Keys"]) for request in chunk.values()),
+                BATCH_GET_MAX_ATTEMPTS,
+            )
+
+    return results
+
+
+def get_secrets_from_aws_secrets_manager(
+    secret_id, region_name, version_stage="AWSCURRENT"
+):
+    """
+    Return the secret as a dict, served from the container cache when possible.
+
+    Entries live for SECRETS_CACHE_TTL_SECONDS. Within the last
+    SECRETS_CACHE_REFRESH_AHEAD_SECONDS of that window the cached value is still
+    returned while a background thread fetches a fresh copy. If a fetch fails,
+    the last known value is returned instead of None.
+
+    :param secret_id: Name or ARN of the secret.
+    :param region_name: Region where the secret is stored.
+    :param version_stage: Secret version stage (AWSCURRENT or AWSPREVIOUS).
+    :return: Parsed secret dict or None if it could not be retrieved.
+    """
+    cache_key = (secret_id, region_name, version_stage)
+    now = time.monotonic()
+
+    entry = _SECRETS_CACHE.get(cache_key)
+    if entry and now < entry["expires_at"]:
+        _count_secrets_cache("hits")
+
+        if now >= entry["expires_at"] - SECRETS_CACHE_REFRESH_AHEAD_SECONDS:
+            _refresh_secret_in_background(cache_key)
+
+        return entry["value"]
+
+    _count_secrets_cache("misses")
+    return _load_secret_into_cache(cache_key)
+
+
+def refresh_secrets_from_aws_secrets_manager(
+    secret_id, region_name, version_stage="AWSCURRENT"
+):
+    """
+    Re-fetch a secret ignoring its TTL, e.g. after a signature mismatch that
+    may be caused by a rotation. To keep invalid tokens from turning into
+    Secrets Manager calls, entries younger than SECRETS_CACHE_MIN_REFRESH_SECONDS
+    are returned as they are.
+    """
+    cache_key = (secret_id, region_name, version_stage)
+
+    entry = _SECRETS_CACHE.get(cache_key)
+    if entry and time.monotonic() - entry["loaded_at"] < SECRETS_CACHE_MIN_REFRESH_SECONDS:
+        return entry["value"]
+
+    _count_secrets_cache("refreshes")
+    return _load_secret_into_cache(cache_key)
+
+
+def get_secrets_cache_stats():
+    with _SECRETS_CACHE_LOCK:
+        return dict(_SECRETS_CACHE_STATS, size=len(_SECRETS_CACHE))
+
+
+def clear_secrets_cache():
+    with _SECRETS_CACHE_LOCK:
+        _SECRETS_CACHE.clear()
+
+
+def _count_secrets_cache(stat):
+    # The background refresh thread updates the counters too
+    with _SECRETS_CACHE_LOCK:
+        _SECRETS_CACHE_STATS[stat] += 1
+
+
+def _load_secret_into_cache(cache_key):
+    secret_id, region_name, version_stage = cache_key
+    secret = _fetch_secret(secret_id, region_name, version_stage)
+
+    with _SECRETS_CACHE_LOCK:
+        entry = _SECRETS_CACHE.get(cache_key)
+
+        now = time.monotonic()
+
+        if secret is None:
+            _SECRETS_CACHE_STATS["errors"] += 1
+            if entry and entry["value"] is not None:
+                logger.warning("Serving stale secret %s (%s)", secret_id, version_stage)
+                entry["refreshing"] = False
+                return entry["value"]
+
+            # Older version stages may legitimately not exist, remember that
+            # for a while instead of asking again on every invalid token
+            if version_stage != "AWSCURRENT":
+                _SECRETS_CACHE[cache_key] = {
+                    "value": None,
+                    "loaded_at": now,
+                    "expires_at": now + SECRETS_CACHE_MIN_REFRESH_SECONDS,
+                    "refreshing": False,
+                }
+            return None
+
+        _SECRETS_CACHE[cache_key] = {
+            "value": secret,
+            "loaded_at": now,
+            "expires_at": now + SECRETS_CACHE_TTL_SECONDS,
+            "refreshing": False,
+        }
+
+    return secret
+
+
+def _refresh_secret_in_background(cache_key):
+    with _SECRETS_CACHE_LOCK:
+        entry = _SECRETS_CACHE.get(cache_key)
+        if not entry or entry["refreshing"]:
+            return
+        entry["refreshing"] = True
+        _SECRETS_CACHE_STATS["refreshes"] += 1
+
+    threading.Thread(
+        target=_load_secret_into_cache, args=(cache_key,), daemon=True
+    ).start()
+
+
+def _fetch_secret(secret_id, region_name, version_stage="AWSCURRENT"):
     try:
-        secrets_manager = boto3.client(
-            service_name="secretsmanager", region_name=region_name
-        )
+        secrets_manager = get_client("secretsmanager", region_name=region_name)
 
-        secret_string = secrets_manager.get_secret_value(SecretId=secret_id)
+        secret_string = secrets_manager.get_secret_value(
+            SecretId=secret_id, VersionStage=version_stage
+        )
 
         return json.loads(secret_string["SecretString"])
     except Exception as e:
-        logger.error(f"Failed to retrieve secrets: {str(e)}")
+        logger.error("Failed to retrieve secrets: %s", e)
         return None
@@ -0,0 +1,152 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from log import get_logger
+from rooms import delete_empty_room, remove_room_memberships
+
+logger = get_logger("broadcast")
+
+# Posts to the connections of a room run concurrently on a shared pool, the
+# management API client is thread safe
+BROADCAST_MAX_WORKERS = int(environ.get("BROADCAST_MAX_WORKERS", 16))
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def post_to_connections(ws, connection_ids, message):
+    """
+    Send a message to several WebSocket connections concurrently.
+
+    Parameters:
+        ws: API Gateway management API client
+        connection_ids (list): Connections to send the message to
+        message (dict): Message, sent as JSON
+
+    Returns:
+        list: Connection IDs that are gone and should be removed
+    """
+    data = json.dumps(message).encode("utf-8")
+    connection_ids = list(connection_ids)
+
+    if len(connection_ids) <= 1:
+        results = [_post(ws, connection_id, data) for connection_id in connection_ids]
+    else:
+        results = _get_executor().map(
+            lambda connection_id: _post(ws, connection_id, data), connection_ids
+        )
+
+    return [
+        connection_id
+        for connection_id, delivered in zip(connection_ids, results)
+        if not delivered
+    ]
+
+
+def remove_room_connections(dynamodb, room_id, connection_ids):
+    """
+    Remove connections from a room's user_connections map in one update and
+    bump the room version. A room left without connections is deleted.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for chat room table
+        room_id (str): Chat room ID
+        connection_ids (list): Connections to remove
+    """
+    if not connection_ids:
+        return
+
+    from botocore.exceptions import ClientError
+
+    logger.info("Removing stale connections %s from room %s", connection_ids, room_id)
+
+    names = {
+        f"#conn{index}": connection_id
+        for index, connection_id in enumerate(connection_ids)
+    }
+    try:
+        response = dynamodb.table.update_item(
+            Key={"chat_id": room_id},
+            UpdateExpression="REMOVE "
+            + ", ".join(f"user_connections.{name}" for name in names)
+            + " ADD version :one",
+            ConditionExpression="attribute_exists(chat_id)",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={":one": 1},
+            ReturnValues="UPDATED_NEW",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+        logger.info("Room %s no longer exists", room_id)
+        return
+
+    if not response["Attributes"].get("user_connections"):
+        logger.info("No connections left in room %s, deleting it", room_id)
+        delete_empty_room(dynamodb, room_id)
+
+
+def broadcast_to_room(
+    ws, dynamodb, connection_rooms_db, room_id, connection_ids, message
+):
+    """
+    Send a message to connections of a room and remove the ones that are gone,
+    together with their room memberships.
+
+    Parameters:
+        ws: API Gateway management API client
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for chat room table
+        connection_rooms_db (LambdaDynamoDBClass): DynamoDB client for
+                                                   connection rooms table
+        room_id (str): Chat room ID
+        connection_ids (list): Connections to send the message to
+        message (dict): Message, sent as JSON
+
+    Returns:
+        list: Connection IDs that were gone
+    """
+    gone_connection_ids = post_to_connections(ws, connection_ids, message)
+    if not gone_connection_ids:
+        return gone_connection_ids
+
+    remove_room_connections(dynamodb, room_id, gone_connection_ids)
+    remove_room_memberships(
+        connection_rooms_db,
+        [
+            {"connection_id": connection_id, "chat_id": room_id}
+            for connection_id in gone_connection_ids
+        ],
+    )
+
+    return gone_connection_ids
+
+
+def _post(ws, connection_id, data):
+    from botocore.exceptions import ClientError
+
+    try:
+        ws.post_to_connection(ConnectionId=connection_id, Data=data)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "GoneException":
+            logger.info("Stale connection: %s", connection_id)
+            return False
+
+        logger.error("Error posting to %s: %s", connection_id, e)
+
+    return True
+
+
+def _get_executor():
+    global _EXECUTOR
+
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(
+                    max_workers=BROADCAST_MAX_WORKERS,
+                    thread_name_prefix="broadcast",
+                )
+
+    return _EXECUTOR
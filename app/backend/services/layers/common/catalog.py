@@ -0,0 +1,137 @@
+import threading
+from os import environ
+from boto import batch_get_items
+from log import get_logger
+from snapshot import Catalog, TtlSnapshot, scan_all
+
+logger = get_logger("catalog")
+
+# The items table only changes when the shop is updated, so the whole catalog
+# is kept per warm container and reloaded after ITEMS_CATALOG_TTL_SECONDS
+ITEMS_CATALOG_TTL_SECONDS = int(environ.get("ITEMS_CATALOG_TTL_SECONDS", 300))
+
+# Guards items added to a loaded catalog
+_CATALOG_LOCK = threading.Lock()
+
+
+class ItemsCatalog(Catalog):
+    """
+    Snapshot of the items table indexed by id and category.
+    """
+
+    def __init__(self, items):
+        self.by_category = {}
+        # Ids read from the table and not found, so they aren't read again
+        # until the catalog is reloaded
+        self.missing_ids = set()
+        super().__init__(items)
+
+    def add(self, item):
+        if not super().add(item):
+            return False
+
+        self.by_category.setdefault((item.get("category") or "").lower(), []).append(
+            item
+        )
+        return True
+
+    def category(self, category):
+        return self.by_category.get(category.lower(), [])
+
+
+def _load_items_catalog(dynamodb):
+    catalog = ItemsCatalog(scan_all(dynamodb))
+    logger.info("Loaded %s items into the catalog", len(catalog))
+
+    return catalog
+
+
+_ITEMS_CATALOG = TtlSnapshot(_load_items_catalog, ITEMS_CATALOG_TTL_SECONDS)
+
+
+def get_items_catalog(dynamodb):
+    """
+    Return the cached items catalog, loading it when missing or expired.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for items table
+
+    Returns:
+        ItemsCatalog
+    """
+    return _ITEMS_CATALOG.get(dynamodb)
+
+
+def get_catalog_item(dynamodb, item_id):
+    """
+    Look up a single item in the catalog. Items added to the table after the
+    catalog was loaded are read directly and added to it.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for items table
+        item_id (str): ID of the item
+
+    Returns:
+        dict: Item or None if it doesn't exist
+    """
+    catalog = get_items_catalog(dynamodb)
+
+    item = catalog.get(item_id)
+    if item is None and item_id not in catalog.missing_ids:
+        logger.debug("Item %s not in the catalog, reading it from the table", item_id)
+        item = dynamodb.table.get_item(Key={"id": item_id}).get("Item")
+        with _CATALOG_LOCK:
+            if item:
+                catalog.add(item)
+            else:
+                catalog.missing_ids.add(item_id)
+
+    return item
+
+
+def get_catalog_items(dynamodb, item_ids):
+    """
+    Look up several items in the catalog. Items the catalog doesn't know are
+    read with one BatchGetItem and added to it, ids that don't exist are
+    remembered so they aren't read again until the catalog is reloaded.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for items table
+        item_ids (list): IDs of the items
+
+    Returns:
+        dict: {item_id: item} for the items that exist
+    """
+    catalog = get_items_catalog(dynamodb)
+
+    unknown_ids = [
+        item_id
+        for item_id in dict.fromkeys(item_ids)
+        if item_id
+        and item_id not in catalog.by_id
+        and item_id not in catalog.missing_ids
+    ]
+    if unknown_ids:
+        logger.info("Fetching %s items missing from the catalog", len(unknown_ids))
+
+        found_items = batch_get_items(
+            dynamodb.resource,
+            {dynamodb.table_name: [{"id": item_id} for item_id in unknown_ids]},
+        )[dynamodb.table_name]
+
+        with _CATALOG_LOCK:
+            for item in found_items:
+                catalog.add(item)
+            catalog.missing_ids.update(
+                item_id for item_id in unknown_ids if item_id not in catalog.by_id
+            )
+
+    return {
+        item_id: catalog.by_id[item_id]
+        for item_id in item_ids
+        if item_id in catalog.by_id
+    }
+
+
+def clear_items_catalog():
+    _ITEMS_CATALOG.clear()
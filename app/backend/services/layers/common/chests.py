@@ -0,0 +1,143 @@
+import random
+import threading
+from log import get_logger
+from catalog import get_items_catalog
+
+logger = get_logger("chests")
+
+# Samplers are built from the cached items catalog and rebuilt when the catalog
+# is reloaded, so chest contents are picked up together with shop changes
+_SAMPLER_CACHE = {}
+_SAMPLER_LOCK = threading.Lock()
+
+
+class ChestSampler:
+    """
+    Weighted sampler for the rewards of a chest, using Vose's alias method.
+
+    Building the tables is O(n) in the number of rewards, every draw after
+    that is O(1). Rewards with a win_percentage of zero or less are never
+    drawn. The reward dicts come from the catalog and are shared between
+    requests, copy them before modifying.
+    """
+
+    def __init__(self, rewards):
+        rewards = [
+            reward for reward in rewards
+            if float(reward.get("win_percentage", 0)) > 0
+        ]
+        if not rewards:
+            raise ValueError("Chest has no rewards that can be won")
+
+        weights = [float(reward["win_percentage"]) for reward in rewards]
+        total_weight = sum(weights)
+        if abs(total_weight - 100) > 0.01:
+            logger.warning("Win percentages sum to %s, not 100", total_weight)
+
+        size = len(rewards)
+        self.rewards = rewards
+        self.probability = [0.0] * size
+        self.alias = list(range(size))
+
+        # Scale weights so the average column holds exactly 1
+        scaled = [weight * size / total_weight for weight in weights]
+        small = [index for index, weight in enumerate(scaled) if weight < 1]
+        large = [index for index, weight in enumerate(scaled) if weight >= 1]
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+
+            scaled[more] = scaled[more] + scaled[less] - 1
+            if scaled[more] < 1:
+                small.append(more)
+            else:
+                large.append(more)
+
+        # Whatever is left is full up to floating point error
+        for index in small + large:
+            self.probability[index] = 1.0
+
+    def sample(self, rng=random):
+        """
+        Draw a single reward.
+
+        Parameters:
+            rng: Source of randomness with random(), the random module by default
+
+        Returns:
+            dict: Reward from the chest's effect
+        """
+        return self.sample_many(1, rng)[0]
+
+    def sample_many(self, count, rng=random):
+        """
+        Draw count rewards independently.
+
+        Parameters:
+            count (int): Number of rewards to draw
+            rng: Source of randomness with random(), the random module by default
+
+        Returns:
+            list: Rewards in the order they were drawn
+        """
+        size = len(self.rewards)
+        probability, alias, rewards = self.probability, self.alias, self.rewards
+
+        drawn = []
+        for _ in range(count):
+            column = rng.random() * size
+            index = int(column)
+            # The fractional part decides between the column and its alias
+            if column - index >= probability[index]:
+                index = alias[index]
+            drawn.append(rewards[index])
+
+        return drawn
+
+
+def get_chest_sampler(dynamodb, chest_id):
+    """
+    Return the sampler for a chest in the items catalog, building it the
+    first time the chest is opened with the current catalog.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for items table
+        chest_id (str): ID of the chest item
+
+    Returns:
+        ChestSampler: Sampler or None if the chest doesn't exist or has
+                      nothing to win
+    """
+    catalog = get_items_catalog(dynamodb)
+    cache_key = (dynamodb.table_name, chest_id)
+
+    entry = _SAMPLER_CACHE.get(cache_key)
+    if entry is not None and entry["catalog"] is catalog:
+        return entry["sampler"]
+
+    with _SAMPLER_LOCK:
+        entry = _SAMPLER_CACHE.get(cache_key)
+        if entry is not None and entry["catalog"] is catalog:
+            return entry["sampler"]
+
+        chest = catalog.get(chest_id)
+        rewards = (chest or {}).get("effect", {}).get("items", [])
+
+        try:
+            sampler = ChestSampler(rewards)
+        except ValueError:
+            logger.error("Chest %s has no rewards that can be won", chest_id)
+            sampler = None
+        else:
+            logger.info("Built sampler for chest %s with %s rewards", chest_id, len(sampler.rewards))
+
+        _SAMPLER_CACHE[cache_key] = {"catalog": catalog, "sampler": sampler}
+
+    return sampler
+
+
+def clear_chest_samplers():
+    with _SAMPLER_LOCK:
+        _SAMPLER_CACHE.clear()
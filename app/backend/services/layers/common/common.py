@@ -1,17 +1,22 @@
 from datetime import datetime
 import json
-import bcrypt
-import logging
+from log import get_logger
 from decimal import Decimal
 
-logger = logging.getLogger("common")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("common")
+
+# orjson is a lot faster for large bodies like task lists and inventories,
+# the standard library encoder is used when it isn't installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 def build_response(status_code, body, headers=None):
     default_headers = {
         "Content-Type": "application/json",
-        "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token",
+        "Access-Control-Allow-Headers": "Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token,X-Task-Encoding",
         "Access-Control-Allow-Origin": "*",
         "Access-Control-Allow-Methods": "DELETE,GET,HEAD,OPTIONS,PUT,POST,PATCH",
     }
@@ -22,20 +27,52 @@ def build_response(status_code, body, headers=None):
     response = {
         "statusCode": status_code,
         "headers": default_headers,
-        "body": json.dumps(body),
+        "body": encode_json(body),
     }
 
-    logger.info(f"Response: {response}")
+    # Only the size, serialising the whole body again is expensive for large
+    # payloads like task lists and inventories
+    logger.debug(
+        "Response status %s, body %s bytes", status_code, len(response["body"])
+    )
 
     return response
 
 
+def encode_json(obj):
+    """
+    Serialise obj to a compact JSON string in a single pass.
+    Decimal values (as returned by DynamoDB) are written as numbers while
+    encoding, obj itself is not modified.
+    """
+    if orjson is not None:
+        return orjson.dumps(
+            obj, default=encode_decimal, option=orjson.OPT_NON_STR_KEYS
+        ).decode("utf-8")
+
+    return json.dumps(obj, default=encode_decimal, separators=(",", ":"))
+
+
+def encode_decimal(obj):
+    """
+    `default` hook for JSON encoders, writes DynamoDB Decimals as numbers.
+    """
+    if isinstance(obj, Decimal):
+        return float(obj)
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
 def hash_string(password, salt_rounds=5):
+    import bcrypt
+
     salt = bcrypt.gensalt(rounds=salt_rounds)
     return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
 
 
 def verify_hash_string(string, hashed_string):
+    import bcrypt
+
     logger.info("Verifying hash")
     return bcrypt.checkpw(string.encode("utf-8"), hashed_string.encode("utf-8"))
 
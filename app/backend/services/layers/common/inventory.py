@@ -0,0 +1,212 @@
+from log import get_logger
+
+logger = get_logger("inventory")
+
+# items_inventory is a map of item ID to quantity, updated in place with ADD.
+# Older users still hold a list of item IDs (with one entry per unit, chest
+# rewards as {"item_id", "quantity"} dicts), it is rewritten as a map the
+# first time the inventory is read or written.
+INVENTORY_ATTRIBUTE = "items_inventory"
+
+# Condition for updates that change inventory paths, which only works once the
+# inventory is a map
+COUNTED_INVENTORY_CONDITION = "attribute_type(items_inventory, :inventory_type)"
+COUNTED_INVENTORY_VALUES = {":inventory_type": "M"}
+
+
+def is_counted_inventory(items_inventory):
+    return isinstance(items_inventory, dict)
+
+
+def inventory_counts(items_inventory):
+    """
+    Quantity per item ID for an inventory in either format, items the user
+    no longer has are left out.
+
+    Parameters:
+        items_inventory: Map of item ID to quantity, or legacy list
+
+    Returns:
+        dict: {item_id: quantity}
+    """
+    if is_counted_inventory(items_inventory):
+        return {
+            item_id: quantity
+            for item_id, quantity in items_inventory.items()
+            if quantity > 0
+        }
+
+    counts = {}
+    for entry in items_inventory or []:
+        if isinstance(entry, dict):
+            item_id, quantity = entry.get("item_id"), entry.get("quantity", 1)
+        else:
+            item_id, quantity = entry, 1
+
+        if item_id:
+            counts[item_id] = counts.get(item_id, 0) + quantity
+
+    return counts
+
+
+def migrate_inventory(dynamodb, email, items_inventory):
+    """
+    Rewrite a legacy list inventory as a map, unless it changed since it was
+    read.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for users table
+        email (str): User's email
+        items_inventory: Inventory as it was read, list or None
+
+    Returns:
+        dict: The stored map, or None if the inventory changed in the meantime
+    """
+    from botocore.exceptions import ClientError
+
+    counts = inventory_counts(items_inventory)
+    logger.info("Migrating inventory of user %s to %s item counts", email, len(counts))
+
+    if items_inventory is None:
+        condition_expression = "attribute_exists(email) AND attribute_not_exists(items_inventory)"
+        expression_attribute_values = {":inventory": counts}
+    else:
+        condition_expression = "items_inventory = :old_inventory"
+        expression_attribute_values = {
+            ":inventory": counts,
+            ":old_inventory": items_inventory,
+        }
+
+    try:
+        dynamodb.table.update_item(
+            Key={"email": email},
+            UpdateExpression="SET items_inventory = :inventory",
+            ConditionExpression=condition_expression,
+            ExpressionAttributeValues=expression_attribute_values,
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+        logger.info("Inventory of user %s changed while migrating it", email)
+        return None
+
+    return counts
+
+
+def ensure_counted_inventory(dynamodb, email):
+    """
+    Migrate a user's inventory if it is still a list. Used when an update
+    conditioned on COUNTED_INVENTORY_CONDITION failed, to tell a legacy
+    inventory apart from the update's own conditions.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for users table
+        email (str): User's email
+
+    Returns:
+        bool: True if the inventory was migrated and the update can be retried
+    """
+    user = dynamodb.table.get_item(
+        Key={"email": email},
+        ProjectionExpression="email, items_inventory",
+        ConsistentRead=True,
+    ).get("Item")
+
+    if not user or is_counted_inventory(user.get(INVENTORY_ATTRIBUTE)):
+        return False
+
+    return migrate_inventory(dynamodb, email, user.get(INVENTORY_ATTRIBUTE)) is not None
+
+
+def update_user_inventory(
+    dynamodb,
+    email,
+    quantities=None,
+    remove_items=(),
+    set_expression=None,
+    condition_expression=None,
+    expression_attribute_names=None,
+    expression_attribute_values=None,
+    **kwargs,
+):
+    """
+    Change item quantities, and optionally other attributes, of a user in
+    one conditional update.
+
+    The update requires a counted inventory. When it fails because the user
+    still has a legacy list, the inventory is migrated and the update is
+    retried once.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for users table
+        email (str): User's email
+        quantities (dict): {item_id: quantity to add}, negative to take away
+        remove_items (list): Item IDs to remove from the inventory
+        set_expression (str): SET actions for other attributes, without "SET"
+        condition_expression (str): Condition of the caller
+        expression_attribute_names (dict): Names used by the caller
+        expression_attribute_values (dict): Values used by the caller
+        **kwargs: Passed on to update_item (ReturnValues, ...)
+
+    Returns:
+        dict: update_item response
+
+    Raises:
+        ClientError: ConditionalCheckFailedException if the caller's condition
+                     failed or the user doesn't exist
+    """
+    from botocore.exceptions import ClientError
+
+    names = dict(expression_attribute_names or {})
+    values = dict(expression_attribute_values or {}, **COUNTED_INVENTORY_VALUES)
+    clauses = []
+
+    if set_expression:
+        clauses.append("SET " + set_expression)
+
+    additions = []
+    for index, (item_id, quantity) in enumerate((quantities or {}).items()):
+        if not quantity:
+            continue
+
+        names[f"#inventory_add{index}"] = item_id
+        values[f":inventory_add{index}"] = quantity
+        additions.append(f"items_inventory.#inventory_add{index} :inventory_add{index}")
+
+    if additions:
+        clauses.append("ADD " + ", ".join(additions))
+
+    removals = []
+    for index, item_id in enumerate(remove_items):
+        names[f"#inventory_remove{index}"] = item_id
+        removals.append(f"items_inventory.#inventory_remove{index}")
+
+    if removals:
+        clauses.append("REMOVE " + ", ".join(removals))
+
+    update_params = dict(
+        kwargs,
+        Key={"email": email},
+        UpdateExpression=" ".join(clauses),
+        ConditionExpression=(
+            f"({condition_expression}) AND {COUNTED_INVENTORY_CONDITION}"
+            if condition_expression
+            else COUNTED_INVENTORY_CONDITION
+        ),
+        ExpressionAttributeValues=values,
+    )
+    if names:
+        update_params["ExpressionAttributeNames"] = names
+
+    try:
+        return dynamodb.table.update_item(**update_params)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+        if not ensure_counted_inventory(dynamodb, email):
+            raise
+
+    logger.info("Retrying update of user %s with a counted inventory", email)
+    return dynamodb.table.update_item(**update_params)
@@ -0,0 +1,78 @@
+from os import environ
+from log import get_logger
+from snapshot import Catalog, TtlSnapshot, scan_all
+
+logger = get_logger("languages")
+
+# The languages table holds a handful of rows that rarely change, so the whole
+# table is kept per warm container and reloaded after LANGUAGES_CATALOG_TTL_SECONDS
+LANGUAGES_CATALOG_TTL_SECONDS = int(
+    environ.get("LANGUAGES_CATALOG_TTL_SECONDS", 300)
+)
+
+
+class LanguagesCatalog(Catalog):
+    """
+    Snapshot of the languages table indexed by id.
+    """
+
+    @property
+    def languages(self):
+        return self.items
+
+
+def _load_languages_catalog(dynamodb):
+    catalog = LanguagesCatalog(scan_all(dynamodb))
+    logger.info("Loaded %s languages into the catalog", len(catalog))
+
+    return catalog
+
+
+_LANGUAGES_CATALOG = TtlSnapshot(_load_languages_catalog, LANGUAGES_CATALOG_TTL_SECONDS)
+
+
+def get_languages_catalog(dynamodb):
+    """
+    Return the cached languages catalog, loading it when missing or expired.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for languages table
+
+    Returns:
+        LanguagesCatalog
+    """
+    return _LANGUAGES_CATALOG.get(dynamodb)
+
+
+def get_language(dynamodb, language_id):
+    """
+    Look up a single language in the catalog.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for languages table
+        language_id (str): ID of the language
+
+    Returns:
+        dict: Language or None if it doesn't exist
+    """
+    if not language_id:
+        return None
+
+    return get_languages_catalog(dynamodb).get(language_id)
+
+
+def get_all_languages(dynamodb):
+    """
+    Return every language in the catalog.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for languages table
+
+    Returns:
+        list: Languages, shared between requests
+    """
+    return get_languages_catalog(dynamodb).languages
+
+
+def clear_languages_catalog():
+    _LANGUAGES_CATALOG.clear()
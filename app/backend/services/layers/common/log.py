@@ -0,0 +1,144 @@
+import json
+import logging
+import random
+import threading
+from datetime import datetime, timezone
+from os import environ
+
+# Level for every logger created through get_logger. Debug logs can also be
+# turned on for a sample of requests, so they are available when debugging
+# without paying for them on every invocation.
+LOG_LEVEL = (
+    environ.get("LOG_LEVEL") or environ.get("AWS_LAMBDA_LOG_LEVEL") or "INFO"
+).upper()
+LOG_DEBUG_SAMPLE_RATE = float(environ.get("LOG_DEBUG_SAMPLE_RATE", 0))
+
+# Attributes every LogRecord has, anything else was passed through `extra`
+_RECORD_ATTRIBUTES = set(
+    logging.LogRecord("", 0, "", 0, "", None, None).__dict__
+) | {"message", "asctime", "aws_request_id"}
+
+_LOGGERS = {}
+_LOGGERS_LOCK = threading.Lock()
+_STATE = {"configured": False, "level": None, "request_id": None}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line, so CloudWatch Logs Insights
+    can filter on the fields directly.
+    """
+
+    def format(self, record):
+        log = {
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            # The Lambda runtime sets aws_request_id on records it handles,
+            # otherwise use the request the middleware started
+            "request_id": getattr(record, "aws_request_id", None)
+            or _STATE["request_id"],
+        }
+
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                log[key] = value
+
+        if record.exc_info:
+            log["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(log, default=str)
+
+
+def configure_logging():
+    """
+    Use the JSON formatter for the root handlers. In Lambda the runtime has
+    already installed a handler. Outside of it nothing is added, so tests and
+    scripts keep Python's default output.
+    """
+    with _LOGGERS_LOCK:
+        if _STATE["configured"]:
+            return
+        _STATE["configured"] = True
+
+    root = logging.getLogger()
+    if not root.handlers and environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+        root.addHandler(logging.StreamHandler())
+
+    for handler in root.handlers:
+        handler.setFormatter(JsonFormatter())
+
+    _STATE["level"] = _sample_level()
+
+
+def get_logger(name):
+    """
+    Return the named logger at the configured level.
+
+    Parameters:
+        name: Logger name, usually the handler or module name
+
+    Returns:
+        logging.Logger
+    """
+    configure_logging()
+
+    logger = _LOGGERS.get(name)
+    if logger is None:
+        logger = logging.getLogger(name)
+        logger.setLevel(_STATE["level"])
+        _LOGGERS[name] = logger
+
+    return logger
+
+
+def start_request(context):
+    """
+    Attach the request id to the following log records and decide whether
+    debug logs are sampled for this request. Handlers call this first, the
+    middleware does it for the ones it wraps.
+
+    Parameters:
+        context: Lambda context object (may be None or a plain dict in tests)
+    """
+    configure_logging()
+
+    _STATE["request_id"] = getattr(context, "aws_request_id", None)
+
+    level = _sample_level()
+    if level != _STATE["level"]:
+        _STATE["level"] = level
+        for logger in list(_LOGGERS.values()):
+            logger.setLevel(level)
+
+
+def log_event(logger, event):
+    """
+    Log a short summary of the incoming event at DEBUG.
+    The full event isn't logged, it contains tokens and can be large.
+    """
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+
+    request_context = event.get("requestContext") or {}
+    body = event.get("body")
+
+    logger.debug(
+        "Received event",
+        extra={
+            "http_method": event.get("httpMethod"),
+            "path": event.get("path"),
+            "route_key": request_context.get("routeKey"),
+            "connection_id": request_context.get("connectionId"),
+            "query_params": sorted(event.get("queryStringParameters") or {}),
+            "body_size": len(body) if isinstance(body, str) else None,
+        },
+    )
+
+
+def _sample_level():
+    if LOG_DEBUG_SAMPLE_RATE and random.random() < LOG_DEBUG_SAMPLE_RATE:
+        return logging.DEBUG
+
+    return LOG_LEVEL
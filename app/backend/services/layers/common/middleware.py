@@ -1,18 +1,35 @@
-from aws_lambda_powertools.middleware_factory import lambda_handler_decorator
 from common import build_response
-from auth import get_expiration_time, get_email_from_refresh_token
+from auth import (
+    AUTH_CONTEXT_EVENT_KEY,
+    AuthContext,
+    get_expiration_time,
+    get_jwt_secrets,
+    decode_token,
+)
 from datetime import timedelta
-from os import environ
-from boto import get_secrets_from_aws_secrets_manager
-import logging
-import jwt
+from functools import wraps
+from log import get_logger, start_request
 
-logger = logging.getLogger("middleware")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("middleware")
 
 
-@lambda_handler_decorator
-def middleware(handler, event, context):
+def middleware(handler):
+    """
+    Decorate a lambda handler so it only runs for requests with a valid token.
+    This is a plain wrapper instead of powertools' lambda_handler_decorator,
+    so importing the layer doesn't load aws_lambda_powertools.
+    """
+
+    @wraps(handler)
+    def wrapper(event, context):
+        start_request(context)
+
+        return authenticate_and_call(handler, event, context)
+
+    return wrapper
+
+
+def authenticate_and_call(handler, event, context):
     event_headers = event.get("headers")
     authorization = event_headers.get("Authorization") or event_headers.get(
         "authorization"
@@ -28,9 +45,7 @@ def middleware(handler, event, context):
     )
     refresh_token = event_headers.get("x-refresh-token")
 
-    logger.info(f"Received event in the middleware: {event_headers}")
-
-    result = validate_jwt_token(access_token, refresh_token)
+    result, claims = validate_jwt_token(access_token, refresh_token)
 
     if result["statusCode"] != 200:
         logger.info("JWT token validation failed, returning to the client")
@@ -40,77 +55,99 @@ def middleware(handler, event, context):
     logger.info("JWT token validation passed, continuing to the handler")
 
     try:
-        logger.debug(f"Authorization header: {authorization}")
-
         event["headers"]["x-access-token"] = access_token
+        event[AUTH_CONTEXT_EVENT_KEY] = AuthContext.from_claims(claims)
 
         event["headers"].pop("Authorization", None)
         event["headers"].pop("authorization", None)
 
         return handler(event, context)
     except TypeError as e:
-        logger.error(f"Error in the handler: {e}")
+        logger.error("Error in the handler: %s", e)
 
         return build_response(422, {"message": f"Invalid request body: {e}"})
     except Exception as e:
-        logger.error(f"Error in the handler: {e}")
+        logger.error("Error in the handler: %s", e)
 
         return build_response(500, {"message": "Internal server error"})
 
 
 def validate_refresh_token(refresh_token, refresh_secret, jwt_secret):
+    response, _ = exchange_refresh_token(refresh_token, refresh_secret, jwt_secret)
+
+    return response
+
+
+def exchange_refresh_token(refresh_token, refresh_secret, jwt_secret):
+    """
+    Verify a refresh token and issue a new access token for it.
+
+    Returns:
+        tuple (response, claims) where claims are the new access token's
+        claims, or None if the refresh token is invalid
+    """
+    import jwt
+
     try:
         logger.debug("Verifying refresh token")
-        jwt.decode(refresh_token, refresh_secret, algorithms=["HS256"])
+        refresh_claims = jwt.decode(refresh_token, refresh_secret, algorithms=["HS256"])
 
         logger.info("Refresh token verified successfully, creating new JWT token")
         expiration_time = get_expiration_time(timedelta(hours=1))
-        user_email = get_email_from_refresh_token(refresh_token)
-        new_jwt_token = jwt.encode(
-            {"email": user_email, "exp": expiration_time}, jwt_secret, algorithm="HS256"
-        )
-
-        logger.info(f"New JWT token created successfully for email: {user_email}")
-        return build_response(
-            200,
-            {
-                "message": "JWT token verified successfully",
-                "x-access-token": new_jwt_token,
-            },
-            {"x-access-token": new_jwt_token, "Content-Type": "application/json"},
+        user_email = refresh_claims.get("email")
+        claims = {"email": user_email, "exp": expiration_time}
+        new_jwt_token = jwt.encode(claims, jwt_secret, algorithm="HS256")
+
+        logger.info("New JWT token created successfully for email: %s", user_email)
+        return (
+            build_response(
+                200,
+                {
+                    "message": "JWT token verified successfully",
+                    "x-access-token": new_jwt_token,
+                },
+                {"x-access-token": new_jwt_token, "Content-Type": "application/json"},
+            ),
+            claims,
         )
     except Exception as e:
-        logger.error(f"Error verifying refresh token: {e}")
+        logger.error("Error verifying refresh token: %s", e)
 
-        return build_response(401, {"message": "Token expired"})
+        return build_response(401, {"message": "Token expired"}), None
 
 
 def validate_jwt_token(access_token, refresh_token):
-    logger.info(f"Validating JWT token: {access_token}")
+    """
+    Validate the access token, falling back to the refresh token when it expired.
 
-    logger.debug(f"Secret name: {environ.get("JWT_SECRET_NAME")}")
-    logger.debug(f"Region name: {environ.get("SECRETS_REGION_NAME")}")
-    secrets = get_secrets_from_aws_secrets_manager(
-        environ.get("JWT_SECRET_NAME"), environ.get("SECRETS_REGION_NAME")
-    )
+    Returns:
+        tuple (result, claims) where result has statusCode 200 on success and
+        claims are the decoded access token claims (None on failure)
+    """
+    import jwt
+
+    logger.debug("Validating JWT token")
+
+    secrets = get_jwt_secrets()
 
     try:
         logger.debug("Verifying JWT token")
-        jwt.decode(
-            access_token.encode("utf-8"), secrets["jwt_secret"], algorithms=["HS256"]
-        )
+        claims = decode_token(access_token, "jwt_secret")
 
         logger.info("JWT token verified successfully, continuing to the handler")
 
-        return {"statusCode": 200}
+        return {"statusCode": 200}, claims
 
     except jwt.ExpiredSignatureError:
         logger.info("JWT token expired, verifying refresh token")
-        return validate_refresh_token(
+        return exchange_refresh_token(
             refresh_token, secrets["refresh_secret"], secrets["jwt_secret"]
         )
 
     except Exception as e:
-        logger.error(f"Error verifying JWT token: {e}")
+        logger.error("Error verifying JWT token: %s", e)
 
-        return build_response(401, {"message": "Invalid token, please login again"})
+        return (
+            build_response(401, {"message": "Invalid token, please login again"}),
+            None,
+        )
@@ -0,0 +1,186 @@
+import time
+from os import environ
+from log import get_logger
+from boto import batch_get_items
+
+logger = get_logger("rooms")
+
+# API Gateway closes WebSocket connections after two hours. Memberships of
+# connections whose $disconnect never ran are expired by DynamoDB TTL.
+CONNECTION_ROOM_TTL_SECONDS = int(
+    environ.get("CONNECTION_ROOM_TTL_SECONDS", 3 * 60 * 60)
+)
+
+
+def add_room_membership(
+    dynamodb, connection_id, room_id, peer_id, peers=None, room_version=None
+):
+    """
+    Record that a connection is in a room, so disconnect cleanup can find its
+    rooms without scanning the chat rooms table.
+
+    The membership doubles as the connection's room session: it carries a copy
+    of the room's user_connections and the room version it was taken at, so
+    room events can be broadcast without reading the chat room item.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for connection rooms table
+        connection_id (str): WebSocket connection ID
+        room_id (str): Chat room ID
+        peer_id (str): Peer ID of the connection in the room
+        peers (dict): Room's user_connections, connection ID → peer ID
+        room_version (int): Room version the peers were read at
+
+    Returns:
+        dict: The stored membership item
+    """
+    logger.debug("Adding connection %s to room %s index", connection_id, room_id)
+
+    membership = {
+        "connection_id": connection_id,
+        "chat_id": room_id,
+        "peer_id": peer_id,
+        "expires_at": int(time.time()) + CONNECTION_ROOM_TTL_SECONDS,
+    }
+    if peers is not None and room_version is not None:
+        membership["peers"] = peers
+        membership["room_version"] = room_version
+
+    dynamodb.table.put_item(Item=membership)
+
+    return membership
+
+
+def get_room_session(connection_rooms_db, chat_room_db, connection_id, room_id):
+    """
+    Return the room session of a connection with an up to date peer list.
+
+    The session and the room's version are read in one BatchGetItem. Only
+    when the room changed since the session was written, the room is read
+    and the session is rewritten.
+
+    Parameters:
+        connection_rooms_db (LambdaDynamoDBClass): DynamoDB client for
+                                                   connection rooms table
+        chat_room_db (LambdaDynamoDBClass): DynamoDB client for chat room table
+        connection_id (str): WebSocket connection ID
+        room_id (str): Chat room ID
+
+    Returns:
+        dict: Membership item with peer_id and peers, or None if the room
+              doesn't exist. When the connection isn't in the room, the
+              item only has the room's peers and no peer_id.
+    """
+    connection_rooms_table = connection_rooms_db.table_name
+    chat_room_table = chat_room_db.table_name
+
+    items = batch_get_items(
+        connection_rooms_db.resource,
+        {
+            connection_rooms_table: [
+                {"connection_id": connection_id, "chat_id": room_id}
+            ],
+            chat_room_table: [{"chat_id": room_id}],
+        },
+        projections={chat_room_table: "version"},
+    )
+
+    if not items[chat_room_table]:
+        return None
+
+    room_version = items[chat_room_table][0].get("version")
+    session = next(iter(items[connection_rooms_table]), None)
+
+    if (
+        session is not None
+        and room_version is not None
+        and session.get("room_version") == room_version
+    ):
+        return session
+
+    logger.info("Refreshing room %s session of %s", room_id, connection_id)
+
+    room = chat_room_db.table.get_item(Key={"chat_id": room_id}).get("Item")
+    if not room:
+        return None
+
+    peers = room.get("user_connections", {})
+    if connection_id not in peers:
+        # Not a member, nothing to keep a session for
+        return {"chat_id": room_id, "peers": peers}
+
+    return add_room_membership(
+        connection_rooms_db,
+        connection_id,
+        room_id,
+        peers[connection_id],
+        peers,
+        room.get("version", 0),
+    )
+
+
+def get_connection_rooms(dynamodb, connection_id):
+    """
+    Return the room memberships of a connection.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for connection rooms table
+        connection_id (str): WebSocket connection ID
+
+    Returns:
+        list: Membership items with chat_id and peer_id
+    """
+    from boto3.dynamodb.conditions import Key
+
+    memberships = []
+    query_params = {"KeyConditionExpression": Key("connection_id").eq(connection_id)}
+
+    while True:
+        response = dynamodb.table.query(**query_params)
+        memberships.extend(response.get("Items", []))
+
+        if "LastEvaluatedKey" not in response:
+            return memberships
+
+        query_params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def remove_room_memberships(dynamodb, memberships):
+    """
+    Delete room memberships from the index.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for connection rooms table
+        memberships (list): Membership items returned by get_connection_rooms
+    """
+    with dynamodb.table.batch_writer() as batch:
+        for membership in memberships:
+            batch.delete_item(
+                Key={
+                    "connection_id": membership["connection_id"],
+                    "chat_id": membership["chat_id"],
+                }
+            )
+
+
+def delete_empty_room(dynamodb, room_id):
+    """
+    Delete a room unless someone joined it since its last connection left.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for chat room table
+        room_id (str): Chat room ID
+    """
+    from botocore.exceptions import ClientError
+
+    try:
+        dynamodb.table.delete_item(
+            Key={"chat_id": room_id},
+            ConditionExpression="size(user_connections) = :zero",
+            ExpressionAttributeValues={":zero": 0},
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+        logger.info("Room %s was joined again, keeping it", room_id)
@@ -0,0 +1,173 @@
+import threading
+import time
+from log import get_logger
+
+logger = get_logger("snapshot")
+
+# Small tables that rarely change (items, languages, achievements, battlepass
+# seasons, tasks) are loaded whole and kept per warm container for a TTL.
+# Loaded values are shared by every request served from the container, so
+# callers copy them before modifying.
+
+_SNAPSHOTS = []
+_SNAPSHOTS_LOCK = threading.Lock()
+
+# Returned by TtlSnapshot.cached when nothing fresh is cached, None is a
+# value that can be cached
+MISSING = object()
+
+
+class TtlSnapshot:
+    """
+    Values loaded from a table and cached per table and key until they
+    expire.
+
+    Parameters:
+        loader: Called as loader(dynamodb, *key) to load a value
+        ttl_seconds (int): How long a loaded value is kept
+        expires_at: Optional, called as expires_at(value) to return when a
+                    loaded value expires on clock instead of after ttl_seconds
+        clock: Time source for expiry, monotonic unless expires_at returns
+               wall clock times
+    """
+
+    def __init__(self, loader, ttl_seconds, expires_at=None, clock=time.monotonic):
+        self.loader = loader
+        self.ttl_seconds = ttl_seconds
+        self.expires_at = expires_at
+        self.clock = clock
+
+        self._entries = {}
+        self._lock = threading.Lock()
+        # One lock per key, so different keys can be loaded concurrently
+        self._key_locks = {}
+
+        with _SNAPSHOTS_LOCK:
+            _SNAPSHOTS.append(self)
+
+    def get(self, dynamodb, *key):
+        """
+        Return the cached value, loading it when missing or expired.
+
+        Parameters:
+            dynamodb (LambdaDynamoDBClass): DynamoDB client for the table
+            *key: Further key parts, passed on to the loader
+        """
+        value = self.cached(dynamodb, *key)
+        if value is not MISSING:
+            return value
+
+        cache_key = (dynamodb.table_name, *key)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(cache_key, threading.Lock())
+
+        with key_lock:
+            value = self.cached(dynamodb, *key)
+            if value is not MISSING:
+                return value
+
+            value = self.loader(dynamodb, *key)
+            if self.expires_at is not None:
+                expires_at = self.expires_at(value)
+            else:
+                expires_at = self.clock() + self.ttl_seconds
+
+            self._entries[cache_key] = (value, expires_at)
+
+        return value
+
+    def cached(self, dynamodb, *key):
+        """
+        Return the cached value without loading it, MISSING if it isn't
+        cached or has expired.
+        """
+        entry = self._entries.get((dynamodb.table_name, *key))
+        if entry is None or self.clock() >= entry[1]:
+            return MISSING
+
+        return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._key_locks.clear()
+
+
+def clear_snapshots():
+    """
+    Drop every cached snapshot, tests call this between mocked tables.
+    """
+    with _SNAPSHOTS_LOCK:
+        snapshots = list(_SNAPSHOTS)
+
+    for snapshot in snapshots:
+        snapshot.clear()
+
+
+class Catalog:
+    """
+    Items of a table indexed by id, in the order they were read.
+    """
+
+    def __init__(self, items):
+        self.items = []
+        self.by_id = {}
+
+        for item in items:
+            self.add(item)
+
+    def add(self, item):
+        if item["id"] in self.by_id:
+            return False
+
+        self.items.append(item)
+        self.by_id[item["id"]] = item
+        return True
+
+    def get(self, item_id):
+        return self.by_id.get(item_id)
+
+    def __len__(self):
+        return len(self.by_id)
+
+
+def scan_all(dynamodb, **scan_params):
+    """
+    Scan a whole table, following LastEvaluatedKey.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for the table
+        **scan_params: Passed on to scan (FilterExpression, ...)
+
+    Returns:
+        list: Items of every page
+    """
+    return _read_all(dynamodb.table.scan, scan_params)
+
+
+def query_all(dynamodb, **query_params):
+    """
+    Query every page of a key condition, following LastEvaluatedKey.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for the table
+        **query_params: Passed on to query (KeyConditionExpression, ...)
+
+    Returns:
+        list: Items of every page
+    """
+    return _read_all(dynamodb.table.query, query_params)
+
+
+def _read_all(operation, params):
+    items = []
+
+    # Filtered reads can return empty pages before the matching items
+    while True:
+        response = operation(**params)
+        items.extend(response.get("Items", []))
+
+        if "LastEvaluatedKey" not in response:
+            return items
+
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
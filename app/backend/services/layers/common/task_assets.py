@@ -0,0 +1,85 @@
+import json
+from os import environ
+
+# Tasks reference their images as "@<base>:<path>", which stands for
+# TASK_ASSET_BASES[<base>] + <path>. Tasks are stored that way and expanded
+# for clients that don't ask for the compact encoding.
+TASK_ASSET_BASES = json.loads(environ.get("TASK_ASSET_BASES", "null")) or {
+    "s3": "https://gestura-sign-language.s3.eu-central-1.amazonaws.com/",
+}
+
+ASSET_REF_PREFIX = "@"
+TASK_ASSET_FIELDS = ("question", "possible_answers")
+
+# Clients that understand asset references opt in with this request header
+TASK_ENCODING_HEADER = "x-task-encoding"
+COMPACT_TASK_ENCODING = "compact"
+
+# Longest base first, so the most specific one is used when bases overlap
+_BASES_BY_LENGTH = sorted(
+    TASK_ASSET_BASES.items(), key=lambda base: len(base[1]), reverse=True
+)
+
+
+def compact_asset(value):
+    """
+    Replace a known asset URL prefix with its asset reference.
+    """
+    if isinstance(value, str):
+        for base_key, base_url in _BASES_BY_LENGTH:
+            if value.startswith(base_url):
+                return f"{ASSET_REF_PREFIX}{base_key}:{value[len(base_url):]}"
+
+    return value
+
+
+def expand_asset(value):
+    """
+    Replace an asset reference with the full URL. Values that aren't
+    references to a known base are returned unchanged.
+    """
+    if isinstance(value, str) and value.startswith(ASSET_REF_PREFIX):
+        base_key, separator, path = value[len(ASSET_REF_PREFIX) :].partition(":")
+        if separator and base_key in TASK_ASSET_BASES:
+            return TASK_ASSET_BASES[base_key] + path
+
+    return value
+
+
+def compact_task(task):
+    """
+    Copy of a task with its asset URLs replaced by asset references.
+    """
+    return _map_assets(task, compact_asset)
+
+
+def expand_task(task):
+    """
+    Copy of a task with its asset references replaced by full URLs.
+    """
+    return _map_assets(task, expand_asset)
+
+
+def wants_compact_tasks(event):
+    """
+    Whether the request opted in to compact task encoding.
+    """
+    headers = event.get("headers") or {}
+    for name, value in headers.items():
+        if name.lower() == TASK_ENCODING_HEADER:
+            return (value or "").strip().lower() == COMPACT_TASK_ENCODING
+
+    return False
+
+
+def _map_assets(task, convert):
+    task = dict(task)
+
+    for field in TASK_ASSET_FIELDS:
+        value = task.get(field)
+        if isinstance(value, list):
+            task[field] = [convert(item) for item in value]
+        elif value is not None:
+            task[field] = convert(value)
+
+    return task
@@ -0,0 +1,147 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os import environ
+from log import get_logger
+from snapshot import MISSING, TtlSnapshot, query_all
+
+logger = get_logger("task_pool")
+
+# Task content changes rarely, so the tasks of each (section, language) are
+# kept per warm container and queried again after TASK_POOL_TTL_SECONDS
+TASK_POOL_TTL_SECONDS = int(environ.get("TASK_POOL_TTL_SECONDS", 600))
+
+# Sections missing from the cache are queried concurrently on a shared pool
+TASK_POOL_MAX_WORKERS = int(environ.get("TASK_POOL_MAX_WORKERS", 4))
+
+TASK_VERSIONS = (1, 2, 3)
+
+_EXECUTOR_LOCK = threading.Lock()
+_EXECUTOR = None
+
+
+class TaskPool:
+    """
+    Tasks of one section and language grouped by version.
+    """
+
+    def __init__(self, tasks):
+        self.by_version = {version: [] for version in TASK_VERSIONS}
+
+        for task in tasks:
+            version = task.get("version")
+            if version in self.by_version:
+                self.by_version[version].append(task)
+
+    def version(self, version):
+        return self.by_version.get(version, [])
+
+    def __len__(self):
+        return sum(len(tasks) for tasks in self.by_version.values())
+
+
+def _load_task_pool(dynamodb, section, language_id):
+    pool = TaskPool(_query_tasks(dynamodb, section, language_id))
+    logger.info(
+        "Loaded %s tasks for section %s and language %s",
+        len(pool),
+        section,
+        language_id,
+    )
+
+    # Empty sections are cached too, they drive the fallback logic
+    return pool
+
+
+_TASK_POOLS = TtlSnapshot(_load_task_pool, TASK_POOL_TTL_SECONDS)
+
+
+def get_task_pool(dynamodb, section, language_id):
+    """
+    Return the cached tasks for a section and language, querying the
+    section-language-index when missing or expired.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for tasks table
+        section (int): Section number
+        language_id (str): Language identifier
+
+    Returns:
+        TaskPool, empty if the section has no tasks
+    """
+    return _TASK_POOLS.get(dynamodb, section, language_id)
+
+
+def get_task_pools(dynamodb, sections, language_id):
+    """
+    Return the task pools of several sections, querying the ones that are
+    not cached concurrently.
+
+    Parameters:
+        dynamodb (LambdaDynamoDBClass): DynamoDB client for tasks table
+        sections (list): Section numbers, duplicates are queried once
+        language_id (str): Language identifier
+
+    Returns:
+        list: TaskPool for each section, in the order of sections
+    """
+    pools = {}
+    missing_sections = []
+    for section in dict.fromkeys(sections):
+        pool = _TASK_POOLS.cached(dynamodb, section, language_id)
+        if pool is MISSING:
+            missing_sections.append(section)
+        else:
+            pools[section] = pool
+
+    if len(missing_sections) == 1:
+        section = missing_sections[0]
+        pools[section] = get_task_pool(dynamodb, section, language_id)
+
+    elif missing_sections:
+        logger.debug("Querying sections %s concurrently", missing_sections)
+
+        # The workers share the container's Table. boto3 resources aren't
+        # thread safe when their attributes are loaded or changed, but the
+        # workers only run queries, which go straight to the underlying
+        # botocore client, and clients are safe to call from several threads
+        futures = {
+            section: _get_executor().submit(
+                get_task_pool, dynamodb, section, language_id
+            )
+            for section in missing_sections
+        }
+        for section, future in futures.items():
+            pools[section] = future.result()
+
+    return [pools[section] for section in sections]
+
+
+def clear_task_pool_cache():
+    _TASK_POOLS.clear()
+
+
+def _get_executor():
+    global _EXECUTOR
+
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = ThreadPoolExecutor(
+                    max_workers=TASK_POOL_MAX_WORKERS,
+                    thread_name_prefix="task-pool",
+                )
+
+    return _EXECUTOR
+
+
+def _query_tasks(dynamodb, section, language_id):
+    from boto3.dynamodb.conditions import Key
+
+    # Large sections are split over several 1 MB pages
+    return query_all(
+        dynamodb,
+        IndexName="section-language-index",
+        KeyConditionExpression=(
+            Key("section").eq(section) & Key("language_id").eq(language_id)
+        ),
+    )
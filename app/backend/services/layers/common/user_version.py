@@ -0,0 +1,34 @@
+# Users carry a version number that is bumped by every write that replaces a
+# list or map attribute with a value computed from the user as it was read
+# (current_level, letters_learned, battlepass, achievements, activated_items).
+# Such writes are conditioned on the version they read, so a concurrent change
+# makes them fail instead of being overwritten. Counters (coins, xp,
+# time_played) are changed with ADD and don't need the condition.
+
+# SET action bumping the version without a condition, for writes that change
+# a guarded attribute in place
+USER_VERSION_UPDATE = "version = if_not_exists(version, :zero) + :one"
+USER_VERSION_VALUES = {":zero": 0, ":one": 1}
+
+
+def user_version_guard(version, expression_attribute_values):
+    """
+    SET action and condition for a write based on a user read at version.
+
+    Parameters:
+        version: User's version when it was read (None if never set)
+        expression_attribute_values (dict): Values of the update, the ones
+                                            used by the guard are added
+
+    Returns:
+        tuple (set_action, condition_expression)
+    """
+    expression_attribute_values[":next_version"] = (version or 0) + 1
+
+    if version is None:
+        condition_expression = "attribute_exists(email) AND attribute_not_exists(version)"
+    else:
+        condition_expression = "version = :version"
+        expression_attribute_values[":version"] = version
+
+    return "version = :next_version", condition_expression
@@ -0,0 +1,88 @@
+from log import get_logger
+import threading
+
+logger = get_logger("validation")
+
+# Compiled validators, keyed by the id of the schema dict they were built from.
+# The schema is kept next to its validator so the id can't be reused while the
+# entry exists. Each handler's validation_schema.schema is compiled once per
+# container, on the first request that needs it.
+_VALIDATORS = {}
+_VALIDATORS_LOCK = threading.Lock()
+
+
+class SchemaValidationError(Exception):
+    """
+    Raised when a request doesn't match its schema.
+
+    The message keeps the format handlers have always returned, minus the
+    rejected value, since it may be a password and the message is both logged
+    and returned. The value is still available as an attribute, the other
+    attributes describe the failed rule for structured error responses.
+    """
+
+    def __init__(self, message, field=None, rule=None, value=None):
+        super().__init__(
+            f"Failed schema validation. Error: {message}, Path: {field}"
+        )
+        self.error = message
+        self.field = field
+        self.rule = rule
+        self.value = value
+
+    def to_dict(self):
+        """
+        Response body describing the validation error, without the rejected
+        value.
+        """
+        return {
+            "message": str(self),
+            "errors": [{"field": self.field, "rule": self.rule, "message": self.error}],
+        }
+
+
+def get_validator(schema):
+    """
+    Return the compiled fastjsonschema validator for a schema, compiling it on
+    first use.
+
+    Parameters:
+        schema: JSON schema dict
+
+    Returns:
+        callable that takes the data to validate and raises
+        fastjsonschema.JsonSchemaValueException when it is invalid
+    """
+    entry = _VALIDATORS.get(id(schema))
+    if entry is None:
+        import fastjsonschema
+
+        with _VALIDATORS_LOCK:
+            entry = _VALIDATORS.get(id(schema))
+            if entry is None:
+                logger.debug("Compiling request schema")
+                entry = (schema, fastjsonschema.compile(schema))
+                _VALIDATORS[id(schema)] = entry
+
+    return entry[1]
+
+
+def validate(event, schema):
+    """
+    Validate data against a JSON schema using its cached validator.
+
+    Parameters:
+        event: Data to validate (request body or query parameters)
+        schema: JSON schema dict
+
+    Raises:
+        SchemaValidationError: When the data doesn't match the schema
+    """
+    import fastjsonschema
+
+    try:
+        get_validator(schema)(event)
+    except fastjsonschema.JsonSchemaValueException as e:
+        raise SchemaValidationError(
+            e.message, field=e.name, rule=e.rule, value=e.value
+        ) from None
@@ -1,13 +1,16 @@
-import logging
+from log import get_logger, log_event
 import json
 import random
 
+from botocore.exceptions import ClientError
+from os import environ
+
 from datetime import datetime, timezone
 from validation_schema import schema
 from dataclasses import dataclass
-from aws_lambda_powertools.utilities.validation import validate, SchemaValidationError
-from common import build_response, parse_utc_isoformat, convert_decimal_to_float
-from auth import get_email_from_jwt_token
+from validation import SchemaValidationError, validate
+from common import build_response, parse_utc_isoformat
+from auth import get_email_from_event
 from boto import (
     LambdaDynamoDBClass,
     _LAMBDA_LANGUAGES_TABLE_RESOURCE,
@@ -16,12 +19,18 @@ from boto import (
     _LAMBDA_ACHIEVEMENTS_TABLE_RESOURCE,
 )
 from middleware import middleware
+from battlepass import get_active_battlepass_season
+from achievements import get_achievements_catalog
+from languages import get_language
+from user_version import user_version_guard
 from typing import List
 from decimal import Decimal
-from boto3.dynamodb.conditions import Attr
 
-logger = logging.getLogger("CompleteLevel")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("CompleteLevel")
+
+# How many times the user is re-read and the update retried after losing a
+# race with another request updating the same user
+COMPLETE_LEVEL_MAX_ATTEMPTS = int(environ.get("COMPLETE_LEVEL_MAX_ATTEMPTS", 3))
 
 
 @dataclass
@@ -35,10 +44,10 @@ class Request:
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event: {event}")
+    log_event(logger, event)
 
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     # Extract request body from event and validate it against validation schema
     body = event.get("body")
@@ -48,11 +57,11 @@ def lambda_handler(event, context):
         request_body = event
 
     try:
-        logger.debug(f"Validating request: {request_body}")
+        logger.debug("Validating request: %s", request_body)
         validate(event=request_body, schema=schema)
     except SchemaValidationError as e:
-        logger.error(f"Validation failed: {e}")
-        return build_response(400, {"message": str(e)})
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
 
     # Parse validated request into data class
     logger.info("Parsing request body")
@@ -69,23 +78,96 @@ def lambda_handler(event, context):
     battlepassTable = LambdaDynamoDBClass(_LAMBDA_BATTLEPASS_TABLE_RESOURCE)
     achievementsTable = LambdaDynamoDBClass(_LAMBDA_ACHIEVEMENTS_TABLE_RESOURCE)
 
+    # Time, base XP and coins only depend on the request, so they stay the same
+    # when the update is retried after a concurrent write
+    logger.info("Calculating time played")
+    time_played = Decimal(str(seconds_between(request.started_at, request.finished_at)))
+
+    base_xp, coins = calculate_xp_and_coins(request.correct_answers_versions)
+    base_xp = Decimal(str(base_xp))
+    coins = Decimal(str(coins))
+
+    # The user is written with a version check, if another request updated it
+    # in the meantime the user is read again and the changes are recalculated
+    for attempt in range(1, COMPLETE_LEVEL_MAX_ATTEMPTS + 1):
+        try:
+            return complete_level(
+                usersTable,
+                languagesTable,
+                battlepassTable,
+                achievementsTable,
+                email,
+                request,
+                time_played,
+                base_xp,
+                coins,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+            logger.warning(
+                "User %s was updated concurrently, attempt %s of %s",
+                email,
+                attempt,
+                COMPLETE_LEVEL_MAX_ATTEMPTS,
+            )
+
+    logger.error("Giving up on completing level for user %s", email)
+    return build_response(
+        409, {"message": "User was updated concurrently, please try again"}
+    )
+
+
+def complete_level(
+    usersTable,
+    languagesTable,
+    battlepassTable,
+    achievementsTable,
+    email,
+    request,
+    time_played,
+    base_xp,
+    coins,
+):
+    """
+    Apply a completed level to the user and write all changes at once.
+
+    Parameters:
+        usersTable: DynamoDB table resource for users
+        languagesTable: DynamoDB table resource for languages
+        battlepassTable: DynamoDB table resource for battlepass data
+        achievementsTable: DynamoDB table resource for achievements
+        email: User's email
+        request: Validated Request
+        time_played: Seconds spent on the level
+        base_xp: XP earned before multipliers
+        coins: Coins earned
+
+    Returns:
+        dict: HTTP response
+
+    Raises:
+        ClientError: ConditionalCheckFailedException if the user was updated
+                     after it was read
+    """
     # Retrieve user and language data from DynamoDB and check if they exist
-    user = get_user_by_email(usersTable, email)
+    user, language = get_user_and_language(
+        usersTable, languagesTable, email, request.language_id
+    )
     if not user:
-        logger.error(f"User with email {email} not found")
+        logger.error("User with email %s not found", email)
         return build_response(404, {"message": "User not found"})
 
-    language = get_language_by_id(languagesTable, request.language_id)
     if not language:
-        logger.error(f"Language with id {request.language_id} not found")
+        logger.error("Language with id %s not found", request.language_id)
         return build_response(404, {"message": "Language not found"})
 
-    # Calculate time spent on this learning session
-    logger.info("Calculating time played")
-    time_played = Decimal(str(seconds_between(request.started_at, request.finished_at)))
+    # Count learned words before the update, achievements compare old and new
+    words_learned_before = count_words_learned(user["letters_learned"])
 
     # Update user's list of learned letters/words for this language
-    logger.info(f"Updating users letters learned {user['letters_learned']}")
+    logger.debug("Updating users letters learned %s", user['letters_learned'])
     letters_learned = update_letters_learned(
         user["letters_learned"], request.language_id, request.letters_learned
     )
@@ -94,13 +176,9 @@ def lambda_handler(event, context):
     # active_items contains the list of active items ids, item_removed indicates if any item was removed
     active_items, item_removed = check_active_items(user, usersTable)
 
-    # Calculate base XP and coins earned from this session and apply multipliers
-    xp, coins = calculate_xp_and_coins(request.correct_answers_versions)
-    xp = Decimal(str(xp))
-    coins = Decimal(str(coins))
-
+    # Apply XP multipliers from active items
     multiplier = get_xp_multiplier(active_items)
-    xp *= multiplier
+    xp = base_xp * multiplier
 
     # Update user's level for this specific language
     user_levels = user.get("current_level", {})
@@ -110,36 +188,50 @@ def lambda_handler(event, context):
     # Update user's battlepass XP with newly earned XP
     user_bp = update_users_battlepass_xp(user, xp, battlepassTable)
 
+    # Check for any newly earned achievements
+    user_achievements, new_achievements = check_new_achievements(
+        achievementsTable,
+        email,
+        {
+            "time_played": (
+                user.get("time_played", 0),
+                user.get("time_played", 0) + time_played,
+            ),
+            "xp": (user.get("xp", 0), user.get("xp", 0) + xp),
+            "words": (words_learned_before, count_words_learned(letters_learned)),
+        },
+        user.get("achievements", []),
+    )
+
     logger.info(
-        f"Updating user {email} with time played: {time_played}, task level: {user_levels[request.language_id]}, letters learned: {letters_learned}"
+        "Updating user %s with time played: %s, task level: %s, letters learned: %s",
+        email,
+        time_played,
+        user_levels[request.language_id],
+        letters_learned,
     )
 
     # Only update active_items in DB if something was removed
     if not item_removed:
         active_items = None
 
+    # Only update achievements in DB if new ones were earned
+    if not new_achievements:
+        user_achievements = None
+
     # Update user record with all progress changes
     update_user(
         usersTable,
         email,
+        user.get("version"),
         user_levels,
-        user.get("time_played", 0) + time_played,
+        time_played,
         letters_learned,
-        user.get("xp", 0) + xp,
+        xp,
         user_bp,
-        user.get("coins", 0) + coins,
+        coins,
         active_items,
-    )
-
-    # Check for and award any newly earned achievements
-    new_achievements = update_user_achievements(
-        usersTable,
-        achievementsTable,
-        email,
-        user.get("time_played", 0) + time_played,
-        user.get("xp", 0) + xp,
-        letters_learned,
-        user.get("achievements", []),
+        user_achievements,
     )
 
     # Prepare success response with rewards and achievement info
@@ -155,12 +247,13 @@ def lambda_handler(event, context):
         response_body["new_achievements"] = new_achievements
 
     # Return final response with all rewards and progress
-    return build_response(200, convert_decimal_to_float(response_body))
+    return build_response(200, response_body)
 
 
 def update_user(
     dynamodb,
     email,
+    version,
     current_level,
     time_played,
     letters_learned,
@@ -168,62 +261,92 @@ def update_user(
     battlepass,
     coins,
     activated_items,
+    achievements,
 ):
     """
         Update multiple user attributes in DynamoDB in a single atomic operation.
 
+        Time played, XP and coins are added to the stored values, so writes by
+        other functions in the meantime (purchases, chests) are kept. The
+        attributes that are recalculated from the user as it was read are only
+        written if the user's version is still the one that was read, and the
+        version is bumped so concurrent writers notice the change.
+
         Parameters:
             dynamodb: DynamoDB table resource
             email: User's email (primary key)
+            version: User's version when it was read (None if never set)
             current_level: Dictionary of language levels
-            time_played: Total time played in seconds
+            time_played: Seconds played to add
             letters_learned: Dictionary of learned letters by language
-            xp: Total experience points
-            battlepass: User's battlepass data
-            coins: User's coin balance
+            xp: Experience points to add
+            battlepass: User's battlepass data (or None if no active season)
+            coins: Coins to add
             activated_items: List of active items (or None if no changes)
+            achievements: List of achievement IDs (or None if no changes)
+
+        Raises:
+            ClientError: ConditionalCheckFailedException on a version mismatch
         """
-    logger.info(f"Updating user with email: {email}")
+    logger.info("Updating user with email: %s", email)
 
-    # Build the update expression and attribute values dynamically
+    # Build the update expression and attribute values dynamically, counters
+    # are added and everything else is set
     update_expression = "SET "
+    add_expression = "ADD "
     expression_attribute_values = {}
 
     # Add each attribute to the update expression
-    logger.debug(f"Updating current level to {current_level}")
+    logger.debug("Updating current level to %s", current_level)
     update_expression += "current_level = :current_level, "
     expression_attribute_values[":current_level"] = current_level
 
-    logger.debug(f"Updating time played to {time_played}")
-    update_expression += "time_played = :time_played, "
+    logger.debug("Adding %s to time played", time_played)
+    add_expression += "time_played :time_played, "
     expression_attribute_values[":time_played"] = time_played
 
-    logger.debug(f"Updating letters learned to {letters_learned}")
+    logger.debug("Updating letters learned to %s", letters_learned)
     update_expression += "letters_learned = :letters_learned, "
     expression_attribute_values[":letters_learned"] = letters_learned
 
-    logger.debug(f"Updating xp to {xp}")
-    update_expression += "xp = :xp, "
+    logger.debug("Adding %s to xp", xp)
+    add_expression += "xp :xp, "
     expression_attribute_values[":xp"] = xp
 
-    logger.debug(f"Updating battlepass to {battlepass}")
-    update_expression += "battlepass = :battlepass, "
-    expression_attribute_values[":battlepass"] = battlepass
+    # Only update battlepass if there is an active season, None would erase
+    # the user's battlepass
+    if battlepass is not None:
+        logger.debug("Updating battlepass to %s", battlepass)
+        update_expression += "battlepass = :battlepass, "
+        expression_attribute_values[":battlepass"] = battlepass
 
-    logger.debug(f"Updating coins to {coins}")
-    update_expression += "coins = :coins, "
+    logger.debug("Adding %s to coins", coins)
+    add_expression += "coins :coins"
     expression_attribute_values[":coins"] = coins
 
     # Only update activated items if there was a change
     if activated_items is not None:
-        logger.debug(f"Updating activated items to {activated_items}")
+        logger.debug("Updating activated items to %s", activated_items)
         update_expression += "activated_items = :activated_items, "
         expression_attribute_values[":activated_items"] = activated_items
 
+    # Only update achievements if new ones were earned
+    if achievements is not None:
+        logger.debug("Updating achievements to %s", achievements)
+        update_expression += "achievements = :achievements, "
+        expression_attribute_values[":achievements"] = achievements
+
+    # Bump the version, guarding against writes made since the user was read
+    version_update, condition_expression = user_version_guard(
+        version, expression_attribute_values
+    )
+    update_expression += version_update + " "
+
     # Execute DynamoDB update operation
     dynamodb.table.update_item(
         Key={"email": email},
-        UpdateExpression=update_expression.rstrip(", "),
+        UpdateExpression=update_expression + add_expression,
+        ConditionExpression=condition_expression,
         ExpressionAttributeValues=expression_attribute_values,
     )
 
@@ -244,18 +367,16 @@ def update_users_battlepass_xp(user, xp, battlepassDb):
     user_bp: list = user.setdefault("battlepass", [])
 
     # Fetch & validate active season
-    active_bp = get_active_battlepass_seasons(battlepassDb)
+    active_bp = get_active_battlepass_season(battlepassDb)
     if not active_bp:
         logger.error(
-            f"No active battlepass for user {user.get("email", "")}; skipping XP bump."
+            "No active battlepass for user %s; skipping XP bump.", user.get("email", "")
         )
         return None
 
-    season_id = active_bp.get("season")
+    season_id = active_bp.season_id
     if not season_id:
-        logger.error(
-            f"Active battlepass found but missing season ID; skipping XP bump."
-        )
+        logger.error("Active battlepass found but missing season ID; skipping XP bump.")
         return None
 
     # Find or initialize this season’s entry
@@ -269,13 +390,13 @@ def update_users_battlepass_xp(user, xp, battlepassDb):
             "claimed_levels": [],
         }
         user_bp.append(season_entry)
-        logger.info(f"Initialized new battlepass entry for season {season_id}")
+        logger.info("Initialized new battlepass entry for season %s", season_id)
 
     # Update the XP counter
     old_xp = season_entry.get("xp", 0)
     new_xp = old_xp + xp
     season_entry["xp"] = new_xp
-    logger.info(f"Battlepass '{season_id}' XP updated: {old_xp} → {new_xp}")
+    logger.info("Battlepass '%s' XP updated: %s → %s", season_id, old_xp, new_xp)
 
     # Update user_bp with new data
     for idx, entry in enumerate(user_bp):
@@ -287,56 +408,30 @@ def update_users_battlepass_xp(user, xp, battlepassDb):
     return user_bp
 
 
-def get_language_by_id(dynamodb, id):
-    logger.info(f"Getting language by id {id}")
-    language = dynamodb.table.get_item(Key={"id": id})
-
-    language_item = language.get("Item", {})
-
-    return language_item
-
-
-def get_user_by_email(dynamodb, email):
-    logger.info(f"Getting user by email {email}")
-    if not email:
-        logger.error("Email is None")
-        return None
-
-    user = dynamodb.table.get_item(Key={"email": email})
-
-    user_item = user.get("Item", {})
-
-    return user_item
-
-
-def get_active_battlepass_seasons(dynamodb):
+def get_user_and_language(usersTable, languagesTable, email, language_id):
     """
-    Retrieve currently active battlepass season.
-    Finds battlepass with start_date before current time and end_date after current time.
+    Read the user, the language comes from the cached languages catalog.
 
     Parameters:
-        dynamodb: DynamoDB table resource for battlepass
+        usersTable: DynamoDB table resource for users
+        languagesTable: DynamoDB table resource for languages
+        email: User's email
+        language_id: ID of the language
 
     Returns:
-        Active battlepass document or None if not found
+        tuple (user, language), either is an empty dict if it doesn't exist
     """
-    logger.info(f"Fetching active battlepass seasons")
-
-    # Get current date/time in UTC to compare with battlepass dates
-    current_date = datetime.now(timezone.utc)
-    logger.debug(f"Current date: {current_date}")
-    current_date_str = current_date.isoformat()
-
-    # Query for active battlepass (current date between start and end dates)
-    response = dynamodb.table.scan(
-        FilterExpression=Attr("start_date").lte(current_date_str)
-        & Attr("end_date").gte(current_date_str)
-    )
+    logger.info("Getting user %s and language %s", email, language_id)
+    if not email:
+        logger.error("Email is None")
+        return {}, {}
 
-    active_battlepasses = response.get("Items", [])
-    logger.debug(f"Found {len(active_battlepasses)} active battlepasses")
+    # Read consistently, a retry has to see the version that made it fail
+    user = usersTable.table.get_item(
+        Key={"email": email}, ConsistentRead=True
+    ).get("Item", {})
 
-    return active_battlepasses[0] if active_battlepasses else None
+    return user, get_language(languagesTable, language_id) or {}
 
 
 def seconds_between(started_at: str, finished_at: str) -> float:
@@ -404,21 +499,21 @@ def calculate_xp_and_coins(correct_answers_versions):
              xp    = 2 per level 1, 3 per level 2, 5 per level 3
              coins = floor(xp * random_multiplier) with multiplier in [1.0, 2.0]
     """
-    logger.debug(f"Calculating XP and coins for versions: {correct_answers_versions}")
+    logger.debug("Calculating XP and coins for versions: %s", correct_answers_versions)
 
     # Map difficulty levels to XP values
     xp_map = {1: 2, 2: 3, 3: 5}
-    logger.debug(f"XP map: {xp_map}")
+    logger.debug("XP map: %s", xp_map)
 
     # Sum XP for all correct answers
-    logger.info(f"Calculating XP for versions: {correct_answers_versions}")
+    logger.info("Calculating XP for versions: %s", correct_answers_versions)
     xp = sum(xp_map.get(v, 0) for v in correct_answers_versions)
-    logger.debug(f"XP calculated: {xp}")
+    logger.debug("XP calculated: %s", xp)
 
     # Apply random multiplier to determine coins
     multiplier = random.uniform(1.0, 2.0)
 
-    logger.info(f"Calculating coins: {xp} * {multiplier}")
+    logger.info("Calculating coins: %s * %s", xp, multiplier)
     coins = int(xp * multiplier)
 
     return xp, coins
@@ -439,11 +534,11 @@ def check_active_items(user, dynamodb):
     """
     active_items = user.get("activated_items", [])
     if not active_items:
-        logger.debug(f"User {user['email']} has no active items.")
+        logger.debug("User %s has no active items.", user['email'])
         return None, False
 
-    logger.info(f"User {user['email']} has active items: {active_items}")
-    logger.info(f"Checking if active items are expired.")
+    logger.info("User %s has active items: %s", user['email'], active_items)
+    logger.info("Checking if active items are expired.")
     current_time = datetime.now(timezone.utc)
 
     item_removed = False
@@ -453,12 +548,14 @@ def check_active_items(user, dynamodb):
         if "expires_at" in item:
             expires_at = parse_utc_isoformat(item["expires_at"])
             if expires_at < current_time:
-                logger.info(f"Item {item} has expired.")
+                logger.info("Item %s has expired.", item)
                 active_items.remove(item)
                 item_removed = True
 
     logger.info(
-        f"User {user['email']} has active items after expiration check: {active_items}"
+        "User %s has active items after expiration check: %s",
+        user["email"],
+        active_items,
     )
     return active_items, item_removed
 
@@ -492,79 +589,56 @@ def get_xp_multiplier(active_items):
             max_multiplier = max(max_multiplier, item_multiplier)
 
 
-    logger.info(f"XP multiplier: {max_multiplier}")
+    logger.info("XP multiplier: %s", max_multiplier)
     return max_multiplier
 
 
-def update_user_achievements(
-    usersTable, achievementsTable, email, time_played, xp, letters_learned, achievements
-):
+def count_words_learned(letters_learned):
     """
-    Check for and award new achievements based on user's updated stats.
+    Total number of letters/words learned across all languages.
+    """
+    return Decimal(str(sum(len(words) for words in letters_learned.values())))
+
+
+def check_new_achievements(achievementsTable, email, stat_changes, achievements):
+    """
+    Check for new achievements based on user's updated stats.
 
     Parameters:
-        usersTable: DynamoDB table resource for users
         achievementsTable: DynamoDB table resource for achievements
         email: User's email
-        time_played: User's total time played
-        xp: User's total XP
-        letters_learned: Dictionary of letters learned by language
+        stat_changes: Dictionary mapping achievement types ("time_played",
+                      "xp", "words") to (old value, new value) tuples
         achievements: List of achievement IDs already earned
 
     Returns:
-        List of newly earned achievement details, or empty list if none
+        tuple (user_achievements, new_achievements) with the updated list of
+        achievement IDs and the details of the newly earned ones
     """
-    logger.info(f"Checking for new achievements for user {email}")
+    logger.info("Checking for new achievements for user %s", email)
 
     # Initialize achievements list if not present
-    user_achievements = achievements
-    if not user_achievements:
-        user_achievements = []
+    user_achievements = list(achievements or [])
+    earned_ids = set(user_achievements)
 
-    # Calculate total words/letters learned across all languages
-    total_words_learned = sum(len(words_list) for words_list in letters_learned.values())
-    total_words_learned = Decimal(str(total_words_learned))
+    catalog = get_achievements_catalog(achievementsTable)
 
-    new_achievements = []
+    # Check each achievement type (time, XP, words learned) against the
+    # thresholds crossed between the old and the new value
     new_achievements_details = []
-
-    # Check each achievement type (time, XP, words learned)
-    achievement_types = [
-        {"type": "time_played", "value": time_played},
-        {"type": "xp", "value": xp},
-        {"type": "words", "value": total_words_learned},
-    ]
-
-    for achievement_type in achievement_types:
-        # Query for achievements of this type that user has met requirements for
-        response = achievementsTable.table.scan(
-            FilterExpression=Attr("type").eq(achievement_type["type"])
-            & Attr("requires").lte(achievement_type["value"])
-        )
-
-        # Sort achievements by requires in descending order
-        # (to ensure we award the highest tier first)
-        achievements = sorted(
-            response.get("Items", []), key=lambda a: a.get("requires", 0), reverse=True
-        )
-
-        for achievement in achievements:
-            # If an achievement is found that the user already has, break the loop
-            if achievement["id"] in user_achievements:
-                break
-
-            # Otherwise, add this achievement
-            new_achievements.append(achievement["id"])
-            new_achievements_details.append(achievement)
+    for achievement_type, (old_value, new_value) in stat_changes.items():
+        for achievement in catalog.newly_earned(
+            achievement_type, old_value, new_value, earned_ids
+        ):
+            earned_ids.add(achievement["id"])
             user_achievements.append(achievement["id"])
+            new_achievements_details.append(achievement)
 
-    # Update user if new achievements were earned
-    if new_achievements:
-        logger.info(f"User {email} earned new achievements: {new_achievements}")
-        usersTable.table.update_item(
-            Key={"email": email},
-            UpdateExpression="SET achievements = :achievements",
-            ExpressionAttributeValues={":achievements": user_achievements},
+    if new_achievements_details:
+        logger.info(
+            "User %s earned new achievements: %s",
+            email,
+            [achievement["id"] for achievement in new_achievements_details],
         )
 
-    return new_achievements_details
\ No newline at end of file
+    return user_achievements, new_achievements_details
@@ -1,27 +1,43 @@
-import logging
+from log import get_logger, log_event
 import random
 import os
 
+from botocore.exceptions import ClientError
+
 from validation_schema import schema
 from dataclasses import dataclass
-from aws_lambda_powertools.utilities.validation import SchemaValidationError, validate
-from common import build_response, convert_decimal_to_float
+from validation import SchemaValidationError, validate
+from common import build_response
 from boto import (
     LambdaDynamoDBClass,
     _LAMBDA_TASKS_TABLE_RESOURCE,
     _LAMBDA_USERS_TABLE_RESOURCE,
     _LAMBDA_LANGUAGES_TABLE_RESOURCE,
+    _LAMBDA_LESSON_BUNDLES_TABLE_RESOURCE,
 )
 from middleware import middleware
-from boto3.dynamodb.conditions import Key
-from auth import get_email_from_jwt_token
+from auth import get_email_from_event
+from task_pool import get_task_pools
+from languages import get_language
+from user_version import user_version_guard
+from task_assets import (
+    COMPACT_TASK_ENCODING,
+    TASK_ASSET_BASES,
+    TASK_ENCODING_HEADER,
+    compact_task,
+    expand_task,
+    wants_compact_tasks,
+)
 
-logger = logging.getLogger("GetListOfTasks")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("GetListOfTasks")
 
 # Maximum section currently available in the database for fallback logic
 CURRENT_MAX_SECTION = int(os.environ.get("CURRENT_MAX_SECTION", 10))
 
+# Number of precomputed lesson bundles per (section, language, tier), built by
+# scripts/build_lesson_bundles.py. 0 always builds the lesson from task pools.
+LESSON_BUNDLES_PER_KEY = int(os.environ.get("LESSON_BUNDLES_PER_KEY", 0))
+
 
 @dataclass
 class Request:
@@ -30,72 +46,80 @@ class Request:
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    log_event(logger, event)
 
-    # Extract and validate user identity from JWT token
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     if not email:
-        logger.error(f"Invalid email in jwt token {email}")
+        logger.error("Invalid email in jwt token %s", email)
         return build_response(400, {"message": "Invalid email in jwt token"})
 
     # Extract query parameters and validate against schema
     query_params = event.get("queryStringParameters", {})
     try:
-        logger.debug(f"Validating query params: {query_params}")
+        logger.debug("Validating query params: %s", query_params)
 
         validate(event=query_params, schema=schema)
     except SchemaValidationError as e:
-        logger.error(f"Validation failed: {e}")
-        return build_response(400, {"message": str(e)})
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
 
     # Initialize DynamoDB resources for required tables
     global _LAMBDA_TASKS_TABLE_RESOURCE, _LAMBDA_USERS_TABLE_RESOURCE, _LAMBDA_LANGUAGES_TABLE_RESOURCE
+    global _LAMBDA_LESSON_BUNDLES_TABLE_RESOURCE
     tasks_dynamodb = LambdaDynamoDBClass(_LAMBDA_TASKS_TABLE_RESOURCE)
     user_dynamodb = LambdaDynamoDBClass(_LAMBDA_USERS_TABLE_RESOURCE)
     languages_dynamodb = LambdaDynamoDBClass(_LAMBDA_LANGUAGES_TABLE_RESOURCE)
 
     # Verify requested language exists
     language_id = query_params.get("language", "")
-    language = get_language_by_id(languages_dynamodb, language_id)
+    language = get_language(languages_dynamodb, language_id)
     if not language:
-        logger.error(f"Language with id {language_id} not found")
+        logger.error("Language with id %s not found", language_id)
         return build_response(404, {"message": "Language not found"})
 
     # Get user's current level and subscription status
     users_current_level, subscription = get_users_current_level_and_subscription(user_dynamodb, email, language_id)
     if users_current_level is None:
-        logger.error(f"User {email} not found in the database.")
+        logger.error("User %s not found in the database.", email)
         return build_response(404, {"message": "User not found"})
 
     # Calculate section based on level (sections group 10 levels together)
     level = int(query_params.get("level", 1))
     section = (level // 10 + 1) * 10
 
+    # Clients that opted in get asset references instead of full URLs
+    compact = wants_compact_tasks(event)
+
     # Only allow users to access levels they've already reached
     if users_current_level == level:
-        return get_list_of_tasks(tasks_dynamodb, section, language_id, subscription)
+        # Serve a precomputed lesson if one was built for this section
+        if LESSON_BUNDLES_PER_KEY > 0:
+            bundles_dynamodb = LambdaDynamoDBClass(
+                _LAMBDA_LESSON_BUNDLES_TABLE_RESOURCE
+            )
+
+            bundle_tasks = get_lesson_bundle(
+                bundles_dynamodb, section, language_id, subscription
+            )
+            if bundle_tasks is not None:
+                return build_tasks_response(bundle_tasks, compact)
+
+        return get_list_of_tasks(
+            tasks_dynamodb, section, language_id, subscription, compact
+        )
     else:
-        logger.error(f"User {email} is not allowed to access level {level}.")
+        logger.error("User %s is not allowed to access level %s.", email, level)
         return build_response(
             403,
             {
-                "message": f"User {email} is not allowed to access level {convert_decimal_to_float(level)}.",
+                "message": f"User {email} is not allowed to access level {level}.",
                 "current_level": users_current_level,
             },
         )
 
 
-def get_language_by_id(dynamodb, id):
-    logger.info(f"Getting language by id {id}")
-    language = dynamodb.table.get_item(Key={"id": id})
-
-    language_item = language.get("Item", {})
-
-    return language_item
-
-
 def get_users_current_level_and_subscription(dynamodb, email, language_id):
     """
     Retrieve user's current level for a specific language and subscription status.
@@ -109,7 +133,7 @@ def get_users_current_level_and_subscription(dynamodb, email, language_id):
     Returns:
         tuple: (current_level, subscription_status) or None if user not found
     """
-    logger.info(f"Getting user level for email {email} and language {language_id}")
+    logger.info("Getting user level for email %s and language %s", email, language_id)
     user = dynamodb.table.get_item(Key={"email": email})
 
     user_item = user.get("Item", {})
@@ -117,23 +141,133 @@ def get_users_current_level_and_subscription(dynamodb, email, language_id):
         return None
 
     user_levels = user_item.get("current_level", {})
-    logger.info(f"User levels: {user_levels} for email {email}")
+    logger.debug("User levels: %s for email %s", user_levels, email)
 
     # If this language is new for the user, initialize at level 1
     if language_id not in user_levels:
-        logger.info(f"Adding new language {language_id} to user {email}")
+        logger.info("Adding new language %s to user %s", language_id, email)
         user_levels[language_id] = 1
 
-        dynamodb.table.update_item(
-            Key={"email": email},
-            UpdateExpression="SET current_level = :levels",
-            ExpressionAttributeValues={":levels": user_levels},
+        # Only if the user is unchanged, a concurrent completeLevel already
+        # saved its own levels and level 1 is the default either way
+        expression_attribute_values = {":levels": user_levels}
+        version_update, condition_expression = user_version_guard(
+            user_item.get("version"), expression_attribute_values
         )
+        try:
+            dynamodb.table.update_item(
+                Key={"email": email},
+                UpdateExpression=f"SET current_level = :levels, {version_update}",
+                ConditionExpression=condition_expression,
+                ExpressionAttributeValues=expression_attribute_values,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+
+            logger.info("User %s was updated concurrently, levels not saved", email)
 
     return user_levels.get(language_id, 0), user_item.get("subscription", 0)
 
 
-def get_list_of_tasks(dynamodb, section, language_id, subscription):
+def lesson_bundle_key(section, language_id, subscription):
+    """
+    Partition key of the lesson bundles for a section, language and
+    subscription tier.
+    """
+    tier = "premium" if subscription >= 1 else "free"
+
+    return f"{section}#{language_id}#{tier}"
+
+
+def get_lesson_bundle(dynamodb, section, language_id, subscription):
+    """
+    Pick one of the precomputed lesson bundles at random.
+
+    Parameters:
+        dynamodb: DynamoDB client for lesson bundles table
+        section: Section number (groups of 10 levels)
+        language_id: Language identifier for the tasks
+        subscription: User's subscription level (0=free, 1+=premium)
+
+    Returns:
+        list: Tasks of the bundle, or None if it hasn't been built
+    """
+    bundle_key = lesson_bundle_key(section, language_id, subscription)
+    bundle_index = random.randrange(LESSON_BUNDLES_PER_KEY)
+    logger.info("Getting lesson bundle %s/%s", bundle_key, bundle_index)
+
+    bundle = dynamodb.table.get_item(
+        Key={"bundle_key": bundle_key, "bundle_index": bundle_index}
+    ).get("Item")
+
+    if not bundle:
+        logger.warning("Lesson bundle %s/%s not found", bundle_key, bundle_index)
+        return None
+
+    return bundle["tasks"]
+
+
+def get_list_of_tasks(dynamodb, section, language_id, subscription, compact=False):
+    """
+    Build a lesson from the task pools and return it as an HTTP response.
+
+    Parameters:
+        dynamodb: DynamoDB client for tasks table
+        section: Section number to fetch tasks for (groups of 10 levels)
+        language_id: Language identifier for the tasks
+        subscription: User's subscription level (0=free, 1+=premium)
+        compact: Whether to send asset references instead of full URLs
+
+    Returns:
+        HTTP response with selected tasks
+    """
+    selected_tasks = select_tasks(dynamodb, section, language_id, subscription)
+    if selected_tasks is None:
+        return build_response(404, {"message": "No tasks found", "tasks": []})
+
+    return build_tasks_response(selected_tasks, compact)
+
+
+def build_tasks_response(tasks, compact):
+    """
+    Build the response for a lesson.
+
+    In the compact encoding asset URLs are sent as references and the asset
+    bases they point to are sent once next to the tasks.
+
+    Parameters:
+        tasks: Selected tasks, shared with the cache so they are copied
+        compact: Whether to send asset references instead of full URLs
+
+    Returns:
+        HTTP response with the tasks
+    """
+    if compact:
+        return build_response(
+            200,
+            {
+                "message": "Tasks fetched successfully",
+                "asset_bases": TASK_ASSET_BASES,
+                "tasks": [compact_task(task) for task in tasks],
+            },
+            headers={
+                TASK_ENCODING_HEADER: COMPACT_TASK_ENCODING,
+                # Cross-origin clients can only read the encoding when exposed
+                "Access-Control-Expose-Headers": TASK_ENCODING_HEADER,
+            },
+        )
+
+    return build_response(
+        200,
+        {
+            "message": "Tasks fetched successfully",
+            "tasks": [expand_task(task) for task in tasks],
+        },
+    )
+
+
+def select_tasks(dynamodb, section, language_id, subscription):
     """
     Generate a list of learning tasks for the user based on their section,
     language, and subscription status.
@@ -149,57 +283,65 @@ def get_list_of_tasks(dynamodb, section, language_id, subscription):
         subscription: User's subscription level (0=free, 1+=premium)
 
     Returns:
-        HTTP response with selected tasks
+        list: Selected tasks, or None if there are no tasks at all
     """
-    logger.info(f"Getting list of tasks for section {section}")
+    logger.info("Getting list of tasks for section %s", section)
 
-    # Attempt to get tasks for the requested section
-    tasks = get_tasks_for_section(dynamodb, section, language_id)
+    # Attempt to get tasks for the requested section, together with the
+    # previous sections that are mixed in when it has tasks
+    if section == 20:
+        tasks, prev_tasks_1 = get_tasks_for_sections(dynamodb, [20, 10], language_id)
+    else:
+        tasks, prev_tasks_1, prev_tasks_2 = get_tasks_for_sections(
+            dynamodb, [section, section - 10, section - 20], language_id
+        )
     selected_tasks = []
 
     # If no tasks found for this section, use fallback logic
     if len(tasks) <= 0:
-        logger.error(f"No tasks found for section: {section}. Getting random tasks.")
+        logger.error("No tasks found for section: %s. Getting random tasks.", section)
 
         if CURRENT_MAX_SECTION == 0:
             logger.error("No tasks found in the database.")
-            return build_response(404, {"message": "No tasks found", "tasks": []})
+            return None
 
         # Create a mix from the three most recent sections
         if CURRENT_MAX_SECTION + 10 == section and CURRENT_MAX_SECTION >= 30:
             logger.info(
-                f"Creating random tasks for section {section} from previous sections"
-            )
-            tasks_1 = get_tasks_for_section(dynamodb, CURRENT_MAX_SECTION, language_id)
-            tasks_2 = get_tasks_for_section(
-                dynamodb, CURRENT_MAX_SECTION - 10, language_id
+                "Creating random tasks for section %s from previous sections", section
             )
-            tasks_3 = get_tasks_for_section(
-                dynamodb, CURRENT_MAX_SECTION - 20, language_id
+            tasks_1, tasks_2, tasks_3 = get_tasks_for_sections(
+                dynamodb,
+                [
+                    CURRENT_MAX_SECTION,
+                    CURRENT_MAX_SECTION - 10,
+                    CURRENT_MAX_SECTION - 20,
+                ],
+                language_id,
             )
 
         # For other sections, use current max section and two random previous sections
         else:
             logger.info(
-                f"Creating random tasks for section {section} from previous sections"
+                "Creating random tasks for section %s from previous sections", section
             )
             section_1, section_2 = get_two_random_sections(CURRENT_MAX_SECTION)
 
-            tasks_1 = get_tasks_for_section(dynamodb, CURRENT_MAX_SECTION, language_id)
-            tasks_2 = get_tasks_for_section(dynamodb, section_1, language_id)
-            tasks_3 = get_tasks_for_section(dynamodb, section_2, language_id)
+            tasks_1, tasks_2, tasks_3 = get_tasks_for_sections(
+                dynamodb, [CURRENT_MAX_SECTION, section_1, section_2], language_id
+            )
 
 
         # Select tasks based on subscription status
         # Premium users get more advanced tasks (version 3)
         if subscription >= 1:
-            logger.info(f"User is premium, selecting more advanced tasks")
+            logger.info("User is premium, selecting more advanced tasks")
 
             selected_tasks_1 = chose_tasks(tasks_1, 3, 3, 2)
             selected_tasks_2 = chose_tasks(tasks_2, 2, 1, 1)
             selected_tasks_3 = chose_tasks(tasks_3, 1, 1, 1)
         else:
-            logger.info(f"User is free, selecting basic tasks")
+            logger.info("User is free, selecting basic tasks")
 
             selected_tasks_1 = chose_tasks(tasks_1, 4, 4, 0)
             selected_tasks_2 = chose_tasks(tasks_2, 3, 1, 0)
@@ -211,16 +353,16 @@ def get_list_of_tasks(dynamodb, section, language_id, subscription):
 
     # If tasks for this section exist, build a set from this section and previous ones
     else:
-        logger.info(f"Tasks found for section {section}.")
+        logger.info("Tasks found for section %s.", section)
         # Select base tasks from current section based on subscription
         if subscription >= 1:
             if section == 10:
-                logger.info(f"User is premium, selecting more advanced tasks")
+                logger.info("User is premium, selecting more advanced tasks")
                 selected_tasks = chose_tasks(tasks, 6, 5, 4)
             else:
                 selected_tasks = chose_tasks(tasks, 4, 4, 2)
         else:
-            logger.info(f"User is free, selecting basic tasks")
+            logger.info("User is free, selecting basic tasks")
             if section == 10:
                 selected_tasks = chose_tasks(tasks, 8, 7, 0)
             else:
@@ -228,20 +370,15 @@ def get_list_of_tasks(dynamodb, section, language_id, subscription):
 
         # For second section, include some tasks from first section
         if section == 20:
-            tasks = get_tasks_for_section(dynamodb, 10, language_id)
-
             if subscription >= 1:
-                prev_section_tasks = chose_tasks(tasks, 2, 2, 1)
+                prev_section_tasks = chose_tasks(prev_tasks_1, 2, 2, 1)
             else:
-                prev_section_tasks = chose_tasks(tasks, 3, 2, 0)
+                prev_section_tasks = chose_tasks(prev_tasks_1, 3, 2, 0)
 
             selected_tasks.extend(prev_section_tasks)
 
         # For all other sections, include tasks from the two previous sections
         else:
-            prev_tasks_1 = get_tasks_for_section(dynamodb, section - 10, language_id)
-            prev_tasks_2 = get_tasks_for_section(dynamodb, section - 20, language_id)
-
             if subscription >= 1:
                 prev_section_tasks_1 = chose_tasks(prev_tasks_1, 1, 1, 1)
                 prev_section_tasks_2 = chose_tasks(prev_tasks_2, 1, 1, 0)
@@ -252,25 +389,24 @@ def get_list_of_tasks(dynamodb, section, language_id, subscription):
             selected_tasks.extend(prev_section_tasks_1)
             selected_tasks.extend(prev_section_tasks_2)
 
-    # Convert any Decimal values to standard floats for JSON serialization
-    selected_tasks = convert_decimal_to_float(selected_tasks)
+    return selected_tasks
 
-    return build_response(
-        200, {"message": "Tasks fetched successfully", "tasks": selected_tasks}
-    )
 
+def get_tasks_for_sections(dynamodb, sections, language_id):
+    """
+    Get the tasks of several sections, querying them concurrently.
 
-def get_tasks_for_section(dynamodb, section, language_id):
-    logger.info(f"Getting tasks for section {section} and language {language_id}")
+    Parameters:
+        dynamodb: DynamoDB client for tasks table
+        sections: Section numbers to fetch tasks for
+        language_id: Language identifier for the tasks
 
-    response = dynamodb.table.query(
-        IndexName="section-language-index",
-        KeyConditionExpression=(
-            Key("section").eq(section) & Key("language_id").eq(language_id)
-        ),
-    )
+    Returns:
+        list: TaskPool for each section, in the same order
+    """
+    logger.info("Getting tasks for sections %s and language %s", sections, language_id)
 
-    return response.get("Items", [])
+    return get_task_pools(dynamodb, sections, language_id)
 
 
 def chose_tasks(tasks, num_v1, num_v2, num_v3):
@@ -278,7 +414,7 @@ def chose_tasks(tasks, num_v1, num_v2, num_v3):
     Select a mix of tasks based on their version/difficulty level.
 
     Parameters:
-        tasks: List of all available tasks to choose from
+        tasks: TaskPool of all available tasks to choose from
         num_v1: Number of version 1 (basic) tasks to include
         num_v2: Number of version 2 (intermediate) tasks to include
         num_v3: Number of version 3 (advanced) tasks to include
@@ -286,24 +422,16 @@ def chose_tasks(tasks, num_v1, num_v2, num_v3):
     Returns:
         list: Selected tasks with desired distribution of difficulty levels
     """
-    tasks_by_version = {1: [], 2: [], 3: []}
-    logger.info(f"choosing tasks from {len(tasks)} tasks")
-
-    # Group tasks by their version
-    for task in tasks:
-        version = task.get("version")
-        if version in tasks_by_version:
-            tasks_by_version[version].append(task)
+    logger.info("choosing tasks from %s tasks", len(tasks))
 
-    # Shuffle tasks within each version group for randomness
-    for version in tasks_by_version:
-        random.shuffle(tasks_by_version[version])
-
-    # Take the required number from each version
+    # Take the required number of random tasks from each version, sampling
+    # leaves the cached version lists untouched
     chosen_tasks = []
-    chosen_tasks.extend(tasks_by_version[1][:num_v1])
-    chosen_tasks.extend(tasks_by_version[2][:num_v2])
-    chosen_tasks.extend(tasks_by_version[3][:num_v3])
+    for version, num_tasks in ((1, num_v1), (2, num_v2), (3, num_v3)):
+        version_tasks = tasks.version(version)
+        chosen_tasks.extend(
+            random.sample(version_tasks, min(num_tasks, len(version_tasks)))
+        )
 
     random.shuffle(chosen_tasks)
 
@@ -321,7 +449,7 @@ def get_two_random_sections(max_section):
         Returns:
             tuple: Two different randomly selected section numbers
         """
-    logger.info(f"Getting two random sections from 10 to {max_section}")
+    logger.info("Getting two random sections from 10 to %s", max_section)
 
     # If max_section is less than 30, return a fixed set of sections
     if max_section < 20:
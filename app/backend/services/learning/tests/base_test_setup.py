@@ -35,6 +35,10 @@ class LambdaDynamoDBClass:
 @mock_aws
 class BaseTestSetup(unittest.TestCase):
     def setUp(self):
+        # Cached table snapshots belong to the previous test's tables
+        from snapshot import clear_snapshots
+        clear_snapshots()
+
         # Environment variables
         os.environ["TASKS_TABLE_NAME"] = "test_tasks_table"
         os.environ["LANGUAGES_TABLE_NAME"] = "test_languages_table"
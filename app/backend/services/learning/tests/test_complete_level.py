@@ -14,8 +14,9 @@ BaseTestSetup.setup_paths('completeLevel')
 BaseTestSetup.clear_module_cache(['validation_schema', 'common', 'completeLevel.app'])
 
 from moto import mock_aws
-from completeLevel.app import lambda_handler
+from completeLevel.app import lambda_handler, get_user_and_language
 from auth import generate_jwt_token
+import achievements
 
 
 @mock_aws
@@ -889,6 +890,253 @@ class TestCompleteLevel(BaseTestSetup):
         # print(f"\nNew achievements: {body['new_achievements']}")
 
 
+    def test_complete_level_retries_after_concurrent_update(self):
+        """
+        Test that a user updated between the read and the write is read again,
+        so the concurrent change is kept and the level is applied on top of it.
+        """
+        email = "test@mail.com"
+        jwt_token = generate_jwt_token(email)
+
+        initial_user = self.users_table.get_item(Key={'email': email})['Item']
+        initial_xp = Decimal(str(initial_user['xp']))
+
+        reads = []
+
+        def read_then_update_concurrently(*args, **kwargs):
+            result = get_user_and_language(*args, **kwargs)
+            reads.append(result)
+
+            # Another lesson finishes right after the first read
+            if len(reads) == 1:
+                self.users_table.update_item(
+                    Key={'email': email},
+                    UpdateExpression="SET xp = xp + :xp, version = :version",
+                    ExpressionAttributeValues={":xp": 100, ":version": 7},
+                )
+
+            return result
+
+        event = {
+            'headers': {
+                'Authorization': jwt_token
+            },
+            "body": json.dumps({
+                "correct_answers_versions": [1, 2, 3],
+                "started_at": "2023-10-01T12:00:00Z",
+                "finished_at": "2023-10-01T12:30:00Z",
+                "language_id": "en",
+                "letters_learned": ["A", "B", "C"]
+            })
+        }
+
+        with patch('completeLevel.app.get_user_and_language', side_effect=read_then_update_concurrently):
+            response = lambda_handler(event, {})
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(len(reads), 2)
+
+        updated_user = self.users_table.get_item(Key={'email': email})['Item']
+        self.assertEqual(updated_user['xp'], initial_xp + 100 + 10)
+        self.assertEqual(updated_user['version'], 8)
+
+
+    def test_complete_level_keeps_concurrent_purchase(self):
+        """
+        Test that coins spent between the read and the write, by a writer that
+        doesn't bump the version, are not overwritten by the earned coins.
+        """
+        email = "test@mail.com"
+        jwt_token = generate_jwt_token(email)
+
+        self.users_table.update_item(
+            Key={'email': email},
+            UpdateExpression="SET coins = :coins",
+            ExpressionAttributeValues={":coins": 100},
+        )
+
+        def read_then_purchase(*args, **kwargs):
+            result = get_user_and_language(*args, **kwargs)
+
+            # A shop purchase lands right after the read
+            self.users_table.update_item(
+                Key={'email': email},
+                UpdateExpression="SET coins = coins - :price",
+                ExpressionAttributeValues={":price": 30},
+            )
+
+            return result
+
+        event = {
+            'headers': {
+                'Authorization': jwt_token
+            },
+            "body": json.dumps({
+                "correct_answers_versions": [1, 2, 3],
+                "started_at": "2023-10-01T12:00:00Z",
+                "finished_at": "2023-10-01T12:30:00Z",
+                "language_id": "en",
+                "letters_learned": ["A", "B", "C"]
+            })
+        }
+
+        with patch('completeLevel.app.get_user_and_language', side_effect=read_then_purchase):
+            response = lambda_handler(event, {})
+        body = json.loads(response['body'])
+
+        self.assertEqual(response['statusCode'], 200)
+
+        updated_user = self.users_table.get_item(Key={'email': email})['Item']
+        self.assertEqual(updated_user['coins'], 100 - 30 + Decimal(str(body['coins'])))
+
+
+    def test_complete_level_keeps_concurrent_claim(self):
+        """
+        Test that a battlepass claim landing between the read and the write
+        keeps its claimed level and coins.
+        """
+        email = "test@mail.com"
+        jwt_token = generate_jwt_token(email)
+        reads = []
+
+        def read_then_claim(*args, **kwargs):
+            result = get_user_and_language(*args, **kwargs)
+            reads.append(result)
+
+            # claimBattlepassLevel writes the battlepass it read and bumps the version
+            if len(reads) == 1:
+                user = self.users_table.get_item(Key={'email': email})['Item']
+                battlepass = user.get('battlepass', []) + [
+                    {"season_id": "claimed_season", "xp": 500, "claimed_levels": [4]}
+                ]
+                self.users_table.update_item(
+                    Key={'email': email},
+                    UpdateExpression=(
+                        "SET battlepass = :battlepass, "
+                        "version = if_not_exists(version, :zero) + :one ADD coins :coins"
+                    ),
+                    ExpressionAttributeValues={
+                        ":battlepass": battlepass, ":zero": 0, ":one": 1, ":coins": 60
+                    },
+                )
+
+            return result
+
+        initial_user = self.users_table.get_item(Key={'email': email})['Item']
+        event = {
+            'headers': {
+                'Authorization': jwt_token
+            },
+            "body": json.dumps({
+                "correct_answers_versions": [1, 2, 3],
+                "started_at": "2023-10-01T12:00:00Z",
+                "finished_at": "2023-10-01T12:30:00Z",
+                "language_id": "en",
+                "letters_learned": ["A", "B", "C"]
+            })
+        }
+
+        with patch('completeLevel.app.get_user_and_language', side_effect=read_then_claim):
+            response = lambda_handler(event, {})
+        body = json.loads(response['body'])
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(len(reads), 2)
+
+        updated_user = self.users_table.get_item(Key={'email': email})['Item']
+        claimed_season = next(
+            bp for bp in updated_user['battlepass'] if bp.get('season_id') == "claimed_season"
+        )
+        self.assertEqual(claimed_season['claimed_levels'], [4])
+        self.assertEqual(
+            updated_user['coins'],
+            initial_user.get('coins', 0) + 60 + Decimal(str(body['coins']))
+        )
+
+
+    def test_complete_level_gives_up_after_repeated_conflicts(self):
+        """
+        Test response when the user keeps changing between the read and the write.
+        """
+        email = "test@mail.com"
+        jwt_token = generate_jwt_token(email)
+
+        def read_then_update_concurrently(*args, **kwargs):
+            result = get_user_and_language(*args, **kwargs)
+            self.users_table.update_item(
+                Key={'email': email},
+                UpdateExpression="ADD version :one",
+                ExpressionAttributeValues={":one": 1},
+            )
+            return result
+
+        event = {
+            'headers': {
+                'Authorization': jwt_token
+            },
+            "body": json.dumps({
+                "correct_answers_versions": [1, 2, 3],
+                "started_at": "2023-10-01T12:00:00Z",
+                "finished_at": "2023-10-01T12:30:00Z",
+                "language_id": "en",
+                "letters_learned": ["A", "B", "C"]
+            })
+        }
+
+        with patch('completeLevel.app.get_user_and_language', side_effect=read_then_update_concurrently):
+            response = lambda_handler(event, {})
+
+        self.assertEqual(response['statusCode'], 409)
+
+
+    def test_achievements_catalog_is_loaded_once(self):
+        """
+        Test that the achievements table is scanned once and thresholds crossed
+        by later lessons are awarded from the cached catalog.
+        """
+        for achievement in [
+            {"id": "xp_10", "type": "xp", "requires": 10},
+            {"id": "xp_20", "type": "xp", "requires": 20},
+            {"id": "xp_1000", "type": "xp", "requires": 1000},
+        ]:
+            self.achievements_table.put_item(Item=achievement)
+
+        self.users_table.put_item(Item={
+            "email": "catalog@mail.com",
+            "xp": 0,
+            "achievements": [],
+            "letters_learned": {},
+        })
+        jwt_token = generate_jwt_token("catalog@mail.com")
+
+        earned = []
+        with patch('achievements.scan_all', wraps=achievements.scan_all) as mock_scan:
+            for _ in range(2):
+                event = {
+                    'headers': {
+                        'Authorization': jwt_token
+                    },
+                    "body": json.dumps({
+                        "correct_answers_versions": [1, 2, 3],
+                        "started_at": "2023-10-01T12:00:00Z",
+                        "finished_at": "2023-10-01T12:00:10Z",
+                        "language_id": "en",
+                        "letters_learned": ["A"]
+                    })
+                }
+                response = lambda_handler(event, {})
+                self.assertEqual(response['statusCode'], 200)
+
+                body = json.loads(response['body'])
+                earned.append([achievement['id'] for achievement in body['new_achievements']])
+
+        self.assertEqual(mock_scan.call_count, 1)
+        self.assertEqual(earned, [["xp_10"], ["xp_20"]])
+
+        updated_user = self.users_table.get_item(Key={'email': "catalog@mail.com"})['Item']
+        self.assertEqual(updated_user['achievements'], ["xp_10", "xp_20"])
+
+
     def test_complete_level_with_multiple_xp_multipliers(self):
         """
         Test level completion with multiple XP multipliers, where only the max should apply.
@@ -2,7 +2,7 @@ import json
 import sys
 import os
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 from base_test_setup import BaseTestSetup
 
 original_path = sys.path.copy()
@@ -12,6 +12,9 @@ BaseTestSetup.clear_module_cache(['validation_schema', 'common', 'getListOfTasks
 from moto import mock_aws
 from getListOfTasks.app import lambda_handler
 from auth import generate_jwt_token
+from boto import LambdaDynamoDBClass
+import task_pool
+import languages
 
 @mock_aws
 class TestGetListOfTasks(BaseTestSetup):
@@ -203,6 +206,244 @@ class TestGetListOfTasks(BaseTestSetup):
         self.assertEqual(first_task["section"], 10)
 
 
+    def test_task_pools_are_cached(self):
+        """
+        Test that each section is queried once and later lessons are served
+        from the cached task pools.
+        """
+        jwt_token = generate_jwt_token("test@mail.com")
+
+        for version in [1, 2, 3]:
+            for i in range(10):
+                self.tasks_table.put_item(Item={
+                    "task_id": f"cached-task-10-{version}-{i}",
+                    "section": 10,
+                    "section_name": "Test Section 10",
+                    "version": version,
+                    "question": f"Test question version {version}",
+                    "possible_answers": ["A", "B", "C", "D"],
+                    "correct_answer_index": 0,
+                    "language_id": "es"
+                })
+
+        with patch('task_pool._query_tasks', wraps=task_pool._query_tasks) as mock_query:
+            for _ in range(3):
+                event = {
+                    'headers': {
+                        'Authorization': jwt_token
+                    },
+                    "queryStringParameters": {
+                        "level": "1",
+                        "language": "es"
+                    }
+                }
+
+                response = lambda_handler(event, {})
+                body = json.loads(response['body'])
+
+                self.assertEqual(response['statusCode'], 200)
+                self.assertEqual(len(body["tasks"]), 15)
+                self.assertEqual(len({task["task_id"] for task in body["tasks"]}), 15)
+
+        # Section 10 plus the two (empty) previous sections
+        self.assertEqual(mock_query.call_count, 3)
+
+
+    def test_languages_catalog_is_loaded_once(self):
+        """
+        Test that the languages table is scanned once and later language checks,
+        including unknown languages, are answered from the cached catalog.
+        """
+        jwt_token = generate_jwt_token("test@mail.com")
+
+        with patch('languages.scan_all', wraps=languages.scan_all) as mock_scan:
+            for language, expected_status_code in [("es", 200), ("es", 200), ("xx", 404)]:
+                event = {
+                    'headers': {
+                        'Authorization': jwt_token
+                    },
+                    "queryStringParameters": {
+                        "level": "1",
+                        "language": language
+                    }
+                }
+
+                response = lambda_handler(event, {})
+
+                self.assertEqual(response['statusCode'], expected_status_code)
+
+        self.assertEqual(mock_scan.call_count, 1)
+
+
+    def test_lesson_bundle_is_served(self):
+        """
+        Test that a precomputed lesson bundle is returned when one was built,
+        and that the lesson is built from the task pools when it wasn't.
+        """
+        bundles_table = self.dynamodb.create_table(
+            TableName="test_lesson_bundles_table",
+            AttributeDefinitions=[
+                {"AttributeName": "bundle_key", "AttributeType": "S"},
+                {"AttributeName": "bundle_index", "AttributeType": "N"}
+            ],
+            KeySchema=[
+                {"AttributeName": "bundle_key", "KeyType": "HASH"},
+                {"AttributeName": "bundle_index", "KeyType": "RANGE"}
+            ],
+            BillingMode="PAY_PER_REQUEST"
+        )
+        bundles_table.put_item(Item={
+            "bundle_key": "10#es#free",
+            "bundle_index": 0,
+            "tasks": [{"task_id": "bundled-task", "section": 10, "version": 1}]
+        })
+
+        for version in [1, 2, 3]:
+            for i in range(10):
+                self.tasks_table.put_item(Item={
+                    "task_id": f"pool-task-10-{version}-{i}",
+                    "section": 10,
+                    "version": version,
+                    "language_id": "es"
+                })
+
+        jwt_token = generate_jwt_token("test@mail.com")
+
+        with patch('getListOfTasks.app.LESSON_BUNDLES_PER_KEY', 1), \
+                patch('getListOfTasks.app._LAMBDA_LESSON_BUNDLES_TABLE_RESOURCE', {
+                    "resource": self.dynamodb,
+                    "table_name": "test_lesson_bundles_table"
+                }):
+            tasks_by_subscription = {}
+            for subscription in [0, 1]:
+                self.users_table.update_item(
+                    Key={"email": "test@mail.com"},
+                    UpdateExpression="SET subscription = :subscription",
+                    ExpressionAttributeValues={":subscription": subscription},
+                )
+
+                event = {
+                    'headers': {
+                        'Authorization': jwt_token
+                    },
+                    "queryStringParameters": {
+                        "level": "1",
+                        "language": "es"
+                    }
+                }
+
+                response = lambda_handler(event, {})
+                self.assertEqual(response['statusCode'], 200)
+                tasks_by_subscription[subscription] = json.loads(response['body'])["tasks"]
+
+        self.assertEqual([task["task_id"] for task in tasks_by_subscription[0]], ["bundled-task"])
+
+        # No premium bundle was built
+        self.assertEqual(len(tasks_by_subscription[1]), 15)
+
+
+    def test_compact_task_encoding(self):
+        """
+        Test that stored asset references are expanded to full URLs by default
+        and sent with the asset bases to clients that opt in.
+        """
+        for version in [1, 2, 3]:
+            for i in range(10):
+                self.tasks_table.put_item(Item={
+                    "task_id": f"asset-task-10-{version}-{i}",
+                    "section": 10,
+                    "version": version,
+                    "question": "@s3:asl/J.png",
+                    "possible_answers": ["T", "https://gestura-sign-language.s3.eu-central-1.amazonaws.com/asl/J.png"],
+                    "correct_answer_index": 1,
+                    "language_id": "es"
+                })
+
+        jwt_token = generate_jwt_token("test@mail.com")
+
+        responses = {}
+        for encoding in [None, "compact"]:
+            event = {
+                'headers': {
+                    'Authorization': jwt_token
+                },
+                "queryStringParameters": {
+                    "level": "1",
+                    "language": "es"
+                }
+            }
+            if encoding:
+                event['headers']['X-Task-Encoding'] = encoding
+
+            response = lambda_handler(event, {})
+            self.assertEqual(response['statusCode'], 200)
+            responses[encoding] = response
+
+        url = "https://gestura-sign-language.s3.eu-central-1.amazonaws.com/asl/J.png"
+
+        body = json.loads(responses[None]['body'])
+        self.assertNotIn("asset_bases", body)
+        for task in body["tasks"]:
+            self.assertEqual(task["question"], url)
+            self.assertEqual(task["possible_answers"], ["T", url])
+
+        body = json.loads(responses["compact"]['body'])
+        self.assertEqual(responses["compact"]['headers']['x-task-encoding'], "compact")
+        self.assertEqual(responses["compact"]['headers']['Access-Control-Expose-Headers'], "x-task-encoding")
+        self.assertIn("X-Task-Encoding", responses["compact"]['headers']['Access-Control-Allow-Headers'].split(","))
+        self.assertEqual(body["asset_bases"], {"s3": "https://gestura-sign-language.s3.eu-central-1.amazonaws.com/"})
+        for task in body["tasks"]:
+            self.assertEqual(task["question"], "@s3:asl/J.png")
+            self.assertEqual(task["possible_answers"], ["T", "@s3:asl/J.png"])
+
+
+    def test_task_pools_are_queried_concurrently(self):
+        """
+        Test that uncached sections are queried on the worker pool, once per
+        distinct section, and returned in the requested order.
+        """
+        for section in [10, 20]:
+            self.tasks_table.put_item(Item={
+                "task_id": f"concurrent-task-{section}",
+                "section": section,
+                "version": 1,
+                "language_id": "pt"
+            })
+
+        dynamodb = LambdaDynamoDBClass({
+            "resource": self.dynamodb,
+            "table_name": os.environ["TASKS_TABLE_NAME"]
+        })
+
+        with patch('task_pool._query_tasks', wraps=task_pool._query_tasks) as mock_query:
+            pools = task_pool.get_task_pools(dynamodb, [20, 10, 20, 30], "pt")
+
+        self.assertEqual(mock_query.call_count, 3)
+        self.assertEqual(
+            [[task["task_id"] for task in pool.version(1)] for pool in pools],
+            [["concurrent-task-20"], ["concurrent-task-10"], ["concurrent-task-20"], []]
+        )
+
+
+    def test_task_pool_follows_pagination(self):
+        """
+        Test that every page of a large section is loaded into the task pool.
+        """
+        dynamodb = MagicMock()
+        dynamodb.table.query.side_effect = [
+            {"Items": [{"task_id": "1", "version": 1}], "LastEvaluatedKey": {"task_id": "1"}},
+            {"Items": [{"task_id": "2", "version": 2}, {"task_id": "3", "version": 3}]},
+        ]
+
+        pool = task_pool.TaskPool(task_pool._query_tasks(dynamodb, 10, "es"))
+
+        self.assertEqual(len(pool), 3)
+        self.assertEqual([task["task_id"] for task in pool.version(2)], ["2"])
+        self.assertEqual(
+            dynamodb.table.query.call_args_list[1].kwargs["ExclusiveStartKey"], {"task_id": "1"}
+        )
+
+
     def test_when_no_current_level_for_language(self):
         """
         Test response when the user has no current level for the specified language.
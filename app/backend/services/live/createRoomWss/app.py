@@ -1,21 +1,21 @@
-import logging
-import os
+from log import get_logger, log_event, start_request
 import json
 from uuid import uuid4
 
-from boto3 import client
-
-logger = logging.getLogger("CreateRoomWss")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("CreateRoomWss")
 
 from boto import (
     LambdaDynamoDBClass,
+    get_websocket_client,
     _LAMBDA_CHAT_ROOM_TABLE_RESOURCE,
+    _LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE,
 )
+from rooms import add_room_membership
 
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event: {event}")
+    start_request(context)
+    log_event(logger, event)
 
     body = event.get("body")
     if body is not None:
@@ -34,17 +34,25 @@ def lambda_handler(event, context):
         return {"statusCode": 400, "body": "Connection ID not found."}
 
     logger.info("Setting up db connections")
-    global _LAMBDA_CHAT_ROOM_TABLE_RESOURCE
+    global _LAMBDA_CHAT_ROOM_TABLE_RESOURCE, _LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE
     chatRoomDb = LambdaDynamoDBClass(_LAMBDA_CHAT_ROOM_TABLE_RESOURCE)
+    connectionRoomsDb = LambdaDynamoDBClass(_LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE)
+
+    ws = get_websocket_client()
+
+    logger.debug("User connection: %s", connection_id)
+    room = create_room(chatRoomDb, connection_id, peer_id)
+    room_id = room["chat_id"]
+    add_room_membership(
+        connectionRoomsDb,
+        connection_id,
+        room_id,
+        peer_id,
+        room["user_connections"],
+        room["version"],
+    )
 
-    raw = os.environ["WEBSOCKET_ENDPOINT"]
-    https_url = raw.replace("wss://", "https://", 1)
-    ws = client("apigatewaymanagementapi", endpoint_url=https_url)
-
-    logger.debug(f"User connection: {connection_id}")
-    room_id = create_room(chatRoomDb, connection_id, peer_id)
-
-    logger.info(f"Sending message to {connection_id}")
+    logger.info("Sending message to %s", connection_id)
     ws.post_to_connection(
         ConnectionId=connection_id,
         Data=json.dumps({"action": "room-created", "roomId": room_id}).encode("utf-8"),
@@ -55,15 +63,15 @@ def lambda_handler(event, context):
 
 def create_room(db, connection_id, peer_id):
     room_id = str(uuid4())
-    logger.debug(f"Creating chat room with ID: {room_id}")
+    logger.debug("Creating chat room with ID: %s", room_id)
 
-    user_connections = {connection_id: peer_id}
+    room = {
+        "chat_id": room_id,
+        "user_connections": {connection_id: peer_id},
+        # Bumped on every change of user_connections, see rooms.get_room_session
+        "version": 1,
+    }
 
-    db.table.put_item(
-        Item={
-            "chat_id": room_id,
-            "user_connections": user_connections,
-        }
-    )
+    db.table.put_item(Item=room)
 
-    return room_id
+    return room
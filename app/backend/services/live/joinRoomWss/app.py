@@ -1,20 +1,22 @@
-import logging
+from log import get_logger, log_event, start_request
 import json
-import os
-from boto3 import client
 from botocore.exceptions import ClientError
 
 from boto import (
     LambdaDynamoDBClass,
+    get_websocket_client,
     _LAMBDA_CHAT_ROOM_TABLE_RESOURCE,
+    _LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE,
 )
+from rooms import add_room_membership
+from broadcast import broadcast_to_room
 
-logger = logging.getLogger("JoinRoomWss")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("JoinRoomWss")
 
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event: {event}")
+    start_request(context)
+    log_event(logger, event)
 
     body = event.get("body")
     if body is not None:
@@ -38,12 +40,11 @@ def lambda_handler(event, context):
         return {"statusCode": 400, "body": "Connection ID not found."}
 
     logger.info("Setting up db connections")
-    global _LAMBDA_CHAT_ROOM_TABLE_RESOURCE
+    global _LAMBDA_CHAT_ROOM_TABLE_RESOURCE, _LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE
     chatRoomDb = LambdaDynamoDBClass(_LAMBDA_CHAT_ROOM_TABLE_RESOURCE)
+    connectionRoomsDb = LambdaDynamoDBClass(_LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE)
 
-    raw = os.environ["WEBSOCKET_ENDPOINT"]
-    https_url = raw.replace("wss://", "https://", 1)
-    ws = client("apigatewaymanagementapi", endpoint_url=https_url)
+    ws = get_websocket_client()
 
     room = update_room(chatRoomDb, room_id, connection_id, peer_id)
     if not room:
@@ -53,20 +54,23 @@ def lambda_handler(event, context):
     # 1) Notify everyone else in the room that you joined
     user_connections: dict = room.get("user_connections", {})
 
-    for other_conn_id in user_connections.keys():
-        # skip the socket that just joined
-        if other_conn_id == connection_id:
-            continue
-
-        try:
-            ws.post_to_connection(
-                ConnectionId=other_conn_id,
-                Data=json.dumps({"action": "user-joined", "peerId": peer_id}).encode(
-                    "utf-8"
-                ),
-            )
-        except ClientError as e:
-            logger.info(f"Skipping stale connection {other_conn_id}: {e}")
+    add_room_membership(
+        connectionRoomsDb,
+        connection_id,
+        room_id,
+        peer_id,
+        user_connections,
+        room.get("version", 0),
+    )
+
+    broadcast_to_room(
+        ws,
+        chatRoomDb,
+        connectionRoomsDb,
+        room_id,
+        [conn_id for conn_id in user_connections if conn_id != connection_id],
+        {"action": "user-joined", "peerId": peer_id},
+    )
 
     # 2) Send the full list of users back to the joining socket
     user_list = list(user_connections.values())
@@ -78,7 +82,7 @@ def lambda_handler(event, context):
             ).encode("utf-8"),
         )
     except ClientError as e:
-        logger.error(f"Failed to send user list back: {e}")
+        logger.error("Failed to send user list back: %s", e)
 
     return {"statusCode": 200, "body": "Room joined."}
 
@@ -86,13 +90,14 @@ def lambda_handler(event, context):
 def update_room(db, room_id, connection_id, peer_id):
     """
     Adds or replaces the mapping connection_id → peer_id
-    inside the user_connections map on the given chat room item.
+    inside the user_connections map on the given chat room item
+    and bumps the room version.
     """
     resp = db.table.update_item(
         Key={"chat_id": room_id},
-        UpdateExpression="SET user_connections.#conn = :peer",
+        UpdateExpression="SET user_connections.#conn = :peer ADD version :one",
         ExpressionAttributeNames={"#conn": connection_id},
-        ExpressionAttributeValues={":peer": peer_id},
+        ExpressionAttributeValues={":peer": peer_id, ":one": 1},
         ReturnValues="ALL_NEW",
     )
 
@@ -1,8 +1,7 @@
-import logging
+from log import get_logger, start_request
 import traceback
 
-logger = logging.getLogger("OnConnectWss")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("OnConnectWss")
 
 from auth import get_email_from_jwt_token
 from boto import (
@@ -12,6 +11,8 @@ from boto import (
 
 
 def lambda_handler(event, context):
+    start_request(context)
+
     try:
         # Getting JWT token from query parameters
         jwt_token = event.get("queryStringParameters", {}).get("x-access-token")
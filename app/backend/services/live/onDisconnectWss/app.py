@@ -1,22 +1,24 @@
-import logging
-import os
-import json
+from log import get_logger, start_request
 
-from boto3 import client
 from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
-logger = logging.getLogger("OnDisconnectWss")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("OnDisconnectWss")
 
 from boto import (
     LambdaDynamoDBClass,
+    get_websocket_client,
     _LAMBDA_CONNECTIONS_TABLE_RESOURCE,
     _LAMBDA_CHAT_ROOM_TABLE_RESOURCE,
+    _LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE,
 )
+from rooms import get_connection_rooms, remove_room_memberships, delete_empty_room
+from broadcast import broadcast_to_room
 
 
 def lambda_handler(event, context):
+    start_request(context)
+
     connection_id = event.get("requestContext").get("connectionId")
 
     if not connection_id:
@@ -26,69 +28,64 @@ def lambda_handler(event, context):
     # Getting dynamodb table connection
     global _LAMBDA_CONNECTIONS_TABLE_RESOURCE
     global _LAMBDA_CHAT_ROOM_TABLE_RESOURCE
+    global _LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE
     dynamodb = LambdaDynamoDBClass(_LAMBDA_CONNECTIONS_TABLE_RESOURCE)
     chatRoomDb = LambdaDynamoDBClass(_LAMBDA_CHAT_ROOM_TABLE_RESOURCE)
+    connectionRoomsDb = LambdaDynamoDBClass(_LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE)
 
     logger.info("Setting up db connections")
-    raw = os.environ["WEBSOCKET_ENDPOINT"]
-    https_url = raw.replace("wss://", "https://", 1)
-    ws = client("apigatewaymanagementapi", endpoint_url=https_url)
+    ws = get_websocket_client()
 
     logger.info("Deleting connection from user.")
 
     connections = query_connections_by_id(dynamodb, connection_id)
 
     if connections:
-        logger.info(f"Deleting connection: {connections[0]}")
+        logger.info("Deleting connection: %s", connections[0])
         delete_connection(dynamodb, connections[0].get("email"))
 
-    rooms = chatRoomDb.table.scan().get("Items", [])
-    logger.info(f"Rooms: {rooms}")
+    # Only the rooms this connection joined, looked up in the membership index
+    memberships = get_connection_rooms(connectionRoomsDb, connection_id)
+    logger.info(
+        "Connection %s is in rooms: %s",
+        connection_id,
+        [membership["chat_id"] for membership in memberships],
+    )
 
-    for room in rooms:
-        room_id = room["chat_id"]
-        user_conns: dict = room.get("user_connections", {})
-        conn_ids = list(user_conns.keys())
+    for membership in memberships:
+        room_id = membership["chat_id"]
 
-        logger.debug(f"Room {room_id} has connections: {conn_ids}")
+        # get current connection peer id
+        peer_id = membership.get("peer_id", "")
 
-        # if this connection isn't here, skip
-        if connection_id not in conn_ids:
+        # remove this connection from the map
+        logger.info("Removing connection %s from room %s", connection_id, room_id)
+        updated_conns = remove_connection_from_room(chatRoomDb, room_id, connection_id)
+        if updated_conns is None:
+            logger.info("Room %s no longer exists", room_id)
             continue
 
-        # get current connection peer id
-        peer_id = user_conns.get(connection_id, "")
-
         # if it was the only one, delete the room
-        if len(conn_ids) <= 1:
-            logger.info(f"No other users in room {room_id}; deleting room.")
-            chatRoomDb.table.delete_item(Key={"chat_id": room_id})
+        if not updated_conns:
+            logger.info("No other users in room %s; deleting room.", room_id)
+            delete_empty_room(chatRoomDb, room_id)
             continue
 
-        # remove this connection from the map
-        logger.info(f"Removing connection {connection_id} from room {room_id}")
-        resp = chatRoomDb.table.update_item(
-            Key={"chat_id": room_id},
-            UpdateExpression="REMOVE user_connections.#conn",
-            ExpressionAttributeNames={"#conn": connection_id},
-            ReturnValues="ALL_NEW",
-        )
-
-        updated_conns: dict = resp["Attributes"].get("user_connections", {})
         remaining_ids = list(updated_conns.keys())
-        logger.info(f"Room {room_id} now has connections: {remaining_ids}")
+        logger.info("Room %s now has connections: %s", room_id, remaining_ids)
 
         # notify everyone else that this peer disconnected
-        for other_conn in remaining_ids:
-            try:
-                ws.post_to_connection(
-                    ConnectionId=other_conn,
-                    Data=json.dumps(
-                        {"action": "user-disconnected", "peerId": peer_id}
-                    ).encode("utf-8"),
-                )
-            except ClientError as e:
-                logger.info(f"Skipping stale connection {other_conn}: {e}")
+        broadcast_to_room(
+            ws,
+            chatRoomDb,
+            connectionRoomsDb,
+            room_id,
+            remaining_ids,
+            {"action": "user-disconnected", "peerId": peer_id},
+        )
+
+    if memberships:
+        remove_room_memberships(connectionRoomsDb, memberships)
 
     logger.info("Successfully disconnected.")
 
@@ -104,3 +101,29 @@ def query_connections_by_id(dynamodb, connection_id):
 
 def delete_connection(dynamodb, email):
     dynamodb.table.delete_item(Key={"email": email})
+
+
+def remove_connection_from_room(dynamodb, room_id, connection_id):
+    """
+    Remove a connection from a room's user_connections map and bump the room
+    version.
+
+    Returns:
+        dict: Remaining connections, or None if the room doesn't exist
+    """
+    try:
+        resp = dynamodb.table.update_item(
+            Key={"chat_id": room_id},
+            UpdateExpression="REMOVE user_connections.#conn ADD version :one",
+            ConditionExpression="attribute_exists(chat_id)",
+            ExpressionAttributeNames={"#conn": connection_id},
+            ExpressionAttributeValues={":one": 1},
+            ReturnValues="ALL_NEW",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return None
+        raise
+
+    return resp["Attributes"].get("user_connections", {})
+
@@ -1,21 +1,21 @@
-import logging
-import os
+from log import get_logger, log_event, start_request
 import json
 
-from boto3 import client
-from botocore.exceptions import ClientError
-
-logger = logging.getLogger("OnDisconnectWss")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("StopSharingWss")
 
 from boto import (
     LambdaDynamoDBClass,
+    get_websocket_client,
     _LAMBDA_CHAT_ROOM_TABLE_RESOURCE,
+    _LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE,
 )
+from rooms import get_room_session
+from broadcast import broadcast_to_room
 
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event: {event}")
+    start_request(context)
+    log_event(logger, event)
 
     body = event.get("body")
     if body is not None:
@@ -30,43 +30,32 @@ def lambda_handler(event, context):
         logger.error("Connection ID not found in event.")
         return {"statusCode": 400, "body": "Connection ID not found."}
 
-    global _LAMBDA_CHAT_ROOM_TABLE_RESOURCE
+    global _LAMBDA_CHAT_ROOM_TABLE_RESOURCE, _LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE
     chatRoomDb = LambdaDynamoDBClass(_LAMBDA_CHAT_ROOM_TABLE_RESOURCE)
-    raw = os.environ["WEBSOCKET_ENDPOINT"]
-    https_url = raw.replace("wss://", "https://", 1)
-    ws = client("apigatewaymanagementapi", endpoint_url=https_url)
+    connectionRoomsDb = LambdaDynamoDBClass(_LAMBDA_CONNECTION_ROOMS_TABLE_RESOURCE)
+    ws = get_websocket_client()
 
-    room = get_room_by_id(chatRoomDb, room_id)
-    if not room:
+    # Peers come from the connection's room session, the room itself is only
+    # read when its version moved on since the session was written
+    session = get_room_session(connectionRoomsDb, chatRoomDb, connection_id, room_id)
+    if not session:
         logger.error("Room not found.")
         return {"statusCode": 400, "body": "Room not found."}
 
-    user_connections: dict = room.get("user_connections", {})
-    peer_id = user_connections.get(connection_id, "")
+    user_connections: dict = session.get("peers", {})
+    if connection_id not in user_connections:
+        logger.info("Connection %s is not in room %s", connection_id, room_id)
+        return {"statusCode": 403, "body": "Not a member of the room."}
 
-    for other_conn_id in user_connections.keys():
-        if other_conn_id == connection_id:
-            continue
+    peer_id = session["peer_id"]
 
-        try:
-            logger.info(f"Sending message to {other_conn_id}")
-            ws.post_to_connection(
-                ConnectionId=other_conn_id,
-                Data=json.dumps(
-                    {"action": "user-stopped-sharing", "peerId": peer_id}
-                ).encode("utf-8"),
-            )
-        except ClientError as e:
-            code = e.response["Error"]["Code"]
-            if code == "GoneException":
-                logger.info(f"Stale connection, skipping: {other_conn_id}")
-            else:
-                logger.error(f"Error posting to {other_conn_id}: {e}")
+    broadcast_to_room(
+        ws,
+        chatRoomDb,
+        connectionRoomsDb,
+        room_id,
+        [conn_id for conn_id in user_connections if conn_id != connection_id],
+        {"action": "user-stopped-sharing", "peerId": peer_id},
+    )
 
     return {"statusCode": 200, "body": "screen shared"}
-
-
-def get_room_by_id(dynamodb, id):
-    room = dynamodb.table.get_item(Key={"chat_id": id})
-
-    return room.get("Item")
@@ -0,0 +1,216 @@
+from log import get_logger, log_event
+import json
+
+from botocore.exceptions import ClientError
+from common import build_response, convert_decimal_to_float
+from middleware import middleware
+from boto import (
+    LambdaDynamoDBClass,
+    _LAMBDA_USERS_TABLE_RESOURCE,
+    _LAMBDA_ITEMS_TABLE_RESOURCE,
+)
+from auth import get_email_from_event
+from catalog import get_catalog_item
+from inventory import update_user_inventory
+from validation_schema import schema
+from dataclasses import dataclass
+from validation import SchemaValidationError, validate
+from typing import List
+
+
+logger = get_logger("BuyCart")
+
+
+@dataclass
+class CartItem:
+    item_id: str
+    quantity: int
+
+
+@dataclass
+class Request:
+    items: List[dict]
+
+
+@middleware
+def lambda_handler(event, context):
+    log_event(logger, event)
+
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
+
+    if not email:
+        logger.error("Invalid email in jwt token %s", email)
+        return build_response(400, {"message": "Invalid email in jwt token"})
+
+    # Parse and validate the request body against JSON schema
+    body = event.get("body")
+    if body is not None:
+        request_body = json.loads(body)
+    else:
+        request_body = event
+
+    try:
+        logger.debug("Validating request %s", request_body)
+        validate(event=request_body, schema=schema)
+    except SchemaValidationError as e:
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
+
+    logger.info("Parsing request body")
+    request = Request(**request_body)
+
+    # Initialize DynamoDB table resources
+    global _LAMBDA_USERS_TABLE_RESOURCE, _LAMBDA_ITEMS_TABLE_RESOURCE
+    users_dynamodb = LambdaDynamoDBClass(_LAMBDA_USERS_TABLE_RESOURCE)
+    items_dynamodb = LambdaDynamoDBClass(_LAMBDA_ITEMS_TABLE_RESOURCE)
+
+    cart = merge_cart([CartItem(**item) for item in request.items])
+
+    return buy_cart(items_dynamodb, users_dynamodb, cart, email)
+
+
+def merge_cart(cart):
+    """
+    Combine cart lines for the same item, keeping the order they were added in.
+
+    Args:
+        cart: List of CartItem
+
+    Returns:
+        list: CartItem per distinct item
+    """
+    merged = {}
+    for line in cart:
+        if line.item_id in merged:
+            merged[line.item_id].quantity += line.quantity
+        else:
+            merged[line.item_id] = CartItem(line.item_id, line.quantity)
+
+    return list(merged.values())
+
+
+def buy_cart(items_dynamodb, users_dynamodb, cart, email):
+    """
+    Purchase every item in the cart, or nothing.
+
+    Prices come from the items catalog. The coins of all coin packs are added,
+    the price of all other items is taken from the balance and they are added
+    to the inventory, in one conditional update of the user.
+
+    Args:
+        items_dynamodb: DynamoDB items table instance
+        users_dynamodb: DynamoDB users table instance
+        cart: List of CartItem, one per distinct item
+        email: User's email
+
+    Returns:
+        dict: HTTP response with status code and message
+    """
+    coins_added = 0
+    total_price = 0
+    new_items = {}
+
+    for line in cart:
+        shop_item = get_catalog_item(items_dynamodb, line.item_id)
+        if shop_item is None:
+            logger.error("Item with id %s does not exist", line.item_id)
+            return build_response(
+                404, {"message": "Item not found.", "item_id": line.item_id}
+            )
+
+        if shop_item.get("category") == "coins":
+            add_coins = int(
+                convert_decimal_to_float(shop_item.get("effect", {}).get("coins", 0))
+            )
+            if add_coins <= 0:
+                logger.error("Invalid coins amount %s", add_coins)
+                return build_response(400, {"message": "Invalid coins amount"})
+
+            coins_added += add_coins * line.quantity
+        else:
+            item_price = int(convert_decimal_to_float(shop_item.get("price")))
+
+            total_price += item_price * line.quantity
+            new_items[line.item_id] = line.quantity
+
+    try:
+        updated = purchase_cart(
+            users_dynamodb, email, coins_added, total_price, new_items
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+        # The user as it was when the condition failed
+        if not e.response.get("Item"):
+            logger.error("User with email %s does not exist", email)
+            return build_response(404, {"message": "User not found."})
+
+        logger.error("User %s does not have enough coins for the cart", email)
+        return build_response(400, {"message": "Not enough coins"})
+
+    logger.info(
+        "User %s bought %s items for %s coins and %s coins from coin packs",
+        email,
+        sum(new_items.values()),
+        total_price,
+        coins_added,
+    )
+    return build_response(
+        200,
+        {
+            "message": "Cart bought successfully",
+            "coins": updated["coins"],
+            "items": [
+                {"item_id": line.item_id, "quantity": line.quantity} for line in cart
+            ],
+        },
+    )
+
+
+def purchase_cart(dynamodb, email, coins_added, total_price, new_items):
+    """
+    Apply a cart to the user in a single conditional update. Coin packs in the
+    cart count towards its price, the balance may not go below zero.
+
+    Args:
+        dynamodb: DynamoDB users table instance
+        email: User's email
+        coins_added: Coins from the coin packs in the cart
+        total_price: Price of the other items in the cart
+        new_items: {item_id: quantity} to add to the inventory
+
+    Returns:
+        dict: Updated attributes, coins holds the new balance
+
+    Raises:
+        ClientError: ConditionalCheckFailedException if the user doesn't exist
+                     or can't afford the cart, the error response holds the
+                     user as "Item" when it exists
+    """
+    logger.info("Applying cart to user %s", email)
+
+    expression_attribute_values = {
+        ":zero": 0,
+        ":coins_delta": coins_added - total_price,
+    }
+    condition_expression = "attribute_exists(email)"
+
+    required_coins = total_price - coins_added
+    if required_coins > 0:
+        condition_expression = "coins >= :required_coins"
+        expression_attribute_values[":required_coins"] = required_coins
+
+    response = update_user_inventory(
+        dynamodb,
+        email,
+        quantities=new_items,
+        set_expression="coins = if_not_exists(coins, :zero) + :coins_delta",
+        condition_expression=condition_expression,
+        expression_attribute_values=expression_attribute_values,
+        ReturnValues="UPDATED_NEW",
+        ReturnValuesOnConditionCheckFailure="ALL_OLD",
+    )
+
+    return response["Attributes"]
@@ -1,6 +1,8 @@
-import logging
+from log import get_logger, log_event
 import json
 
+from botocore.exceptions import ClientError
+
 from common import build_response, convert_decimal_to_float
 from middleware import middleware
 from boto import (
@@ -8,14 +10,15 @@ from boto import (
     _LAMBDA_USERS_TABLE_RESOURCE,
     _LAMBDA_ITEMS_TABLE_RESOURCE,
 )
-from auth import get_email_from_jwt_token
+from auth import get_email_from_event
+from catalog import get_catalog_item
+from inventory import update_user_inventory
 from validation_schema import schema
 from dataclasses import dataclass
-from aws_lambda_powertools.utilities.validation import SchemaValidationError, validate
+from validation import SchemaValidationError, validate
 
 
-logger = logging.getLogger("BuyItems")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("BuyItems")
 
 
 @dataclass
@@ -25,14 +28,13 @@ class Request:
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    log_event(logger, event)
 
-    # Extract JWT token from headers and authenticate the user
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     if not email:
-        logger.error(f"Invalid email in jwt token {email}")
+        logger.error("Invalid email in jwt token %s", email)
         return build_response(400, {"message": "Invalid email in jwt token"})
 
     # Parse and validate the request body against JSON schema
@@ -43,11 +45,11 @@ def lambda_handler(event, context):
         request_body = event
 
     try:
-        logger.debug(f"Validating request {request_body}")
+        logger.debug("Validating request %s", request_body)
         validate(event=request_body, schema=schema)
     except SchemaValidationError as e:
-        logger.error(f"Validation failed: {e}")
-        return build_response(400, {"message": str(e)})
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
 
     logger.info("Parsing request body")
     request = Request(**request_body)
@@ -65,6 +67,9 @@ def buy_item(items_dynamodb, users_dynamodb, item_id, email):
     """
     Process the purchase of an item by a user.
 
+    The user is never read, the balance check and the changes to the user are
+    a single conditional update, so concurrent purchases can't overspend.
+
     Args:
         items_dynamodb: DynamoDB items table instance
         users_dynamodb: DynamoDB users table instance
@@ -74,17 +79,10 @@ def buy_item(items_dynamodb, users_dynamodb, item_id, email):
     Returns:
         dict: HTTP response with status code and message
     """
-    user = get_user_by_email(users_dynamodb, email)
-    if user is None:
-        logger.error(f"User with email {email} does not exist")
-        return build_response(404, {"message": "User not found."})
-
-    available_coins = user.get("coins", 0)
-
-    # Check if the item exists in the items table
-    shop_item = get_item_by_id(items_dynamodb, item_id)
+    # Check if the item exists in the items catalog
+    shop_item = get_catalog_item(items_dynamodb, item_id)
     if shop_item is None:
-        logger.error(f"Item with id {item_id} does not exist")
+        logger.error("Item with id %s does not exist", item_id)
         return build_response(404, {"message": "Item not found."})
 
     # Fetch items category in order to determine how to process the purchase
@@ -100,107 +98,106 @@ def buy_item(items_dynamodb, users_dynamodb, item_id, email):
 
         # Check if the amount of coins to add is valid
         if add_coins <= 0:
-            logger.error(f"Invalid coins amount {add_coins}")
+            logger.error("Invalid coins amount %s", add_coins)
             return build_response(400, {"message": "Invalid coins amount"})
 
-        # Update the user's coins
-        available_coins += add_coins
-        updated_coins = update_user_coins(users_dynamodb, email, available_coins)
+        updated = add_user_coins(users_dynamodb, email, add_coins)
+        if updated is None:
+            logger.error("User with email %s does not exist", email)
+            return build_response(404, {"message": "User not found."})
 
-        # Check if the coins were updated successfully and return the appropriate response
-        if updated_coins:
-            logger.info(f"User {email} bought coins successfully")
-            return build_response(200, {"message": "Coins added successfully"})
+        logger.info("User %s bought coins successfully", email)
+        return build_response(
+            200, {"message": "Coins added successfully", "coins": updated["coins"]}
+        )
 
     # Case 2:
     # User is trying to buy an item from items category
-    else:
-        item_price = shop_item.get("price")
-        item_price = convert_decimal_to_float(item_price)
-        item_price = int(item_price)
-
-        # Check if the item price is valid
-        if available_coins < item_price:
-            logger.error(f"User {email} does not have enough coins to buy the item")
-            return build_response(400, {"message": "Not enough coins"})
+    item_price = shop_item.get("price")
+    item_price = convert_decimal_to_float(item_price)
+    item_price = int(item_price)
 
-        # Update the user's coins
-        available_coins -= item_price
-        updated_coins = update_user_coins(users_dynamodb, email, available_coins)
-
-        # Check if the coins were updated successfully and return the appropriate response
-        if not updated_coins:
-            logger.error(f"Failed to update coins for user {email}")
-            return build_response(500, {"message": "Failed to update coins"})
-
-        # Add the item to the user's inventory
-        return add_item_to_user(users_dynamodb, email, item_id)
-
-    # If none of the cases matched, return an error response
-    return build_response(500, {"message": "Failed to process the request"})
+    try:
+        updated = purchase_item(users_dynamodb, email, item_id, item_price)
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+        # The user as it was when the condition failed
+        if not e.response.get("Item"):
+            logger.error("User with email %s does not exist", email)
+            return build_response(404, {"message": "User not found."})
+
+        logger.error("User %s does not have enough coins to buy the item", email)
+        return build_response(400, {"message": "Not enough coins"})
+
+    logger.info("User %s bought item %s", email, item_id)
+    return build_response(
+        200, {"message": "Item added successfully", "coins": updated["coins"]}
+    )
 
 
-def update_user_coins(dynamodb, email, coins):
+def add_user_coins(dynamodb, email, coins):
     """
-    Update a user's coin balance in DynamoDB.
+    Add coins to a user's balance.
 
     Args:
         dynamodb: DynamoDB users table instance
         email: User's email
-        coins: New coin balance
+        coins: Number of coins to add
 
     Returns:
-        Boolean indicating success
+        dict: Updated attributes (coins), or None if the user doesn't exist
     """
-    logger.info(f"Updating user {email} with coins {coins}")
+    logger.info("Adding %s coins to user %s", coins, email)
 
-    update_expression = "SET coins = :coins"
-    expression_attribute_values = {":coins": coins}
+    try:
+        response = dynamodb.table.update_item(
+            Key={"email": email},
+            UpdateExpression="ADD coins :coins",
+            ConditionExpression="attribute_exists(email)",
+            ExpressionAttributeValues={":coins": coins},
+            ReturnValues="UPDATED_NEW",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
 
-    dynamodb.table.update_item(
-        Key={"email": email},
-        UpdateExpression=update_expression,
-        ExpressionAttributeValues=expression_attribute_values,
-    )
+        return None
 
-    return True
+    return response["Attributes"]
 
 
-def add_item_to_user(dynamodb, email, item_id):
+def purchase_item(dynamodb, email, item_id, price):
     """
-    Add a purchased item to the user's inventory.
+    Take the price from the user's coins and add the item to their inventory,
+    only if the user has enough coins.
 
     Args:
         dynamodb: DynamoDB users table instance
         email: User's email
         item_id: ID of the purchased item
+        price: Price of the item in coins
 
     Returns:
-        dict: HTTP response with status code and message
-    """
-    logger.info(f"Adding item {item_id} to user {email}")
+        dict: Updated attributes, coins holds the new balance
 
-    update_expression = "SET items_inventory = list_append(if_not_exists(items_inventory, :empty_list), :new_item)"
-    expression_attribute_values = {":new_item": [item_id], ":empty_list": []}
-
-    dynamodb.table.update_item(
-        Key={"email": email},
-        UpdateExpression=update_expression,
-        ExpressionAttributeValues=expression_attribute_values,
+    Raises:
+        ClientError: ConditionalCheckFailedException if the user doesn't exist
+                     or can't afford the item, the error response holds the
+                     user as "Item" when it exists
+    """
+    logger.info("Adding item %s to user %s for %s coins", item_id, email, price)
+
+    response = update_user_inventory(
+        dynamodb,
+        email,
+        quantities={item_id: 1},
+        set_expression="coins = coins - :price",
+        condition_expression="coins >= :price",
+        expression_attribute_values={":price": price},
+        ReturnValues="UPDATED_NEW",
+        ReturnValuesOnConditionCheckFailure="ALL_OLD",
     )
 
-    return build_response(200, {"message": "Item added successfully"})
-
-
-def get_user_by_email(dynamodb, email):
-    logger.info(f"Getting user by email {email}")
-    user = dynamodb.table.get_item(Key={"email": email})
-
-    return user.get("Item")
-
-
-def get_item_by_id(dynamodb, id):
-    logger.info(f"Getting item by id {id}")
-    shop_item = dynamodb.table.get_item(Key={"id": id})
-
-    return shop_item.get("Item")
+    return response["Attributes"]
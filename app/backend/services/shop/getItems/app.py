@@ -1,54 +1,44 @@
-import logging
+from log import get_logger, log_event
 
-from common import build_response, convert_decimal_to_float
+from common import build_response
 from middleware import middleware
 from boto import LambdaDynamoDBClass, _LAMBDA_ITEMS_TABLE_RESOURCE
-from auth import get_email_from_jwt_token
+from auth import get_email_from_event
+from catalog import get_items_catalog
 
-logger = logging.getLogger("GetItems")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("GetItems")
 
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    log_event(logger, event)
 
-    # Extract JWT token from headers and authenticate the user
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     if not email:
-        logger.error(f"Invalid email in jwt token {email}")
+        logger.error("Invalid email in jwt token %s", email)
         return build_response(400, {"message": "Invalid email in jwt token"})
 
     # Initialize DynamoDB client for the items table
     global _LAMBDA_ITEMS_TABLE_RESOURCE
     dynamodb = LambdaDynamoDBClass(_LAMBDA_ITEMS_TABLE_RESOURCE)
 
-    # Retrieve all items from the items table
-    items = get_items(dynamodb)
+    # Retrieve all items from the items catalog
+    catalog = get_items_catalog(dynamodb)
 
     # Check if items were found, if not return 404
-    if not items:
-        logger.debug(f"No items found.")
+    if not len(catalog):
+        logger.debug("No items found.")
         return build_response(404, {"message": "No items found."})
 
-    # Process items into categories
-    regular_items = []
-    coins = []
-    chests = []
-
-    # Iterate through items and categorize them
-    for item in items:
-        category = item.get("category", "").lower()
-        processed_item = convert_decimal_to_float(item)
-
-        if category == "coins":
-            coins.append(processed_item)
-        elif category == "chest":
-            chests.append(processed_item)
-        else:
-            regular_items.append(processed_item)
+    # Coins and chests come straight from the catalog's category index,
+    # everything else is listed as a regular item
+    regular_items = [
+        item
+        for item in catalog.items
+        if (item.get("category") or "").lower() not in ("coins", "chest")
+    ]
 
     # Return the categorized items
     return build_response(
@@ -56,14 +46,7 @@ def lambda_handler(event, context):
         {
             "message": "Items fetched successfully",
             "items": regular_items,
-            "coins": coins,
-            "chests": chests,
+            "coins": catalog.category("coins"),
+            "chests": catalog.category("chest"),
         },
     )
-
-
-def get_items(dynamodb):
-    logger.info(f"Getting all shop items")
-    items = dynamodb.table.scan()
-    items_list = items.get("Items", [])
-    return items_list
@@ -25,6 +25,10 @@ class BaseTestSetup(unittest.TestCase):
         """
         Set up the environment for the tests.
         """
+        # Cached table snapshots belong to the previous test's tables
+        from snapshot import clear_snapshots
+        clear_snapshots()
+
         # Environment variables
         os.environ["USERS_TABLE_NAME"] = "test_users_table"
         os.environ["ITEMS_TABLE_NAME"] = "test_items_table"
@@ -0,0 +1,148 @@
+import json
+import sys
+import os
+import unittest
+from unittest.mock import patch
+
+from base_test_setup import BaseTestSetup
+
+original_path = sys.path.copy()
+BaseTestSetup.setup_paths('buyCart')
+BaseTestSetup.clear_module_cache(['common', 'buyCart.app'])
+
+from moto import mock_aws
+from buyCart.app import lambda_handler
+from auth import generate_jwt_token
+
+
+@mock_aws
+class TestBuyCart(BaseTestSetup):
+    def setUp(self):
+        super().setUp()
+
+        self.items_resource_patcher = patch('buyCart.app._LAMBDA_ITEMS_TABLE_RESOURCE', {
+            "resource": self.dynamodb,
+            "table_name": os.environ["ITEMS_TABLE_NAME"]
+        })
+        self.users_resource_patcher = patch('buyCart.app._LAMBDA_USERS_TABLE_RESOURCE', {
+            "resource": self.dynamodb,
+            "table_name": os.environ["USERS_TABLE_NAME"]
+        })
+        self.users_resource_patcher.start()
+        self.items_resource_patcher.start()
+
+
+    def buy_cart(self, email, items):
+        event = {
+            'headers': {
+                'Authorization': generate_jwt_token(email)
+            },
+            "body": json.dumps({"items": items})
+        }
+
+        response = lambda_handler(event, {})
+        return response['statusCode'], json.loads(response['body'])
+
+
+    def test_validation_schema(self):
+        """
+        Test response when validation schema fails.
+        """
+        test_cases = [
+            [],
+            [{"item_id": "item-1"}],
+            [{"item_id": "item-1", "quantity": 0}],
+            [{"item_id": 123, "quantity": 1}],
+        ]
+
+        for items in test_cases:
+            with self.subTest(items=items):
+                status_code, body = self.buy_cart("test@mail.com", items)
+
+                self.assertEqual(status_code, 400)
+                self.assertIn("errors", body)
+
+
+    def test_successful_buy_cart(self):
+        """
+        Test that a cart with coin packs and items is applied at once, coin
+        packs fund the balance and repeated lines are merged.
+        """
+        email = "test@mail.com"
+
+        status_code, body = self.buy_cart(email, [
+            {"item_id": "item-2", "quantity": 2},
+            {"item_id": "coins-1", "quantity": 1},
+            {"item_id": "item-2", "quantity": 1},
+            {"item_id": "item-1", "quantity": 1},
+        ])
+
+        self.assertEqual(status_code, 200)
+        # 100 + 100 from the coin pack - 3 * 25 - 100
+        self.assertEqual(body['coins'], 25)
+        self.assertEqual(body['items'], [
+            {"item_id": "item-2", "quantity": 3},
+            {"item_id": "coins-1", "quantity": 1},
+            {"item_id": "item-1", "quantity": 1},
+        ])
+
+        updated_user = self.users_table.get_item(Key={'email': email})['Item']
+        self.assertEqual(updated_user['coins'], 25)
+        self.assertEqual(updated_user['items_inventory']["item-2"], 3)
+        self.assertEqual(updated_user['items_inventory']["item-1"], 1)
+        self.assertNotIn("coins-1", updated_user['items_inventory'])
+
+
+    def test_cart_is_rejected_as_a_whole(self):
+        """
+        Test that nothing is bought when the user can't afford the whole cart
+        or one of the items doesn't exist.
+        """
+        email = "test@mail.com"
+        initial_user = self.users_table.get_item(Key={'email': email})['Item']
+
+        status_code, body = self.buy_cart(email, [
+            {"item_id": "item-2", "quantity": 1},
+            {"item_id": "item-3", "quantity": 1},
+        ])
+
+        self.assertEqual(status_code, 400)
+        self.assertIn("Not enough coins", body['message'])
+
+        status_code, body = self.buy_cart(email, [
+            {"item_id": "item-2", "quantity": 1},
+            {"item_id": "random-item", "quantity": 1},
+        ])
+
+        self.assertEqual(status_code, 404)
+        self.assertEqual(body['item_id'], "random-item")
+
+        # The inventory was only migrated to item counts
+        updated_user = self.users_table.get_item(Key={'email': email})['Item']
+        self.assertEqual(updated_user['coins'], initial_user['coins'])
+        self.assertEqual(updated_user['items_inventory'], {"random-item": 1})
+
+
+    def test_user_not_found(self):
+        """
+        Test response when user is not found.
+        """
+        status_code, body = self.buy_cart("random@mail.com", [
+            {"item_id": "coins-1", "quantity": 1},
+        ])
+
+        self.assertEqual(status_code, 404)
+        self.assertEqual(body['message'], "User not found.")
+
+
+    def tearDown(self):
+        self.items_resource_patcher.stop()
+        self.users_resource_patcher.stop()
+        super().tearDown()
+
+
+if __name__ == "__main__":
+    try:
+        unittest.main()
+    finally:
+        sys.path = original_path
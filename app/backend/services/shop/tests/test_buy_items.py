@@ -82,20 +82,23 @@ class TestGetItems(BaseTestSetup):
         test_cases = [
             {
                 "request_body": {},
-                "expected_validation_message": "data must contain ['item_id'] properties"
+                "expected_validation_message": "data must contain ['item_id'] properties",
+                "expected_field": "data"
             },
             {
                 "request_body": {
                     "item_id": 123
                 },
-                "expected_validation_message": "data.item_id must be string"
+                "expected_validation_message": "data.item_id must be string",
+                "expected_field": "data.item_id"
             },
             {
                 "request_body": {
                     "item_id": "item123",
                     "extraField": "value"
                 },
-                "expected_validation_message": "data must not contain {'extraField'} properties"
+                "expected_validation_message": "data must not contain {'extraField'} properties",
+                "expected_field": "data"
             }
         ]
 
@@ -115,6 +118,8 @@ class TestGetItems(BaseTestSetup):
                 self.assertEqual(response['statusCode'], 400)
                 self.assertIn("message", body)
                 self.assertIn(case["expected_validation_message"], body['message'])
+                self.assertEqual(body['errors'][0]['field'], case["expected_field"])
+                self.assertEqual(body['errors'][0]['message'], case["expected_validation_message"])
 
 
     def test_successful_buy_coins(self):
@@ -230,6 +235,35 @@ class TestGetItems(BaseTestSetup):
         self.assertIn("Not enough coins", body['message'])
 
 
+    def test_purchase_cannot_overspend(self):
+        """
+        Test that the balance check is part of the update, a purchase the user
+        can no longer afford leaves coins and inventory untouched.
+        """
+        email = "test@mail.com"
+        jwt_token = generate_jwt_token(email)
+
+        responses = []
+        for _ in range(2):
+            event = {
+                'headers': {
+                    'Authorization': jwt_token
+                },
+                "body": json.dumps({"item_id": "item-1"})
+            }
+            responses.append(lambda_handler(event, {}))
+
+        self.assertEqual(responses[0]['statusCode'], 200)
+        self.assertEqual(json.loads(responses[0]['body'])['coins'], 0)
+
+        self.assertEqual(responses[1]['statusCode'], 400)
+        self.assertIn("Not enough coins", json.loads(responses[1]['body'])['message'])
+
+        updated_user = self.users_table.get_item(Key={'email': email})['Item']
+        self.assertEqual(updated_user['coins'], 0)
+        self.assertEqual(updated_user['items_inventory']["item-1"], 1)
+
+
     def test_item_not_found(self):
         """
         Test response when item is not found.
@@ -12,6 +12,7 @@ BaseTestSetup.clear_module_cache(['common', 'getItems.app'])
 
 from moto import mock_aws
 from getItems.app import lambda_handler
+import catalog
 from auth import generate_jwt_token
 
 
@@ -70,6 +71,26 @@ class TestGetItems(BaseTestSetup):
         self.assertIsNotNone(body['chests'])
 
 
+    def test_items_catalog_is_loaded_once(self):
+        """
+        Test that the items table is scanned once and later requests are served
+        from the cached catalog.
+        """
+        jwt_token = generate_jwt_token("test@mail.com")
+
+        with patch('catalog.scan_all', wraps=catalog.scan_all) as mock_scan:
+            for _ in range(3):
+                response = lambda_handler({'headers': {'Authorization': jwt_token}}, {})
+                self.assertEqual(response['statusCode'], 200)
+
+        self.assertEqual(mock_scan.call_count, 1)
+
+        body = json.loads(response['body'])
+        self.assertEqual(sorted(item['id'] for item in body['coins']), ["coin-2", "coins-1"])
+        self.assertEqual(sorted(item['id'] for item in body['chests']), ["chest-1", "chest-2"])
+        self.assertEqual(sorted(item['id'] for item in body['items']), ["item-1", "item-2", "item-3"])
+
+
     def test_items_not_found(self):
         """
         Test response when no items are found.
@@ -1,14 +1,13 @@
-import logging
+from log import get_logger, log_event
 import os
 
 from datetime import datetime, timedelta, timezone
 from common import build_response
 from middleware import middleware
 from boto import LambdaDynamoDBClass, _LAMBDA_USERS_TABLE_RESOURCE
-from auth import get_email_from_jwt_token, check_users_subscription
+from auth import get_email_from_event, check_users_subscription
 
-logger = logging.getLogger("ConsumeHeart")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("ConsumeHeart")
 
 # Time in hours before a heart is refilled, retrieved from environment variables
 HEARTS_REFILL_RATE_HOURS = int(os.environ.get("HEARTS_REFILL_RATE_HOURS", 3))
@@ -16,14 +15,13 @@ HEARTS_REFILL_RATE_HOURS = int(os.environ.get("HEARTS_REFILL_RATE_HOURS", 3))
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    log_event(logger, event)
 
-    # Extract JWT token from headers and authenticate user
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     if not email:
-        logger.error(f"Invalid email in jwt token {email}")
+        logger.error("Invalid email in jwt token %s", email)
         return build_response(400, {"message": "Invalid email in jwt token"})
 
     # Initialize DynamoDB client for the users table
@@ -33,14 +31,14 @@ def lambda_handler(event, context):
     # Retrieve user's hearts data from database
     user_item = get_user_by_email(dynamodb, email)
     if not user_item:
-        logger.debug(f"User with email {email} not found.")
+        logger.debug("User with email %s not found.", email)
         return build_response(404, {"message": "User not found."})
 
     is_premium = check_users_subscription(user_item, wanted_status=1)
     is_live = check_users_subscription(user_item, wanted_status=2)
 
     if is_premium or is_live:
-        logger.debug(f"User {email} is a premium user, unlimited hearts.")
+        logger.debug("User %s is a premium user, unlimited hearts.", email)
 
         return build_response(
             200,
@@ -56,7 +54,7 @@ def lambda_handler(event, context):
     # Check if user has any hearts to consume
     if hearts == 0:
         logger.debug(
-            f"Unable to consume a heart for user: {email} as they have no hearts left."
+            "Unable to consume a heart for user: %s as they have no hearts left.", email
         )
         return build_response(
             400, {"message": "Unable to consume a heart as they have no hearts left."}
@@ -80,7 +78,7 @@ def lambda_handler(event, context):
         update_expression = "SET hearts = :val, hearts_next_refill = :refill_time"
         expression_attribute_values = {":val": hearts, ":refill_time": next_refill}
 
-        logger.debug(f"User {email} has hearts next refill time in the future.")
+        logger.debug("User %s has hearts next refill time in the future.", email)
 
     # Case 2:
     # User has partial hearts and refill time has passed
@@ -89,7 +87,7 @@ def lambda_handler(event, context):
         and hearts_next_refill
         and datetime.fromisoformat(hearts_next_refill) < current_time
     ):
-        logger.debug(f"User {email} has hearts next refill time in the past.")
+        logger.debug("User %s has hearts next refill time in the past.", email)
 
         # Calculate next refill time based on previous refill time
         hearts_next_refill_dt = datetime.fromisoformat(hearts_next_refill)
@@ -99,7 +97,7 @@ def lambda_handler(event, context):
         update_expression = "SET hearts_next_refill = :refill_time"
         expression_attribute_values = {":refill_time": next_refill}
 
-        logger.debug(f"Setting next heart refill time to {next_refill}")
+        logger.debug("Setting next heart refill time to %s", next_refill)
 
     # Case 3:
     # User has partial hearts and is waiting for next refill
@@ -138,7 +136,7 @@ def get_user_by_email(dynamodb, email):
     Returns:
         tuple: (hearts, hearts_next_refill) if user exists, None otherwise
     """
-    logger.info(f"Getting user by email {email}")
+    logger.info("Getting user by email %s", email)
     user = dynamodb.table.get_item(Key={"email": email})
 
     user_item = user.get("Item", {})
@@ -146,5 +144,5 @@ def get_user_by_email(dynamodb, email):
     if user_item:
         return user_item
     else:
-        logger.error(f"User with email {email} not found")
+        logger.error("User with email %s not found", email)
         return None
@@ -1,18 +1,17 @@
 import json
 import boto3
 import os
-import logging
+from log import get_logger, log_event, start_request
 import random
 from datetime import datetime, timedelta, timezone
 
 from validation_schema import schema
 from dataclasses import dataclass
-from aws_lambda_powertools.utilities.validation import SchemaValidationError, validate
+from validation import SchemaValidationError, validate
 from common import build_response
 from boto import LambdaDynamoDBClass, _LAMBDA_USERS_TABLE_RESOURCE
 
-logger = logging.getLogger("ForgotPasswordRequest")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("ForgotPasswordRequest")
 
 # Initialize AWS Simple Email Service client for sending emails
 client = boto3.client("ses", region_name=os.environ.get("SECRETS_REGION_NAME"))
@@ -24,7 +23,8 @@ class Request:
 
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    start_request(context)
+    log_event(logger, event)
 
     # Extract request body from event and validate against validation schema
     body = event.get("body")
@@ -34,11 +34,11 @@ def lambda_handler(event, context):
         request_body = event
 
     try:
-        logger.debug(f"Validating request {request_body}")
+        logger.debug("Validating request %s", request_body)
         validate(event=request_body, schema=schema)
     except SchemaValidationError as e:
-        logger.error(f"Validation failed: {e}")
-        return build_response(400, {"message": str(e)})
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
 
     logger.info("Parsing request body")
     request = Request(**request_body)
@@ -66,7 +66,7 @@ def send_email(dynamodb, email):
     # Verify user exists before proceeding
     user_exists = check_user_exists(dynamodb, email)
     if not user_exists:
-        logger.debug(f"User with email {email} does not exist")
+        logger.debug("User with email %s does not exist", email)
         return build_response(400, {"message": "User does not exist."})
 
     try:
@@ -76,11 +76,11 @@ def send_email(dynamodb, email):
 
         # Check if the code was saved successfully
         if code_save_success["ResponseMetadata"]["HTTPStatusCode"] != 200:
-            logger.error(f"Error saving reset code: {code_save_success}")
+            logger.error("Error saving reset code: %s", code_save_success)
             return build_response(500, {"message": "Error saving reset code."})
 
         logger.warning(
-            f"Reset code {random_code} generated for {email}"
+            "Reset code %s generated for %s", random_code, email
         )  # Logged as a warning to be more visible
 
         # Send email with the reset code to the user
@@ -102,7 +102,7 @@ def send_email(dynamodb, email):
             Source=source_email,
         )
 
-        logger.info(f"Email sent to {email}, MessageId: {response['MessageId']}")
+        logger.info("Email sent to %s, MessageId: %s", email, response['MessageId'])
         return build_response(
             200,
             {
@@ -111,7 +111,7 @@ def send_email(dynamodb, email):
         )
 
     except Exception as e:
-        logger.error(f"Error sending email: {e}")
+        logger.error("Error sending email: %s", e)
         return build_response(500, {"message": "Error sending email."})
 
 
@@ -151,20 +151,20 @@ def save_reset_code(dynamodb, email, random_code):
             },
             ReturnValues="UPDATED_NEW",
         )
-        logger.info(f"Reset code saved for {email}")
+        logger.info("Reset code saved for %s", email)
         return response
 
     except Exception as e:
-        logger.error(f"Error saving reset code: {e}")
+        logger.error("Error saving reset code: %s", e)
         raise
 
 
 def check_user_exists(dynamodb, email):
-    logger.info(f"Getting user by email {email}")
+    logger.info("Getting user by email %s", email)
     response = dynamodb.table.get_item(Key={"email": email})
 
     user = response.get("Item")
     if not user:
-        logger.debug(f"User with email {email} does not exist")
+        logger.debug("User with email %s does not exist", email)
         return False
     return True
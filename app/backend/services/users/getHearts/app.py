@@ -1,14 +1,13 @@
-import logging
+from log import get_logger, log_event
 import os
 
 from datetime import datetime, timedelta, timezone
 from common import build_response
 from middleware import middleware
 from boto import LambdaDynamoDBClass, _LAMBDA_USERS_TABLE_RESOURCE
-from auth import get_email_from_jwt_token, check_users_subscription
+from auth import get_email_from_event, check_users_subscription
 
-logger = logging.getLogger("GetHearts")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("GetHearts")
 
 # Get refill rate from environment variable, default to 3 hours if not set
 HEARTS_REFILL_RATE_HOURS = int(os.environ.get("HEARTS_REFILL_RATE_HOURS", 3))
@@ -16,14 +15,13 @@ HEARTS_REFILL_RATE_HOURS = int(os.environ.get("HEARTS_REFILL_RATE_HOURS", 3))
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    log_event(logger, event)
 
-    # Extract and validate JWT token
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     if not email:
-        logger.error(f"Invalid email in jwt token {email}")
+        logger.error("Invalid email in jwt token %s", email)
         return build_response(400, {"message": "Invalid email in jwt token"})
 
     # Initialize DynamoDB resource
@@ -33,14 +31,14 @@ def lambda_handler(event, context):
     # Retrieve user's heart data and validate that the user exists
     user_data = get_user_by_email(dynamodb, email)
     if not user_data:
-        logger.debug(f"User with email {email} not found.")
+        logger.debug("User with email %s not found.", email)
         return build_response(404, {"message": "User not found."})
 
     hearts, hearts_next_refill_str = user_data
 
     # If user has maximum hearts, no refill time is needed
     if hearts == 5:
-        logger.debug(f"User with email {email} has 5 hearts")
+        logger.debug("User with email %s has 5 hearts", email)
         return build_response(
             200,
             {
@@ -51,7 +49,7 @@ def lambda_handler(event, context):
 
     # Get current time for refill calculations
     current_time = datetime.now(timezone.utc)
-    logger.debug(f"Current time: {current_time}")
+    logger.debug("Current time: %s", current_time)
 
     hearts_next_refill = None
 
@@ -62,7 +60,9 @@ def lambda_handler(event, context):
             if hearts_next_refill.tzinfo is None:
                 hearts_next_refill = hearts_next_refill.replace(tzinfo=timezone.utc)
         except (ValueError, TypeError):
-            logger.error(f"Invalid hearts_next_refill format: {hearts_next_refill_str}")
+            logger.error(
+                "Invalid hearts_next_refill format: %s", hearts_next_refill_str
+            )
             hearts_next_refill = current_time - timedelta(hours=1)
 
     filled_hearts = False
@@ -117,7 +117,7 @@ def lambda_handler(event, context):
         ),
     }
 
-    logger.debug(f"Fetched hearts for user: {email}. Remaining hearts: {hearts}")
+    logger.debug("Fetched hearts for user: %s. Remaining hearts: %s", email, hearts)
     return build_response(
         200, {"message": "Fetched hearts successfully", "data": response_data}
     )
@@ -135,7 +135,7 @@ def get_user_by_email(dynamodb, email):
         tuple: (hearts, hearts_next_refill) containing heart count and next refill time,
                or None if user not found
     """
-    logger.info(f"Getting user by email {email}")
+    logger.info("Getting user by email %s", email)
     user = dynamodb.table.get_item(Key={"email": email})
 
     user_item = user.get("Item", {})
@@ -144,7 +144,7 @@ def get_user_by_email(dynamodb, email):
     is_live = check_users_subscription(user_item, wanted_status=2)
 
     if is_premium or is_live:
-        logger.info(f"User {email} is premium or live, skipping heart check")
+        logger.info("User %s is premium or live, skipping heart check", email)
         return 5, None
 
     if user_item:
@@ -152,5 +152,5 @@ def get_user_by_email(dynamodb, email):
         hearts_next_refill = user_item.get("hearts_next_refill", None)
         return hearts, hearts_next_refill
     else:
-        logger.error(f"User with email {email} not found")
+        logger.error("User with email %s not found", email)
         return None
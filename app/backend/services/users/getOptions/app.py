@@ -1,24 +1,23 @@
-import logging
+from log import get_logger, log_event
 
-from common import build_response, convert_decimal_to_float
+from common import build_response
 from middleware import middleware
 from boto import LambdaDynamoDBClass, _LAMBDA_USERS_TABLE_RESOURCE, _LAMBDA_LANGUAGES_TABLE_RESOURCE
-from auth import get_email_from_jwt_token
+from auth import get_email_from_event
+from languages import get_all_languages
 
-logger = logging.getLogger("GetOptions")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("GetOptions")
 
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    log_event(logger, event)
 
-    # Extract and validate user identity from JWT token
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     if not email:
-        logger.error(f"Invalid email in jwt token {email}")
+        logger.error("Invalid email in jwt token %s", email)
         return build_response(400, {"message": "Invalid email in jwt token"})
 
     # Initialize DynamoDB resources
@@ -28,25 +27,25 @@ def lambda_handler(event, context):
 
     # Retrieve user profile data and list of available languages
     user = get_user_by_email(users_dynamodb, email)
+    # Served from the languages catalog cached in this container
     available_languages = get_all_languages(languages_dynamodb)
 
     if not user:
-        logger.debug(f"User with email {email} not found.")
+        logger.debug("User with email %s not found.", email)
         return build_response(404, {"message": "User not found."})
 
-    user_data = convert_decimal_to_float(user)
     return build_response(
         200,
         {
             "message": "User info fetched successfully",
-            "users": user_data,
+            "users": user,
             "languages": available_languages,
         }
     )
 
 
 def get_user_by_email(dynamodb, email):
-    logger.info(f"Getting user by email {email}")
+    logger.info("Getting user by email %s", email)
     user = dynamodb.table.get_item(Key={"email": email})
 
     # Remove password from the returned data
@@ -55,11 +54,3 @@ def get_user_by_email(dynamodb, email):
         del user_item["password"]
 
     return user_item
-
-
-def get_all_languages(languages_dynamodb):
-    logger.info(f"Getting all languages")
-    languages = languages_dynamodb.table.scan()
-
-    languages_items = languages.get("Items", [])
-    return languages_items
\ No newline at end of file
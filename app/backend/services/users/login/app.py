@@ -1,15 +1,14 @@
 import json
-import logging
+from log import get_logger, log_event, start_request
 
 from validation_schema import schema
 from dataclasses import dataclass
-from aws_lambda_powertools.utilities.validation import SchemaValidationError, validate
+from validation import SchemaValidationError, validate
 from common import build_response, verify_hash_string
 from auth import generate_jwt_token, generate_refresh_token
 from boto import LambdaDynamoDBClass, _LAMBDA_USERS_TABLE_RESOURCE
 
-logger = logging.getLogger("LoginUser")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("LoginUser")
 
 
 @dataclass
@@ -19,7 +18,8 @@ class Request:
 
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    start_request(context)
+    log_event(logger, event)
 
     body = event.get("body")
     if body is not None:
@@ -28,11 +28,11 @@ def lambda_handler(event, context):
         request_body = event
 
     try:
-        logger.debug(f"Validating request {request_body}")
+        logger.debug("Validating request %s", request_body)
         validate(event=request_body, schema=schema)
     except SchemaValidationError as e:
-        logger.error(f"Validation failed: {e}")
-        return build_response(400, {"message": str(e)})
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
 
     logger.info("Parsing request body")
     request = Request(**request_body)
@@ -59,14 +59,16 @@ def login_user(dynamodb, email, password):
     user = get_user_by_email(dynamodb, email)
 
     if not user or not verify_hash_string(password, user.get("password", "")):
-        logger.debug(f"User with email {email} does not exist or password is incorrect")
+        logger.debug(
+            "User with email %s does not exist or password is incorrect", email
+        )
         return build_response(400, {"message": "Wrong email or password"})
 
     access_token = generate_jwt_token(email)
     refresh_token = generate_refresh_token(email)
 
     if not access_token or not refresh_token:
-        logger.error(f"Unable to generate tokens for user {email}")
+        logger.error("Unable to generate tokens for user %s", email)
         return build_response(500, {"message": "Unable to generate tokens"})
 
     return build_response(
@@ -80,7 +82,7 @@ def login_user(dynamodb, email, password):
 
 
 def get_user_by_email(dynamodb, email):
-    logger.info(f"Getting user by email {email}")
+    logger.info("Getting user by email %s", email)
     user = dynamodb.table.get_item(Key={"email": email})
 
     return user.get("Item")
@@ -1,5 +1,5 @@
 import json
-import logging
+from log import get_logger, log_event, start_request
 
 from common import build_response
 from auth import generate_jwt_token, get_expiration_time, get_email_from_refresh_token
@@ -8,16 +8,16 @@ from middleware import validate_refresh_token
 from os import environ
 
 
-logger = logging.getLogger("RefreshToken")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("RefreshToken")
 
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    start_request(context)
+    log_event(logger, event)
 
     jwt_token = event.get("headers").get("x-refresh-token")
     email = get_email_from_refresh_token(jwt_token)
-    logger.debug(f"Email from JWT token: {email}")
+    logger.debug("Email from JWT token: %s", email)
 
     global _LAMBDA_USERS_TABLE_RESOURCE
     dynamodb = LambdaDynamoDBClass(_LAMBDA_USERS_TABLE_RESOURCE)
@@ -25,7 +25,7 @@ def lambda_handler(event, context):
     user_email = get_user_by_email(dynamodb, email)
 
     if not user_email:
-        logger.debug(f"User with email {email} not found")
+        logger.debug("User with email %s not found", email)
         return build_response(
             401,
             {"message": "User not found in database"},
@@ -42,7 +42,7 @@ def lambda_handler(event, context):
 
 
 def get_user_by_email(dynamodb, email):
-    logger.info(f"Getting user by email {email}")
+    logger.info("Getting user by email %s", email)
     user = dynamodb.table.get_item(Key={"email": email})
 
     user_item = user.get("Item", {})
@@ -51,5 +51,5 @@ def get_user_by_email(dynamodb, email):
         user_email = user_item.get("email", None)
         return user_email
     else:
-        logger.error(f"User with email {email} not found")
+        logger.error("User with email %s not found", email)
         return None
\ No newline at end of file
@@ -1,16 +1,15 @@
 import json
-import logging
+from log import get_logger, log_event, start_request
 
 from validation_schema import schema
 from dataclasses import dataclass
-from aws_lambda_powertools.utilities.validation import SchemaValidationError, validate
+from validation import SchemaValidationError, validate
 from common import build_response, hash_string
 from auth import generate_jwt_token, generate_refresh_token
 from boto import LambdaDynamoDBClass, _LAMBDA_USERS_TABLE_RESOURCE
 from boto3.dynamodb.conditions import Key
 
-logger = logging.getLogger("RegisterUser")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("RegisterUser")
 
 
 @dataclass
@@ -21,7 +20,8 @@ class Request:
 
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event: {event}")
+    start_request(context)
+    log_event(logger, event)
 
     body = event.get("body")
     if body is not None:
@@ -30,11 +30,11 @@ def lambda_handler(event, context):
         request_body = event
 
     try:
-        logger.debug(f"Validating request: {request_body}")
+        logger.debug("Validating request: %s", request_body)
         validate(event=request_body, schema=schema)
     except SchemaValidationError as e:
-        logger.error(f"Validation failed: {e}")
-        return build_response(400, {"message": str(e)})
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
 
     logger.info("Parsing request body")
     request = Request(**request_body)
@@ -66,10 +66,10 @@ def sign_up_user(dynamodb, email, username, password):
 
     # Return appropriate error if email or username is already in use
     if existing_email_user:
-        logger.debug(f"User with email {email} already exists")
+        logger.debug("User with email %s already exists", email)
         return build_response(400, {"message": "Email already in use."})
     if existing_username_user:
-        logger.debug(f"User with username {username} already exists")
+        logger.debug("User with username %s already exists", username)
         return build_response(400, {"message": "Username already in use."})
 
     hashed_password = hash_string(password)
@@ -94,7 +94,7 @@ def sign_up_user(dynamodb, email, username, password):
         "heart_refill": True,
         "daily_reminder": True,
         "subscription": 0,
-        "items_inventory": [],
+        "items_inventory": {},
     }
 
     add_user_to_the_table(dynamodb, user)
@@ -102,7 +102,7 @@ def sign_up_user(dynamodb, email, username, password):
     refresh_token = generate_refresh_token(email)
     access_token = generate_jwt_token(email)
 
-    logger.info(f"User {username} created")
+    logger.info("User %s created", username)
     return build_response(
         200,
         {
@@ -114,14 +114,14 @@ def sign_up_user(dynamodb, email, username, password):
 
 
 def get_user_by_email(dynamodb, email):
-    logger.info(f"Getting user by email: {email}")
+    logger.info("Getting user by email: %s", email)
     user = dynamodb.table.get_item(Key={"email": email})
 
     return user.get("Item")
 
 
 def get_user_by_username(dynamodb, username):
-    logger.info(f"Getting user by username: {username}")
+    logger.info("Getting user by username: %s", username)
     response = dynamodb.table.query(
         IndexName="username-index", KeyConditionExpression=Key("username").eq(username)
     )
@@ -130,5 +130,5 @@ def get_user_by_username(dynamodb, username):
 
 
 def add_user_to_the_table(dynamodb, user):
-    logger.info(f"Adding user with email: {user['email']} to the table")
+    logger.info("Adding user with email: %s to the table", user['email'])
     dynamodb.table.put_item(Item=user)
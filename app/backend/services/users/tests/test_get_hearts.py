@@ -4,6 +4,7 @@ import os
 import unittest
 from unittest.mock import patch
 from datetime import datetime, timedelta, timezone
+import jwt
 
 from base_test_setup import BaseTestSetup
 
@@ -13,7 +14,7 @@ BaseTestSetup.clear_module_cache(['common', 'getHearts.app'])
 
 from moto import mock_aws
 from getHearts.app import lambda_handler
-from auth import generate_jwt_token
+from auth import generate_jwt_token, generate_refresh_token
 
 
 @mock_aws
@@ -214,6 +215,38 @@ class TestGetHearts(BaseTestSetup):
         self.assertIsNotNone(body['data']['hearts_next_refill'])
 
 
+    def test_get_hearts_with_expired_token_and_refresh_token(self):
+        """
+        Test that an expired access token is refreshed by the middleware
+        and the handler still resolves the user from the auth context.
+        """
+        self.sample_user["hearts"] = 5
+        self.users_table.put_item(Item=self.sample_user)
+
+        expired_token = jwt.encode(
+            {
+                "email": "test@mail.com",
+                "exp": int((datetime.now(timezone.utc) - timedelta(minutes=5)).timestamp())
+            },
+            "value1",
+            algorithm="HS256"
+        )
+
+        event = {
+            'headers': {
+                'Authorization': expired_token,
+                'x-refresh-token': generate_refresh_token("test@mail.com")
+            }
+        }
+
+        response = lambda_handler(event, {})
+        body = json.loads(response['body'])
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(body['message'], "Fetched hearts successfully")
+        self.assertEqual(body['data']['hearts'], 5)
+
+
     def tearDown(self):
         self.users_resource_patcher.stop()
         super().tearDown()
@@ -0,0 +1,173 @@
+import json
+import sys
+import os
+import logging
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+from base_test_setup import BaseTestSetup
+
+original_path = sys.path.copy()
+BaseTestSetup.setup_paths('login')
+BaseTestSetup.clear_module_cache(['validation_schema', 'common', 'login.app'])
+
+from moto import mock_aws
+import log
+from log import JsonFormatter, get_logger, start_request
+from login.app import lambda_handler
+
+
+class LogStateMixin:
+    def setUp(self):
+        super().setUp()
+
+        self.log_patchers = [
+            patch('log.LOG_LEVEL', "INFO"),
+            patch('log.LOG_DEBUG_SAMPLE_RATE', 0.5),
+        ]
+        for patcher in self.log_patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.log_patchers:
+            patcher.stop()
+
+        # Leave the loggers at the configured level for the other tests
+        start_request(None)
+
+        super().tearDown()
+
+
+class TestDebugSampling(LogStateMixin, unittest.TestCase):
+    def test_sampled_request_logs_at_debug(self):
+        logger = get_logger("TestDebugSampling")
+
+        with patch('log.random.random', return_value=0.2):
+            start_request(None)
+
+        self.assertEqual(logger.level, logging.DEBUG)
+
+    def test_unsampled_request_logs_at_configured_level(self):
+        logger = get_logger("TestDebugSampling")
+
+        with patch('log.random.random', return_value=0.7):
+            start_request(None)
+
+        self.assertEqual(logger.level, logging.INFO)
+
+    def test_every_request_is_sampled_again(self):
+        logger = get_logger("TestDebugSampling")
+
+        with patch('log.random.random', side_effect=[0.2, 0.7, 0.2]):
+            levels = []
+            for _ in range(3):
+                start_request(None)
+                levels.append(logger.level)
+
+        self.assertEqual(levels, [logging.DEBUG, logging.INFO, logging.DEBUG])
+
+    def test_sample_rate_zero_never_samples(self):
+        logger = get_logger("TestDebugSampling")
+
+        with patch('log.LOG_DEBUG_SAMPLE_RATE', 0), patch('log.random.random', return_value=0):
+            start_request(None)
+
+        self.assertEqual(logger.level, logging.INFO)
+
+    def test_sample_rate_is_respected(self):
+        with patch('log.random.random', side_effect=[i / 100 for i in range(100)]):
+            sampled = 0
+            for _ in range(100):
+                start_request(None)
+                sampled += log._STATE["level"] == logging.DEBUG
+
+        self.assertEqual(sampled, 50)
+
+
+@mock_aws
+class TestHandlerSampling(LogStateMixin, BaseTestSetup):
+    def setUp(self):
+        super().setUp()
+
+        self.resource_patcher = patch('login.app._LAMBDA_USERS_TABLE_RESOURCE', {
+            "resource": self.dynamodb,
+            "table_name": os.environ["USERS_TABLE_NAME"]
+        })
+        self.resource_patcher.start()
+
+    def tearDown(self):
+        self.resource_patcher.stop()
+
+        super().tearDown()
+
+    def test_handler_without_middleware_samples_each_request(self):
+        """
+        Handlers that aren't wrapped by the middleware start the request
+        themselves, so the sampling isn't decided once per container.
+        """
+        logger = get_logger("LoginUser")
+
+        levels = []
+        with patch('log.random.random', side_effect=[0.2, 0.7]):
+            for request_id in ("request-1", "request-2"):
+                lambda_handler(
+                    {"body": json.dumps({})},
+                    SimpleNamespace(aws_request_id=request_id),
+                )
+                levels.append(logger.level)
+
+        self.assertEqual(levels, [logging.DEBUG, logging.INFO])
+        self.assertEqual(log._STATE["request_id"], "request-2")
+
+
+class TestJsonFormatter(LogStateMixin, unittest.TestCase):
+    def make_record(self, **kwargs):
+        return logging.LogRecord(
+            "TestJsonFormatter", logging.WARNING, __file__, 1, "Loaded %s items", (3,),
+            **kwargs
+        )
+
+    def test_record_fields(self):
+        start_request(SimpleNamespace(aws_request_id="request-1"))
+
+        record = self.make_record(exc_info=None)
+        record.item_id = "item-1"
+
+        log_line = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(log_line["level"], "WARNING")
+        self.assertEqual(log_line["logger"], "TestJsonFormatter")
+        self.assertEqual(log_line["message"], "Loaded 3 items")
+        self.assertEqual(log_line["request_id"], "request-1")
+        self.assertEqual(log_line["item_id"], "item-1")
+        self.assertTrue(log_line["timestamp"].endswith("+00:00"))
+        self.assertNotIn("exception", log_line)
+        self.assertNotIn("args", log_line)
+
+    def test_runtime_request_id_wins(self):
+        start_request(SimpleNamespace(aws_request_id="request-1"))
+
+        record = self.make_record(exc_info=None)
+        record.aws_request_id = "runtime-request"
+
+        log_line = json.loads(JsonFormatter().format(record))
+
+        self.assertEqual(log_line["request_id"], "runtime-request")
+        self.assertNotIn("aws_request_id", log_line)
+
+    def test_exception_is_formatted(self):
+        try:
+            raise ValueError("Bad value")
+        except ValueError:
+            record = self.make_record(exc_info=sys.exc_info())
+
+        log_line = json.loads(JsonFormatter().format(record))
+
+        self.assertIn("ValueError: Bad value", log_line["exception"])
+
+
+if __name__ == "__main__":
+    try:
+        unittest.main()
+    finally:
+        sys.path = original_path
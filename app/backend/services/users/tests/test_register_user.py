@@ -84,6 +84,23 @@ class TestRegisterUser(BaseTestSetup):
                 self.assertEqual(response['statusCode'], 400)
                 self.assertIn(case["expected_validation_message"], body['message'])
 
+    def test_rejected_password_is_not_returned(self):
+        """
+        Test that a password failing validation is not echoed in the response.
+        """
+        event = {
+            "body": json.dumps({
+                "email": "test1@mail.com",
+                "password": "secre",
+                "username": "UserName"
+            })
+        }
+
+        response = lambda_handler(event, {})
+
+        self.assertEqual(response['statusCode'], 400)
+        self.assertNotIn("secre", response['body'])
+
     def test_when_username_already_taken(self):
         """
         Test response when username is already taken.
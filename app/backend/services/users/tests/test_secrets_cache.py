@@ -0,0 +1,175 @@
+import json
+import sys
+import os
+import unittest
+from unittest.mock import patch
+from base_test_setup import BaseTestSetup
+
+original_path = sys.path.copy()
+BaseTestSetup.setup_paths('login')
+
+import jwt
+from boto3 import client
+from moto import mock_aws
+import boto
+import auth
+from boto import (
+    clear_secrets_cache,
+    get_secrets_cache_stats,
+    get_secrets_from_aws_secrets_manager,
+    refresh_secrets_from_aws_secrets_manager,
+)
+
+
+class RunInline:
+    """
+    Stand-in for threading.Thread that runs the target when started.
+    """
+
+    def __init__(self, target, args=(), daemon=None):
+        self.target = target
+        self.args = args
+
+    def start(self):
+        self.target(*self.args)
+
+
+@mock_aws
+class TestSecretsCache(unittest.TestCase):
+    def setUp(self):
+        self.secret_name = "rotating_secret"
+        self.region = "eu-central-1"
+        self.secrets_manager = client("secretsmanager", region_name=self.region)
+        self.secrets_manager.create_secret(
+            Name=self.secret_name,
+            SecretString=json.dumps({"jwt_secret": "old", "refresh_secret": "old-refresh"}),
+        )
+
+        clear_secrets_cache()
+        self.start_stats = get_secrets_cache_stats()
+        self.now = boto.time.monotonic()
+
+    def tearDown(self):
+        clear_secrets_cache()
+
+    def rotate(self, jwt_secret):
+        self.secrets_manager.put_secret_value(
+            SecretId=self.secret_name,
+            SecretString=json.dumps({"jwt_secret": jwt_secret, "refresh_secret": "new-refresh"}),
+        )
+
+    def stat(self, name):
+        return get_secrets_cache_stats()[name] - self.start_stats[name]
+
+    def at(self, seconds_later):
+        return patch('boto.time.monotonic', return_value=self.now + seconds_later)
+
+    def secret_env(self):
+        return patch.dict(
+            os.environ,
+            {"JWT_SECRET_NAME": self.secret_name, "SECRETS_REGION_NAME": self.region},
+        )
+
+    def get_secret(self):
+        return get_secrets_from_aws_secrets_manager(self.secret_name, self.region)
+
+
+    def test_hit_within_ttl_and_miss_after_expiry(self):
+        with self.at(0):
+            self.assertEqual(self.get_secret()["jwt_secret"], "old")
+
+        self.rotate("new")
+
+        with self.at(1):
+            self.assertEqual(self.get_secret()["jwt_secret"], "old")
+
+        self.assertEqual(self.stat("misses"), 1)
+        self.assertEqual(self.stat("hits"), 1)
+
+        with self.at(boto.SECRETS_CACHE_TTL_SECONDS + 1):
+            self.assertEqual(self.get_secret()["jwt_secret"], "new")
+
+        self.assertEqual(self.stat("misses"), 2)
+
+
+    def test_refresh_ahead_serves_cached_value_and_reloads(self):
+        with self.at(0):
+            self.get_secret()
+
+        self.rotate("new")
+
+        refresh_at = boto.SECRETS_CACHE_TTL_SECONDS - boto.SECRETS_CACHE_REFRESH_AHEAD_SECONDS + 1
+        with self.at(refresh_at), patch('boto.threading.Thread', RunInline):
+            # The request that triggers the refresh still gets the cached value
+            self.assertEqual(self.get_secret()["jwt_secret"], "old")
+
+        self.assertEqual(self.stat("refreshes"), 1)
+
+        with self.at(refresh_at + 1):
+            self.assertEqual(self.get_secret()["jwt_secret"], "new")
+
+        self.assertEqual(self.stat("misses"), 1)
+
+
+    def test_failed_refresh_serves_stale_value(self):
+        with self.at(0):
+            self.get_secret()
+
+        later = boto.SECRETS_CACHE_MIN_REFRESH_SECONDS + 1
+        with self.at(later), patch('boto._fetch_secret', return_value=None):
+            secret = refresh_secrets_from_aws_secrets_manager(self.secret_name, self.region)
+
+        self.assertEqual(secret["jwt_secret"], "old")
+        self.assertEqual(self.stat("errors"), 1)
+
+
+    def test_refresh_is_rate_limited(self):
+        with self.at(0):
+            self.get_secret()
+
+        self.rotate("new")
+
+        with self.at(1):
+            secret = refresh_secrets_from_aws_secrets_manager(self.secret_name, self.region)
+
+        self.assertEqual(secret["jwt_secret"], "old")
+        self.assertEqual(self.stat("refreshes"), 0)
+
+
+    def test_decode_token_retries_with_refreshed_secret(self):
+        with self.at(0), self.secret_env():
+            self.get_secret()
+
+        self.rotate("new")
+        token = jwt.encode({"email": "test@mail.com"}, "new", algorithm="HS256")
+
+        later = boto.SECRETS_CACHE_MIN_REFRESH_SECONDS + 1
+        with self.at(later), self.secret_env():
+            claims = auth.decode_token(token, "jwt_secret")
+
+        self.assertEqual(claims["email"], "test@mail.com")
+        self.assertEqual(self.stat("refreshes"), 1)
+
+
+    def test_decode_token_falls_back_to_previous_secret(self):
+        # The token was signed before the rotation the cache already knows about
+        token = jwt.encode({"email": "test@mail.com"}, "old", algorithm="HS256")
+        self.rotate("new")
+
+        with self.at(0), self.secret_env():
+            claims = auth.decode_token(token, "jwt_secret")
+
+        self.assertEqual(claims["email"], "test@mail.com")
+
+        # A token signed with neither version is still rejected
+        forged = jwt.encode({"email": "test@mail.com"}, "forged", algorithm="HS256")
+        with self.at(1), self.secret_env():
+            with self.assertRaises(jwt.InvalidSignatureError):
+                auth.decode_token(forged, "jwt_secret")
+
+
+if __name__ == "__main__":
+    try:
+        unittest.main()
+    finally:
+        sys.path = original_path
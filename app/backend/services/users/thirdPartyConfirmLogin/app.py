@@ -1,11 +1,10 @@
 import os
 import requests
-import logging
+from log import get_logger, log_event, start_request
 
 from os import environ
 
-logger = logging.getLogger("ConfirmThirdPartyLogin")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("ConfirmThirdPartyLogin")
 
 from constants import (
     GOOGLE_TOKEN_URL,
@@ -22,14 +21,17 @@ from auth import generate_jwt_token, generate_refresh_token
 
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    start_request(context)
+    log_event(logger, event)
 
     query_params = event.get("queryStringParameters", {})
     code = query_params.get("code")
     state = query_params.get("state")
     service, platform = state.split("_")
 
-    logger.info(f"Checking if code and state parameters are present: {code}, {state}")
+    logger.info(
+        "Checking if code and state parameters are present: %s, %s", code, state
+    )
 
     if not code or not state:
         return build_response(400, {"message": "Missing code or state parameter"})
@@ -43,7 +45,7 @@ def lambda_handler(event, context):
         os.getenv("THIRD_PARTY_CLIENTS_SECRET_NAME"), os.getenv("SECRETS_REGION_NAME")
     )
 
-    logger.debug(f"Determining URLs and parameters based on state: {state}")
+    logger.debug("Determining URLs and parameters based on state: %s", state)
     token_url = user_info_url = None
     client_id_key = client_secret_key = None
     headers = {"Accept": "application/json"}
@@ -54,7 +56,7 @@ def lambda_handler(event, context):
         client_id_key = secrets["google_client_id"]
         client_secret_key = secrets["google_client_secret"]
     else:
-        logger.error(f"Unsupported state parameter {service}")
+        logger.error("Unsupported state parameter %s", service)
         return build_response(400, {"message": "Unsupported state parameter"})
 
     logger.info("Requesting access token from third party service")
@@ -123,13 +125,13 @@ def lambda_handler(event, context):
 
 
 def check_if_user_exists(dynamodb, email):
-    logger.info(f"Checking if user with email {email} exists")
+    logger.info("Checking if user with email %s exists", email)
     response = dynamodb.table.get_item(Key={"email": email})
 
     return response.get("Item")
 
 
 def add_user_to_the_table(dynamodb, user_item):
-    logger.info(f"Adding user {user_item} to the table.")
+    logger.info("Adding user %s to the table.", user_item)
 
     dynamodb.table.put_item(Item=user_item)
@@ -1,8 +1,7 @@
 import os
-import logging
+from log import get_logger, log_event, start_request
 
-logger = logging.getLogger("RequestThirdPartyLogin")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("RequestThirdPartyLogin")
 
 from constants import (
     GOOGLE_AUTHENTICATION_URL,
@@ -16,14 +15,17 @@ from boto import get_secrets_from_aws_secrets_manager
 
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    start_request(context)
+    log_event(logger, event)
     type_of_service = (
         event.get("queryStringParameters", {}).get("type_of_service").lower()
     )
     platform = event.get("queryStringParameters", {}).get("platform").lower()
 
     logger.info(
-        f"Checking if the service type is valid: {type_of_service} and if the platform is valid: {platform}"
+        "Checking if the service type is valid: %s and if the platform is valid: %s",
+        type_of_service,
+        platform,
     )
     if (
         type_of_service not in VALID_SERVICE_TYPES
@@ -36,7 +38,7 @@ def lambda_handler(event, context):
         os.getenv("THIRD_PARTY_CLIENTS_SECRET_NAME"), os.getenv("SECRETS_REGION_NAME")
     )
 
-    logger.info(f"Constructing authorization URL for {type_of_service}")
+    logger.info("Constructing authorization URL for %s", type_of_service)
     try:
         redirect_uri = secrets["callback_uri"]
 
@@ -46,7 +48,7 @@ def lambda_handler(event, context):
                 f"&response_type=code&scope={GOOGLE_SCOPE}&state={type_of_service}_{platform}"
             )
     except Exception as e:
-        logger.error(f"Failed to construct authorization URL: {str(e)}")
+        logger.error("Failed to construct authorization URL: %s", str(e))
         return build_response(
             500, {"message": f"Failed to construct authorization URL: {str(e)}"}
         )
@@ -1,9 +1,9 @@
 import json
-import logging
+from log import get_logger, log_event
 
 from validation_schema import schema
 from dataclasses import dataclass
-from aws_lambda_powertools.utilities.validation import SchemaValidationError, validate
+from validation import SchemaValidationError, validate
 from common import build_response
 from boto import (
     LambdaDynamoDBClass,
@@ -11,14 +11,14 @@ from boto import (
     _LAMBDA_LANGUAGES_TABLE_RESOURCE,
 )
 from middleware import middleware
+from languages import get_language
 from boto3.dynamodb.conditions import Key
-from auth import get_email_from_jwt_token
+from auth import get_email_from_event
 from typing import Optional
 from datetime import datetime, timezone, timedelta
 
 
-logger = logging.getLogger("UpdateUserInfo")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("UpdateUserInfo")
 
 
 @dataclass
@@ -36,13 +36,13 @@ class Request:
 
 @middleware
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    log_event(logger, event)
 
-    jwt_token = event.get("headers").get("x-access-token")
-    email = get_email_from_jwt_token(jwt_token)
+    # Get the user email from the auth context attached by the middleware
+    email = get_email_from_event(event)
 
     if not email:
-        logger.error(f"Invalid email in jwt token {email}")
+        logger.error("Invalid email in jwt token %s", email)
         return build_response(401, {"message": "Invalid email in jwt token"})
 
     body = event.get("body")
@@ -52,11 +52,11 @@ def lambda_handler(event, context):
         request_body = event
 
     try:
-        logger.debug(f"Validating request {request_body}")
+        logger.debug("Validating request %s", request_body)
         validate(event=request_body, schema=schema)
     except SchemaValidationError as e:
-        logger.error(f"Validation failed: {e}")
-        return build_response(400, {"message": str(e)})
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
 
     logger.info("Parsing request body")
     request = Request(**request_body)
@@ -68,16 +68,16 @@ def lambda_handler(event, context):
 
     user = get_user_by_email(dynamodb, email)
     if not user:
-        logger.debug(f"User with email {email} does not exist")
+        logger.debug("User with email %s does not exist", email)
         return build_response(404, {"message": "User not found."})
 
     if request.chosen_language:
-        language = get_language_by_id(languagesTable, request.chosen_language)
+        language = get_language(languagesTable, request.chosen_language)
         if not language:
-            logger.error(f"Language with id {request.chosen_language} not found")
+            logger.error("Language with id %s not found", request.chosen_language)
             return build_response(404, {"message": "Language not found"})
 
-    logger.debug(f"User with email {email} exists, proceeding with update")
+    logger.debug("User with email %s exists, proceeding with update", email)
 
     return update_user(dynamodb, email, request)
 
@@ -95,7 +95,7 @@ def update_user(dynamodb, email, request):
     Returns:
         HTTP response indicating success or that no changes were made
     """
-    logger.info(f"Updating user {email} with settings {request}")
+    logger.info("Updating user %s with settings %s", email, request)
 
     update_parts = []
     expression_attribute_values = {}
@@ -147,7 +147,7 @@ def update_user(dynamodb, email, request):
     if update_parts:
         update_expression = "SET " + ", ".join(update_parts)
         logger.debug(
-            f"Updating user {email} with settings {expression_attribute_values}"
+            "Updating user %s with settings %s", email, expression_attribute_values
         )
 
         dynamodb.table.update_item(
@@ -162,24 +162,15 @@ def update_user(dynamodb, email, request):
     return build_response(200, {"message": "No changes were made"})
 
 
-def get_language_by_id(dynamodb, id: str):
-    logger.info(f"Getting language by id {id}")
-    language = dynamodb.table.get_item(Key={"id": id})
-
-    language_item = language.get("Item", {})
-
-    return language_item
-
-
 def get_user_by_email(dynamodb, email):
-    logger.info(f"Getting user by email {email}")
+    logger.info("Getting user by email %s", email)
     user = dynamodb.table.get_item(Key={"email": email})
 
     return user.get("Item")
 
 
 def get_user_by_username(dynamodb, username):
-    logger.info(f"Getting user by username: {username}")
+    logger.info("Getting user by username: %s", username)
     response = dynamodb.table.query(
         IndexName="username-index", KeyConditionExpression=Key("username").eq(username)
     )
@@ -1,15 +1,14 @@
 import json
-import logging
+from log import get_logger, log_event, start_request
 from datetime import datetime, timezone
 
 from validation_schema import schema
 from dataclasses import dataclass
-from aws_lambda_powertools.utilities.validation import SchemaValidationError, validate
+from validation import SchemaValidationError, validate
 from common import build_response
 from boto import LambdaDynamoDBClass, _LAMBDA_USERS_TABLE_RESOURCE
 
-logger = logging.getLogger("ValidateResetCode")
-logger.setLevel(logging.DEBUG)
+logger = get_logger("ValidateResetCode")
 
 
 @dataclass
@@ -19,7 +18,8 @@ class Request:
 
 
 def lambda_handler(event, context):
-    logger.debug(f"Received event {event}")
+    start_request(context)
+    log_event(logger, event)
 
     body = event.get("body")
     if body is not None:
@@ -28,11 +28,11 @@ def lambda_handler(event, context):
         request_body = event
 
     try:
-        logger.debug(f"Validating request {request_body}")
+        logger.debug("Validating request %s", request_body)
         validate(event=request_body, schema=schema)
     except SchemaValidationError as e:
-        logger.error(f"Validation failed: {e}")
-        return build_response(400, {"message": str(e)})
+        logger.error("Validation failed: %s", e)
+        return build_response(400, e.to_dict())
 
     logger.info("Parsing request body")
     request = Request(**request_body)
@@ -47,48 +47,48 @@ def validate_reset_code(dynamodb, email, code):
     user = fetch_user(dynamodb, email)
 
     if not user:
-        logger.debug(f"User with email {email} does not exist")
+        logger.debug("User with email %s does not exist", email)
         return build_response(400, {"message": "User does not exist."})
 
     try:
-        logger.info(f"Verifying reset code for user {email}")
+        logger.info("Verifying reset code for user %s", email)
         saved_code = user.get("reset_code")
         saved_expiration_time = user.get("code_expiration_time")
 
         if not saved_code or not saved_expiration_time:
-            logger.debug(f"No reset code found for user {email}")
+            logger.debug("No reset code found for user %s", email)
             return build_response(400, {"message": "No reset code found."})
 
         code_valid, error_message = verify_reset_code(email, code, saved_code, saved_expiration_time)
 
         if not code_valid:
-            logger.debug(f"Reset code is invalid for user {email}: {error_message}")
+            logger.debug("Reset code is invalid for user %s: %s", email, error_message)
             return build_response(400, {"message": error_message})
 
         return build_response(200, {"message": "Reset code is valid."})
     except Exception as e:
-        logger.error(f"Error verifying reset code: {e}")
+        logger.error("Error verifying reset code: %s", e)
         return build_response(500, {"message": "Internal server error."})
 
 
 def fetch_user(dynamodb, email):
-    logger.info(f"Getting user by email {email}")
+    logger.info("Getting user by email %s", email)
     user = dynamodb.table.get_item(Key={"email": email})
 
     return user.get("Item")
 
 
 def verify_reset_code(email, code, saved_code, expiration_time):
-    logger.info(f"Verifying reset code for user {email}")
+    logger.info("Verifying reset code for user %s", email)
 
     if code != saved_code:
-        logger.debug(f"Reset code does not match for user {email}")
+        logger.debug("Reset code does not match for user %s", email)
         return False, "Invalid reset code"
 
     current_time = int(datetime.now(timezone.utc).timestamp())
     if current_time > expiration_time:
-        logger.debug(f"Reset code has expired for user {email}")
+        logger.debug("Reset code has expired for user %s", email)
         return False, "Reset code has expired"
 
-    logger.info(f"Reset code matches for user {email}")
+    logger.info("Reset code matches for user %s", email)
     return True, None
@@ -73,7 +73,7 @@ export interface UserData {
   task_level?: number;
   phone_number?: string | null; // Corrected from phone_numer
   letters_learned?: Record<string, string[]>; // Changed to map languages to arrays of letters
-  items_inventory?: string[]; // Array of UUIDs
+  items_inventory?: Record<string, number>; // Item ID → quantity
   // User preferences
   sound_effects?: boolean;
   haptic_feedback?: boolean;